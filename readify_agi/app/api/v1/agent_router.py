@@ -3,28 +3,50 @@ import json
 import logging
 import urllib.parse
 from contextlib import suppress
-from typing import Any, Dict
+from typing import AsyncIterator
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 
+from app.core.admission import AdmissionRejected, AdmissionTicket, get_admission_controller
+from app.core.config import settings
+from app.core.tracing import RequestTrace, trace_span, use_trace
 from app.core.user_context import UserContext, get_user_context
-from app.repositories.conversation_repository import ConversationRepository
+from app.repositories.assistant_thinking_repository import AssistantThinkingRepository
+from app.repositories.project_repository import ProjectRepository
 from app.services.ask_agent_service import AskAgentService
 from app.services.coordinator_agent_service import CoordinatorAgentService
 from app.services.note_agent_service import NoteAgentService
+from app.utils.sse_writer import SSEWriter
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-async def get_coordinator_service(
+async def get_admission_ticket(
     project_id: int = Query(..., description="工程ID"),
-    task_type: str = Query(..., description="任务类型"),
-    context: str = Query("{}", description="其他信息"),
     user_ctx: UserContext = Depends(get_user_context),
+) -> AsyncIterator[AdmissionTicket]:
+    """Apply admission control; rejected requests get 429 and the ticket is released once the request ends."""
+    user_key = str(user_ctx.user_id) if user_ctx.user_id is not None else f"project:{project_id}"
+    try:
+        ticket = get_admission_controller().enqueue(user_key, str(project_id))
+    except AdmissionRejected as e:
+        logger.warning("Reject /agent/stream: project_id=%s, user=%s, reason=%s", project_id, user_key, e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+
+async def build_coordinator_service(
+    project_id: int,
+    task_type: str,
+    context: str,
+    user_ctx: UserContext,
 ) -> CoordinatorAgentService:
-    """Build the coordinator agent with the allowed specialized agents."""
+    """Build the coordinator agent with the allowed specialized agents; called only after admission is granted."""
     try:
         decoded_context = urllib.parse.unquote(context)
         context_dict = json.loads(decoded_context) if decoded_context else {}
@@ -59,70 +81,141 @@ async def get_coordinator_service(
     else:
         logger.info("Skip NOTE_AGENT registration because mind_map_id is missing")
 
-    await coordinator.initialize()
+    # 请求追踪从提示词加载开始，流式生成时沿用同一个 request_id
+    coordinator.request_trace = RequestTrace()
+    try:
+        with use_trace(coordinator.request_trace), trace_span("initialize", "prompt"):
+            await coordinator.initialize()
+    except BaseException:
+        await coordinator.aclose()
+        raise
     return coordinator
 
 
 @router.get("/stream")
 async def stream_response(
+    request: Request,
     query: str = Query(..., description="用户查询"),
     project_id: int = Query(..., description="工程ID"),
+    task_type: str = Query(..., description="任务类型"),
     context: str = Query("{}", description="其他信息"),
-    coordinator_service: CoordinatorAgentService = Depends(get_coordinator_service),
+    user_ctx: UserContext = Depends(get_user_context),
+    ticket: AdmissionTicket = Depends(get_admission_ticket),
 ):
-    """Stream agent events to the frontend."""
+    """Stream agent events to the frontend; agents are built only after the request leaves the admission queue."""
+    compress = settings.SSE_GZIP_ENABLED and "gzip" in request.headers.get("accept-encoding", "")
+    writer = SSEWriter(
+        flush_interval=settings.SSE_FLUSH_INTERVAL_MS / 1000,
+        max_coalesce_chars=settings.SSE_COALESCE_MAX_CHARS,
+        compress=compress,
+    )
 
     async def event_generator():
         agent_task = None
-        conversation_repo = ConversationRepository()
+        coordinator_service = None
         try:
             try:
-                trimmed_count = await conversation_repo.trim_context_messages(project_id)
-                if trimmed_count > 0:
-                    yield f"data: {json.dumps({'type': 'system', 'project_id': project_id, 'content': f'已修剪 {trimmed_count} 条历史消息'})}\n\n"
-            except Exception as exc:
-                yield f"data: {json.dumps({'type': 'system', 'project_id': project_id, 'content': f'修剪历史消息时出错: {str(exc)}'})}\n\n"
-            finally:
-                await conversation_repo.close()
-
-            event_queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+                async for position in get_admission_controller().wait(ticket):
+                    yield writer.encode({'type': 'queue', 'project_id': project_id, 'position': position,
+                                         'content': f'排队中，前方还有 {position - 1} 个请求'})
+            except AdmissionRejected as e:
+                yield writer.encode({'type': 'system', 'project_id': project_id, 'content': str(e),
+                                     'retry_after': e.retry_after})
+                yield writer.encode({'type': '[DONE]', 'project_id': project_id})
+                yield writer.finish()
+                return
 
-            async def callback(data: Dict[str, Any]):
-                await event_queue.put(data)
+            try:
+                coordinator_service = await build_coordinator_service(project_id, task_type, context, user_ctx)
+            except Exception as e:
+                logger.exception("Failed to build coordinator: project_id=%s, task_type=%s", project_id, task_type)
+                yield writer.encode({'type': 'system', 'project_id': project_id, 'content': f'智能体初始化失败: {str(e)}'})
+                yield writer.encode({'type': '[DONE]', 'project_id': project_id})
+                yield writer.finish()
+                return
 
             agent_task = asyncio.create_task(
                 coordinator_service.generate_stream_response(
                     query=query,
-                    callback=callback,
+                    callback=writer.send,
                 )
             )
+            # 智能体任务结束即放入完成哨兵，写出端无需轮询
+            agent_task.add_done_callback(lambda _task: writer.close())
 
-            while True:
-                try:
-                    data = await asyncio.wait_for(event_queue.get(), timeout=0.1)
-                    yield f"data: {json.dumps(data)}\n\n"
-                    event_queue.task_done()
-                except asyncio.TimeoutError:
-                    if agent_task.done() and event_queue.empty():
-                        break
-                except Exception as exc:
-                    yield f"data: {json.dumps({'type': 'system', 'project_id': project_id, 'content': f'流式输出错误: {str(exc)}'})}\n\n"
-                    break
-
-            yield f"data: {json.dumps({'type': '[DONE]', 'project_id': project_id})}\n\n"
+            async for frame in writer.frames():
+                yield frame
+
+            if not agent_task.cancelled() and agent_task.exception() is not None:
+                exc = agent_task.exception()
+                yield writer.encode({'type': 'system', 'project_id': project_id, 'content': f'流式输出错误: {str(exc)}'})
+
+            yield writer.encode({'type': '[DONE]', 'project_id': project_id})
+            yield writer.finish()
         finally:
             if agent_task is not None and not agent_task.done():
                 agent_task.cancel()
                 with suppress(asyncio.CancelledError):
                     await agent_task
-            await coordinator_service.aclose()
+            ticket.release()
+            if coordinator_service is not None:
+                await coordinator_service.aclose()
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
 
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
+        headers=headers,
     )
+
+
+async def _ensure_project_access(project_id: int, user_ctx: UserContext) -> None:
+    """Only the project owner or an admin may read data of a project."""
+    if not user_ctx.is_authenticated:
+        raise HTTPException(status_code=401, detail="缺少用户信息")
+    repo = ProjectRepository()
+    try:
+        project = await repo.get_project_by_id(project_id)
+    finally:
+        await repo.close()
+    if project is None or (not user_ctx.is_admin and project.user_id != user_ctx.user_id):
+        raise HTTPException(status_code=404, detail="工程不存在")
+
+
+@router.get("/thinking/{thinking_id}/trace")
+async def get_thinking_trace(
+    thinking_id: int,
+    project_id: int = Query(..., description="工程ID"),
+    offset: int = Query(0, ge=0, description="起始字符位置"),
+    limit: int = Query(settings.THINKING_TRACE_PAGE_MAX_CHARS, ge=1, le=settings.THINKING_TRACE_PAGE_MAX_CHARS,
+                       description="返回的最大字符数"),
+    user_ctx: UserContext = Depends(get_user_context),
+):
+    """Return one page of the full, decompressed thinking trace of an assistant reply."""
+    await _ensure_project_access(project_id, user_ctx)
+
+    repo = AssistantThinkingRepository()
+    try:
+        trace = await repo.get_full_trace(thinking_id, project_id)
+    finally:
+        await repo.close()
+    if trace is None:
+        raise HTTPException(status_code=404, detail="思考过程不存在")
+
+    content = trace["content"]
+    end = offset + limit
+    return {
+        **trace,
+        "content": content[offset:end],
+        "offset": offset,
+        "total_chars": len(content),
+        "next_offset": end if end < len(content) else None,
+    }
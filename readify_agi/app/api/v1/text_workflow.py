@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends
 from typing import Dict, Any, List
 from pydantic import BaseModel
 
-from app.services.text_workflow_service import TextWorkflowService
+from app.services.text_workflow_service import TextWorkflowService, get_text_workflow_service
 
 router = APIRouter()
 
@@ -13,7 +13,7 @@ class TextRequest(BaseModel):
 @router.post("/process", response_model=Dict[str, Any])
 async def process_text(
     request: TextRequest,
-    service: TextWorkflowService = Depends(lambda: TextWorkflowService())
+    service: TextWorkflowService = Depends(get_text_workflow_service)
 ) -> Dict[str, Any]:
     """
     处理文本的完整工作流，包括：
@@ -0,0 +1,268 @@
+"""
+请求准入控制 — 限制同时运行的智能体请求数，并按用户公平排队
+
+- 同时运行的请求受全局、每用户、每项目三级上限约束；
+- 超出上限的请求进入等待队列，按用户轮转出队，单个用户的突发请求不会挤占其他用户；
+- 队列已满或单用户排队数超限时立即拒绝，路由据此返回 429 与 Retry-After；
+- 已排队的请求等待 ADMISSION_QUEUE_TIMEOUT 仍未轮到时才被拒绝。是否需要等待取决于实际阻塞它的
+  是全局、每用户还是每项目上限，入队时无法可靠估算，因此不按预计等待时间提前拒绝；
+- 排队期间位置变化时通知等待方，供流式响应向前端报告排队位置。
+
+预计等待时间按最近请求的平均占用时长估算，仅用于 Retry-After。
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+# 尚无历史数据时假定的单个请求占用时长（秒）
+_INITIAL_SERVICE_SECONDS = 20.0
+# 平均占用时长的指数滑动平均系数
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = max(int(retry_after), 1)
+
+
+class AdmissionTicket:
+    """
+    一次请求的准入凭证，请求结束后必须调用 release（可重复调用）
+    """
+
+    def __init__(self, controller: Optional["AdmissionController"], user_key: str, project_key: str):
+        self._controller = controller
+        self.user_key = user_key
+        self.project_key = project_key
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + settings.ADMISSION_QUEUE_TIMEOUT
+        self.started_at: Optional[float] = None
+        self.released = False
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def admitted(self) -> bool:
+        return self.granted.done() and not self.granted.cancelled()
+
+    def release(self) -> None:
+        """释放占用的并发名额或退出等待队列"""
+        if self.released:
+            return
+        self.released = True
+        if self._controller is not None:
+            self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    全局 / 每用户 / 每项目并发上限与按用户轮转的公平等待队列
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        max_per_project: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_per_user: Optional[int] = None
+    ):
+        self.max_concurrent = max(max_concurrent or settings.ADMISSION_MAX_CONCURRENT, 1)
+        self.max_per_user = max(max_per_user or settings.ADMISSION_MAX_CONCURRENT_PER_USER, 1)
+        self.max_per_project = max(max_per_project or settings.ADMISSION_MAX_CONCURRENT_PER_PROJECT, 1)
+        self.max_queue = settings.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.max_queue_per_user = settings.ADMISSION_MAX_QUEUE_PER_USER if max_queue_per_user is None else max_queue_per_user
+
+        self._running = 0
+        self._running_by_user: Dict[str, int] = {}
+        self._running_by_project: Dict[str, int] = {}
+        # 用户 -> 排队中的凭证；出队后该用户移到末尾，实现按用户轮转
+        self._queues: "OrderedDict[str, Deque[AdmissionTicket]]" = OrderedDict()
+        self._waiting = 0
+        self._changed = asyncio.Event()
+        self._service_seconds = _INITIAL_SERVICE_SECONDS
+        self._admitted_total = 0
+        self._rejected_total = 0
+
+    def _can_run(self, ticket: AdmissionTicket) -> bool:
+        return (
+            self._running < self.max_concurrent
+            and self._running_by_user.get(ticket.user_key, 0) < self.max_per_user
+            and self._running_by_project.get(ticket.project_key, 0) < self.max_per_project
+        )
+
+    def _grant(self, ticket: AdmissionTicket) -> None:
+        self._running += 1
+        self._running_by_user[ticket.user_key] = self._running_by_user.get(ticket.user_key, 0) + 1
+        self._running_by_project[ticket.project_key] = self._running_by_project.get(ticket.project_key, 0) + 1
+        self._admitted_total += 1
+        ticket.started_at = time.monotonic()
+        ticket.granted.set_result(True)
+
+    def _dispatch_order(self) -> Iterator[AdmissionTicket]:
+        """按用户轮转的出队顺序遍历排队中的请求"""
+        queues = list(self._queues.values())
+        depth = max((len(queue) for queue in queues), default=0)
+        for index in range(depth):
+            for queue in queues:
+                if index < len(queue):
+                    yield queue[index]
+
+    def _remove_waiting(self, ticket: AdmissionTicket) -> None:
+        queue = self._queues.get(ticket.user_key)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[ticket.user_key]
+
+    def _dispatch(self) -> None:
+        """有空闲名额时按轮转顺序放行满足每用户、每项目上限的请求"""
+        changed = False
+        while self._waiting and self._running < self.max_concurrent:
+            ticket = next((candidate for candidate in self._dispatch_order() if self._can_run(candidate)), None)
+            if ticket is None:
+                break
+            self._remove_waiting(ticket)
+            if ticket.user_key in self._queues:
+                self._queues.move_to_end(ticket.user_key)
+            self._grant(ticket)
+            changed = True
+        if changed:
+            self._notify()
+
+    def _notify(self) -> None:
+        """唤醒所有等待方重新计算排队位置"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        if ticket.admitted:
+            self._running -= 1
+            for counter, key in ((self._running_by_user, ticket.user_key), (self._running_by_project, ticket.project_key)):
+                counter[key] -= 1
+                if counter[key] <= 0:
+                    del counter[key]
+            duration = time.monotonic() - (ticket.started_at or ticket.enqueued_at)
+            self._service_seconds += _SERVICE_TIME_ALPHA * (duration - self._service_seconds)
+        else:
+            if not ticket.granted.done():
+                ticket.granted.cancel()
+            self._remove_waiting(ticket)
+            self._notify()
+        self._dispatch()
+
+    def _estimate_wait(self, position: int) -> float:
+        """按平均占用时长估算排在第 position 位的请求还需等待的秒数"""
+        return math.ceil(position / self.max_concurrent) * self._service_seconds
+
+    def position(self, ticket: AdmissionTicket) -> int:
+        """请求在出队顺序中的位置（从 1 开始），已准入时为 0"""
+        if ticket.admitted:
+            return 0
+        for index, candidate in enumerate(self._dispatch_order(), 1):
+            if candidate is ticket:
+                return index
+        return 0
+
+    def enqueue(self, user_key: str, project_key: str) -> AdmissionTicket:
+        """
+        申请准入：有名额时立即准入，否则进入等待队列
+
+        Args:
+            user_key: 公平排队使用的用户标识
+            project_key: 项目标识
+
+        Returns:
+            AdmissionTicket: 准入凭证
+
+        Raises:
+            AdmissionRejected: 队列已满或单用户排队数超限
+        """
+        ticket = AdmissionTicket(self, user_key, project_key)
+        if not self._waiting and self._can_run(ticket):
+            self._grant(ticket)
+            return ticket
+
+        user_waiting = len(self._queues.get(user_key, ()))
+        if self._waiting >= self.max_queue or user_waiting >= self.max_queue_per_user:
+            self._rejected_total += 1
+            raise AdmissionRejected("当前排队请求过多，请稍后重试", retry_after=self._estimate_wait(self._waiting + 1))
+
+        self._queues.setdefault(user_key, deque()).append(ticket)
+        self._waiting += 1
+        self._dispatch()
+        return ticket
+
+    async def wait(self, ticket: AdmissionTicket) -> AsyncIterator[int]:
+        """
+        等待准入，排队位置变化时产出新位置；超过截止时间仍未准入时退出队列并抛出 AdmissionRejected
+
+        Args:
+            ticket: 准入凭证
+
+        Yields:
+            int: 当前排队位置
+        """
+        last_position = None
+        while not ticket.admitted:
+            position = self.position(ticket)
+            if position != last_position:
+                last_position = position
+                yield position
+
+            remaining = ticket.deadline - time.monotonic()
+            if remaining <= 0:
+                self._rejected_total += 1
+                ticket.release()
+                raise AdmissionRejected("排队等待超时，请稍后重试", retry_after=self._estimate_wait(position))
+
+            changed = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait({ticket.granted, changed}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+
+    def stats(self) -> Dict[str, object]:
+        """准入统计"""
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrent": self.max_concurrent,
+            "avg_service_seconds": round(self._service_seconds, 1),
+            "admitted_total": self._admitted_total,
+            "rejected_total": self._rejected_total,
+        }
+
+
+class _UnlimitedController:
+    """准入控制关闭时使用：直接放行所有请求"""
+
+    def enqueue(self, user_key: str, project_key: str) -> AdmissionTicket:
+        ticket = AdmissionTicket(None, user_key, project_key)
+        ticket.granted.set_result(True)
+        return ticket
+
+    async def wait(self, ticket: AdmissionTicket) -> AsyncIterator[int]:
+        return
+        yield
+
+    def stats(self) -> Dict[str, object]:
+        return {"enabled": False}
+
+
+_controller = None
+
+
+def get_admission_controller():
+    """获取全局单例准入控制器"""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController() if settings.ADMISSION_ENABLED else _UnlimitedController()
+    return _controller
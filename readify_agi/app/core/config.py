@@ -124,15 +124,127 @@ class Settings(BaseSettings):
     TENCENT_SECRET_KEY: str = os.getenv("TENCENT_SECRET_KEY", "")
     TENCENT_OCR_REGION: str = os.getenv("TENCENT_OCR_REGION", "ap-guangzhou")
 
+    # Document chunk labeling: llm, extractive (local TF-IDF keywords) or hybrid
+    # (extractive, with the LLM only for chunks below LABEL_HYBRID_MIN_CONFIDENCE)
+    LABEL_MODE: str = os.getenv("LABEL_MODE", "llm")
+    LABEL_EXTRACTIVE_KEYWORDS: int = int(os.getenv("LABEL_EXTRACTIVE_KEYWORDS", "3"))
+    LABEL_HYBRID_MIN_CONFIDENCE: float = float(os.getenv("LABEL_HYBRID_MIN_CONFIDENCE", "0.3"))
+    # Number of document chunks repaired concurrently by the repair pipeline
+    REPAIR_CONCURRENCY: int = int(os.getenv("REPAIR_CONCURRENCY", "4"))
+    # Rule-based pre-screen: chunks without detected defects skip the LLM repair workflow
+    REPAIR_PRESCREEN_ENABLED: bool = os.getenv("REPAIR_PRESCREEN_ENABLED", "true").lower() == "true"
+    REPAIR_PRESCREEN_COLUMN_MIN_LINES: int = int(os.getenv("REPAIR_PRESCREEN_COLUMN_MIN_LINES", "3"))
+    REPAIR_PARAGRAPH_MIN_CHARS: int = int(os.getenv("REPAIR_PARAGRAPH_MIN_CHARS", "200"))
+
     # LLM settings
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")
     LLM_API_KEY: str = os.getenv("LLM_API_KEY", "")
     LLM_API_BASE: str = os.getenv("LLM_API_BASE", "https://api.openai.com/v1")
     LLM_MODEL_NAME: str = os.getenv("LLM_MODEL_NAME", "gpt-4o")
     LLM_DEFAULT_HEADERS: str = os.getenv("LLM_DEFAULT_HEADERS", "")
+    # Named model profiles chosen by callers, JSON object of profile -> overrides, e.g.
+    # {"label": {"model": "gpt-4o-mini", "timeout": 30, "max_tokens": 64}}
+    # Keys: provider, model, api_base, api_key, timeout, max_tokens, max_retries; missing keys use the LLM_* values.
+    LLM_PROFILES: str = os.getenv("LLM_PROFILES", "")
+
+    # Allow the model to return several tool calls in one turn; they are executed concurrently.
+    LLM_PARALLEL_TOOL_CALLS: bool = os.getenv("LLM_PARALLEL_TOOL_CALLS", "true").lower() == "true"
+    LLM_PROMPT_CACHE_ENABLED: bool = os.getenv("LLM_PROMPT_CACHE_ENABLED", "true").lower() == "true"
+
+    # Per-tool concurrency limits, JSON object of tool name -> limit, e.g. {"search_files_tool": 4}
+    TOOL_CONCURRENCY_LIMITS: str = os.getenv("TOOL_CONCURRENCY_LIMITS", "")
+    TOOL_DEFAULT_CONCURRENCY: int = int(os.getenv("TOOL_DEFAULT_CONCURRENCY", "8"))
+
+    # LLM HTTP connection pool settings (shared by all chat models)
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120"))
+    LLM_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+    LLM_HTTP_READ_TIMEOUT: float = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "600"))
+    LLM_HTTP2_ENABLED: bool = os.getenv("LLM_HTTP2_ENABLED", "true").lower() == "true"
+
+    # Hedged / failover LLM requests; hedging is enabled when LLM_FALLBACK_MODEL_NAME is set.
+    # Empty provider / base / key reuse the primary LLM_* values.
+    LLM_FALLBACK_PROVIDER: str = os.getenv("LLM_FALLBACK_PROVIDER", "")
+    LLM_FALLBACK_API_KEY: str = os.getenv("LLM_FALLBACK_API_KEY", "")
+    LLM_FALLBACK_API_BASE: str = os.getenv("LLM_FALLBACK_API_BASE", "")
+    LLM_FALLBACK_MODEL_NAME: str = os.getenv("LLM_FALLBACK_MODEL_NAME", "")
+    # Send the hedge request when the first token has not arrived after this delay; 0 only fails over on errors
+    LLM_HEDGE_DELAY_MS: int = int(os.getenv("LLM_HEDGE_DELAY_MS", "3000"))
+    LLM_BREAKER_WINDOW_SECONDS: float = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60"))
+    LLM_BREAKER_MIN_REQUESTS: int = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "10"))
+    LLM_BREAKER_FAILURE_RATIO: float = float(os.getenv("LLM_BREAKER_FAILURE_RATIO", "0.5"))
+    LLM_BREAKER_SLOW_TTFT_MS: int = int(os.getenv("LLM_BREAKER_SLOW_TTFT_MS", "15000"))
+    LLM_BREAKER_OPEN_SECONDS: float = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+    # /agent/stream admission control settings
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CONCURRENT: int = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+    ADMISSION_MAX_CONCURRENT_PER_USER: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_PER_USER", "2"))
+    ADMISSION_MAX_CONCURRENT_PER_PROJECT: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_PER_PROJECT", "4"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+    ADMISSION_MAX_QUEUE_PER_USER: int = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "5"))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "60"))
+
+    # Request tracing settings
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACING_MAX_SPANS: int = int(os.getenv("TRACING_MAX_SPANS", "500"))
+    TRACING_OTEL_ENABLED: bool = os.getenv("TRACING_OTEL_ENABLED", "false").lower() == "true"
+    TRACING_DEBUG_EVENT_ENABLED: bool = os.getenv("TRACING_DEBUG_EVENT_ENABLED", "false").lower() == "true"
+
+    # Coordinator delegation settings
+    DELEGATION_MAX_CONCURRENCY: int = int(os.getenv("DELEGATION_MAX_CONCURRENCY", "4"))
+
+    # SSE streaming settings
+    SSE_FLUSH_INTERVAL_MS: int = int(os.getenv("SSE_FLUSH_INTERVAL_MS", "50"))
+    SSE_COALESCE_MAX_CHARS: int = int(os.getenv("SSE_COALESCE_MAX_CHARS", "512"))
+    SSE_GZIP_ENABLED: bool = os.getenv("SSE_GZIP_ENABLED", "false").lower() == "true"
+
+    # Conversation context budget and rolling summary settings
+    CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", "8000"))
+    CONTEXT_MAX_MESSAGES: int = int(os.getenv("CONTEXT_MAX_MESSAGES", "20"))
+    CONVERSATION_SUMMARY_ENABLED: bool = os.getenv("CONVERSATION_SUMMARY_ENABLED", "true").lower() == "true"
+    CONVERSATION_SUMMARY_TRIGGER_TOKENS: int = int(os.getenv("CONVERSATION_SUMMARY_TRIGGER_TOKENS", "6000"))
+    CONVERSATION_SUMMARY_KEEP_RECENT: int = int(os.getenv("CONVERSATION_SUMMARY_KEEP_RECENT", "6"))
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "1024"))
+
+    # Write-behind conversation persistence settings
+    CONVERSATION_PERSIST_BATCH_SIZE: int = int(os.getenv("CONVERSATION_PERSIST_BATCH_SIZE", "20"))
+    CONVERSATION_PERSIST_MAX_RETRIES: int = int(os.getenv("CONVERSATION_PERSIST_MAX_RETRIES", "2"))
+    CONVERSATION_PERSIST_WAIT_TIMEOUT: float = float(os.getenv("CONVERSATION_PERSIST_WAIT_TIMEOUT", "5"))
+    THINKING_TRACE_MAX_CHARS: int = int(os.getenv("THINKING_TRACE_MAX_CHARS", "20000"))
+    THINKING_TRACE_TOOL_DIGEST_CHARS: int = int(os.getenv("THINKING_TRACE_TOOL_DIGEST_CHARS", "500"))
+    THINKING_TRACE_FULL_MAX_BYTES: int = int(os.getenv("THINKING_TRACE_FULL_MAX_BYTES", str(16 * 1024 * 1024)))
+    THINKING_TRACE_PAGE_MAX_CHARS: int = int(os.getenv("THINKING_TRACE_PAGE_MAX_CHARS", "200000"))
+    CONTEXT_TRIM_MAX_MESSAGES: int = int(os.getenv("CONTEXT_TRIM_MAX_MESSAGES", "50"))
+    CONTEXT_TRIM_SLACK: int = int(os.getenv("CONTEXT_TRIM_SLACK", "10"))
+    DOCUMENT_READ_MAX_TOKENS: int = int(os.getenv("DOCUMENT_READ_MAX_TOKENS", "4000"))
+    DOCUMENT_READ_PAGE_SIZE: int = int(os.getenv("DOCUMENT_READ_PAGE_SIZE", "20"))
+    DOCUMENT_NEIGHBOR_MAX_WINDOW: int = int(os.getenv("DOCUMENT_NEIGHBOR_MAX_WINDOW", "5"))
+    DOCUMENT_LOCATE_SNIPPET_CHARS: int = int(os.getenv("DOCUMENT_LOCATE_SNIPPET_CHARS", "60"))
+    MIND_MAP_TREE_CACHE_SIZE: int = int(os.getenv("MIND_MAP_TREE_CACHE_SIZE", "256"))
+    MIND_MAP_OUTLINE_MAX_DEPTH: int = int(os.getenv("MIND_MAP_OUTLINE_MAX_DEPTH", "6"))
+    MIND_MAP_OUTLINE_MAX_CHILDREN: int = int(os.getenv("MIND_MAP_OUTLINE_MAX_CHILDREN", "50"))
+    MIND_MAP_GEN_CONCURRENCY: int = int(os.getenv("MIND_MAP_GEN_CONCURRENCY", "8"))
+    MIND_MAP_GEN_MAP_BATCH_TOKENS: int = int(os.getenv("MIND_MAP_GEN_MAP_BATCH_TOKENS", "3000"))
+    MIND_MAP_GEN_MAX_POINTS: int = int(os.getenv("MIND_MAP_GEN_MAX_POINTS", "5"))
+    MIND_MAP_GEN_REDUCE_WINDOW: int = int(os.getenv("MIND_MAP_GEN_REDUCE_WINDOW", "12"))
+    MIND_MAP_GEN_TOP_FANOUT: int = int(os.getenv("MIND_MAP_GEN_TOP_FANOUT", "10"))
+    TOOL_OUTPUT_MAX_TOKENS: int = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "2000"))
+    TOOL_OUTPUT_TOKEN_CAPS: str = os.getenv("TOOL_OUTPUT_TOKEN_CAPS", "")
 
     # Query rewrite settings
     QUERY_REWRITE_ENABLED: bool = os.getenv("QUERY_REWRITE_ENABLED", "true").lower() == "true"
+    QUERY_REWRITE_SPECULATIVE: bool = os.getenv("QUERY_REWRITE_SPECULATIVE", "true").lower() == "true"
+    QUERY_REWRITE_CACHE_SIZE: int = int(os.getenv("QUERY_REWRITE_CACHE_SIZE", "1024"))
+    QUERY_REWRITE_CACHE_TTL: float = float(os.getenv("QUERY_REWRITE_CACHE_TTL", "1800"))
+    QUERY_REWRITE_MIN_QUERY_CHARS: int = int(os.getenv("QUERY_REWRITE_MIN_QUERY_CHARS", "6"))
+    QUERY_REWRITE_SIMILARITY_THRESHOLD: float = float(os.getenv("QUERY_REWRITE_SIMILARITY_THRESHOLD", "0.85"))
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    ANSWER_CACHE_MAX_ENTRIES_PER_SCOPE: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES_PER_SCOPE", "200"))
+    ANSWER_CACHE_MAX_SCOPES: int = int(os.getenv("ANSWER_CACHE_MAX_SCOPES", "1000"))
 
     # Embedding settings. Default to Tencent Hunyuan's OpenAI-compatible embeddings endpoint.
     EMBEDDING_API_KEY: str = _default_embedding_api_key()
@@ -1,13 +1,96 @@
 import json
 import logging
-from typing import Dict, Optional
+from functools import cached_property, lru_cache
+from typing import Any, Dict, Optional
 
 from langchain_core.language_models import BaseChatModel
 
 from app.core.config import settings
+from app.core.llm_http_pool import get_llm_http_pool
+from app.core.llm_usage import LLMUsageCallbackHandler, get_llm_usage_stats
 
 logger = logging.getLogger(__name__)
 
+_pooled_chat_anthropic_cls = None
+
+_EPHEMERAL_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _mark_last_block(content: Any) -> Any:
+    """Return message content whose last block carries an ephemeral cache_control."""
+    if isinstance(content, str):
+        if not content:
+            return content
+        return [{"type": "text", "text": content, "cache_control": dict(_EPHEMERAL_CACHE_CONTROL)}]
+    if isinstance(content, list) and content and isinstance(content[-1], dict):
+        blocks = list(content)
+        blocks[-1] = {**blocks[-1], "cache_control": dict(_EPHEMERAL_CACHE_CONTROL)}
+        return blocks
+    return content
+
+
+def apply_anthropic_cache_breakpoints(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add prompt caching breakpoints to an Anthropic Messages payload.
+
+    Anthropic caches the prefix in the order tools -> system -> messages, so the
+    last tool, the system prompt and the last message each get a breakpoint
+    (three of the four allowed). Static content is reused across turns, and
+    the growing agent scratchpad is reused across iterations of one turn.
+    """
+    tools = payload.get("tools")
+    if tools and isinstance(tools[-1], dict):
+        payload["tools"] = [*tools[:-1], {**tools[-1], "cache_control": dict(_EPHEMERAL_CACHE_CONTROL)}]
+
+    if payload.get("system"):
+        payload["system"] = _mark_last_block(payload["system"])
+
+    messages = payload.get("messages")
+    if messages:
+        last = dict(messages[-1])
+        last["content"] = _mark_last_block(last.get("content"))
+        payload["messages"] = [*messages[:-1], last]
+    return payload
+
+
+def _get_pooled_chat_anthropic_cls():
+    """
+    Build a ChatAnthropic subclass whose SDK clients use the shared HTTP pool.
+
+    langchain_anthropic does not accept an http client argument, so the cached
+    client properties are overridden instead.
+    """
+    global _pooled_chat_anthropic_cls
+    if _pooled_chat_anthropic_cls is not None:
+        return _pooled_chat_anthropic_cls
+
+    import anthropic
+    from langchain_anthropic import ChatAnthropic
+
+    class PooledChatAnthropic(ChatAnthropic):
+        @cached_property
+        def _client(self) -> anthropic.Client:
+            http_client = get_llm_http_pool().get_client(
+                "anthropic", self.anthropic_api_url or "", proxy=self.anthropic_proxy
+            )
+            return anthropic.Client(**self._client_params, http_client=http_client)
+
+        @cached_property
+        def _async_client(self) -> anthropic.AsyncClient:
+            http_client = get_llm_http_pool().get_async_client(
+                "anthropic", self.anthropic_api_url or "", proxy=self.anthropic_proxy
+            )
+            return anthropic.AsyncClient(**self._client_params, http_client=http_client)
+
+        def _get_request_payload(self, input_, *, stop=None, **kwargs) -> dict:
+            payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+            if settings.LLM_PROMPT_CACHE_ENABLED:
+                payload = apply_anthropic_cache_breakpoints(payload)
+            return payload
+
+    _pooled_chat_anthropic_cls = PooledChatAnthropic
+    return _pooled_chat_anthropic_cls
+
 
 def _normalize_anthropic_base_url(url: str) -> str:
     """Normalize Anthropic base_url to avoid duplicate /v1/messages suffixes."""
@@ -36,74 +119,195 @@ def _parse_default_headers() -> Dict[str, str]:
     return headers
 
 
-def _merge_model_kwargs(kwargs: Dict) -> Dict:
-    """Disable parallel tool calls for OpenAI-compatible providers unless explicitly overridden."""
-    merged = dict(kwargs)
-    model_kwargs = dict(merged.get("model_kwargs") or {})
-    model_kwargs.setdefault("parallel_tool_calls", False)
-    merged["model_kwargs"] = model_kwargs
-    return merged
-
-
 def get_default_headers() -> Dict[str, str]:
     return _parse_default_headers()
 
 
-def create_chat_model(
-    temperature: float = 0.7,
-    max_tokens: Optional[int] = None,
-    **kwargs,
+def _with_usage_callback(kwargs: Dict, model_name: Optional[str] = None) -> Dict:
+    """Attach the usage handler that records cached vs uncached input tokens per call."""
+    merged = dict(kwargs)
+    callbacks = list(merged.get("callbacks") or [])
+    callbacks.append(LLMUsageCallbackHandler(model_name or settings.LLM_MODEL_NAME, get_llm_usage_stats()))
+    merged["callbacks"] = callbacks
+    return merged
+
+
+def _build_provider_model(
+    provider: str,
+    model_name: str,
+    api_key: str,
+    api_base: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    kwargs: Dict,
 ) -> BaseChatModel:
-    """Create a chat model based on the configured provider."""
-    provider = settings.LLM_PROVIDER.lower()
+    """Create a chat model bound to a single provider endpoint."""
+    provider = provider.lower()
     default_headers = _parse_default_headers()
+    kwargs = _with_usage_callback(kwargs, model_name)
 
     if provider == "anthropic":
-        from langchain_anthropic import ChatAnthropic
-
         build_kwargs = {
-            "model": settings.LLM_MODEL_NAME,
-            "api_key": settings.LLM_API_KEY,
+            "model": model_name,
+            "api_key": api_key,
             "temperature": temperature,
             "max_tokens": max_tokens or 4096,
             **kwargs,
         }
-        if settings.LLM_API_BASE and settings.LLM_API_BASE != "https://api.openai.com/v1":
-            normalized_url = _normalize_anthropic_base_url(settings.LLM_API_BASE)
+        if api_base and api_base != "https://api.openai.com/v1":
+            normalized_url = _normalize_anthropic_base_url(api_base)
             build_kwargs["anthropic_api_url"] = normalized_url
             logger.info(
                 "[LLM Factory] Normalized Anthropic base_url: %s -> %s",
-                settings.LLM_API_BASE,
+                api_base,
                 normalized_url,
             )
         if default_headers:
             build_kwargs["default_headers"] = default_headers
 
-        model = ChatAnthropic(**build_kwargs)
-        logger.info("[LLM Factory] Created ChatAnthropic model=%s", settings.LLM_MODEL_NAME)
+        model = _get_pooled_chat_anthropic_cls()(**build_kwargs)
+        logger.info("[LLM Factory] Created ChatAnthropic model=%s", model_name)
         return model
 
     from langchain_openai import ChatOpenAI
 
-    build_kwargs = _merge_model_kwargs(kwargs)
+    build_kwargs = dict(kwargs)
     build_kwargs.update(
         {
-            "model": settings.LLM_MODEL_NAME,
-            "api_key": settings.LLM_API_KEY,
-            "base_url": settings.LLM_API_BASE,
+            "model": model_name,
+            "api_key": api_key,
+            "base_url": api_base,
             "temperature": temperature,
         }
     )
+    # Streamed responses report token usage only when asked; usage stats and trace token fields rely on it
+    build_kwargs.setdefault("stream_usage", True)
     if max_tokens is not None:
         build_kwargs["max_tokens"] = max_tokens
     if default_headers:
         build_kwargs["default_headers"] = default_headers
+    pool = get_llm_http_pool()
+    build_kwargs.setdefault("http_client", pool.get_client("openai", api_base))
+    build_kwargs.setdefault("http_async_client", pool.get_async_client("openai", api_base))
 
     model = ChatOpenAI(**build_kwargs)
     logger.info(
-        "[LLM Factory] Created ChatOpenAI model=%s, base_url=%s, parallel_tool_calls=%s",
-        settings.LLM_MODEL_NAME,
-        settings.LLM_API_BASE,
-        build_kwargs.get("model_kwargs", {}).get("parallel_tool_calls"),
+        "[LLM Factory] Created ChatOpenAI model=%s, base_url=%s",
+        model_name,
+        api_base,
+    )
+    return model
+
+
+_PROFILE_KEYS = {
+    "provider", "model", "api_base", "api_key", "timeout", "max_tokens", "max_retries",
+    "fallback_provider", "fallback_model", "fallback_api_base", "fallback_api_key",
+}
+
+
+@lru_cache(maxsize=4)
+def _parse_profiles(raw: str) -> Dict[str, Dict[str, Any]]:
+    """Parse LLM_PROFILES JSON config: profile name -> endpoint overrides."""
+    raw = raw.strip()
+    if not raw:
+        return {}
+    try:
+        profiles = json.loads(raw)
+    except json.JSONDecodeError as exc:
+        logger.warning("[LLM Factory] Failed to parse LLM_PROFILES: %s", exc)
+        return {}
+
+    if not isinstance(profiles, dict) or not all(isinstance(value, dict) for value in profiles.values()):
+        logger.warning("[LLM Factory] LLM_PROFILES must be a JSON object of objects")
+        return {}
+    unknown = {key for value in profiles.values() for key in value} - _PROFILE_KEYS
+    if unknown:
+        logger.warning("[LLM Factory] Ignoring unknown LLM_PROFILES keys: %s", sorted(unknown))
+    return profiles
+
+
+def get_model_profile(profile: Optional[str]) -> Dict[str, Any]:
+    """
+    Resolve a named model profile against the primary LLM_* settings.
+
+    Keys missing from the profile, and unknown profile names, fall back to the
+    primary endpoint, so callers can always pass their task name. The
+    fallback_* keys override the LLM_FALLBACK_* endpoint used for hedging.
+    """
+    overrides = _parse_profiles(settings.LLM_PROFILES).get(profile or "", {}) if profile else {}
+    return {
+        "provider": overrides.get("provider") or settings.LLM_PROVIDER,
+        "model": overrides.get("model") or settings.LLM_MODEL_NAME,
+        "api_base": overrides.get("api_base") or settings.LLM_API_BASE,
+        "api_key": overrides.get("api_key") or settings.LLM_API_KEY,
+        "timeout": overrides.get("timeout"),
+        "max_tokens": overrides.get("max_tokens"),
+        "max_retries": overrides.get("max_retries"),
+        "fallback_provider": overrides.get("fallback_provider") or settings.LLM_FALLBACK_PROVIDER or settings.LLM_PROVIDER,
+        "fallback_model": overrides.get("fallback_model") or settings.LLM_FALLBACK_MODEL_NAME,
+        "fallback_api_base": overrides.get("fallback_api_base") or settings.LLM_FALLBACK_API_BASE or settings.LLM_API_BASE,
+        "fallback_api_key": overrides.get("fallback_api_key") or settings.LLM_FALLBACK_API_KEY or settings.LLM_API_KEY,
+    }
+
+
+def create_chat_model(
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    profile: Optional[str] = None,
+    **kwargs,
+) -> BaseChatModel:
+    """
+    Create a chat model based on the configured provider.
+
+    profile selects a named entry of LLM_PROFILES (e.g. "label", "rewrite",
+    "parse", "agent") that overrides the provider, model, base URL, key,
+    timeout, max_retries and default max_tokens of the primary endpoint, and
+    optionally the fallback endpoint.
+
+    When a fallback model is configured, the model hedges and fails over to the
+    fallback endpoint (see app.core.llm_router). The fallback model is built
+    with the same temperature, max_tokens, timeout and max_retries as the
+    primary, so a failed-over call keeps the limits of its profile.
+    """
+    resolved = get_model_profile(profile)
+    if max_tokens is None:
+        max_tokens = resolved["max_tokens"]
+    # Per-call limits shared by the primary and the fallback model
+    kwargs = dict(kwargs)
+    if resolved["timeout"] is not None:
+        kwargs.setdefault("timeout", resolved["timeout"])
+    if resolved["max_retries"] is not None:
+        kwargs.setdefault("max_retries", resolved["max_retries"])
+
+    primary = _build_provider_model(
+        resolved["provider"],
+        resolved["model"],
+        resolved["api_key"],
+        resolved["api_base"],
+        temperature,
+        max_tokens,
+        kwargs,
+    )
+    if not resolved["fallback_model"]:
+        return primary
+
+    from app.core.llm_router import HedgedChatModel
+
+    secondary = _build_provider_model(
+        resolved["fallback_provider"],
+        resolved["fallback_model"],
+        resolved["fallback_api_key"],
+        resolved["fallback_api_base"],
+        temperature,
+        max_tokens,
+        kwargs,
+    )
+    return HedgedChatModel(
+        primary=primary,
+        secondary=secondary,
+        primary_name=f"{resolved['provider'].lower()}:{resolved['api_base']}:{resolved['model']}",
+        secondary_name=(
+            f"{resolved['fallback_provider'].lower()}:{resolved['fallback_api_base']}:{resolved['fallback_model']}"
+        ),
+        hedge_delay=settings.LLM_HEDGE_DELAY_MS / 1000,
     )
-    return model
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+LLM HTTP 连接池 — 进程内按 provider / base_url 共享 keep-alive 的 httpx 客户端
+
+llm_factory 创建的所有聊天模型以及 Agently 的 Claude 请求都从这里获取 HTTP 客户端，
+避免每次调用都重新建立 TCP + TLS 连接。安装了 h2 时启用 HTTP/2。
+异步客户端的连接绑定在创建它的事件循环上，因此异步客户端额外按事件循环区分。
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - h2 未安装时回退到 HTTP/1.1
+    _HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 建连完成的 httpcore trace 事件，用于统计新建连接数
+_NEW_CONNECTION_EVENT = "connection.connect_tcp.complete"
+
+
+class _PoolStats:
+    """单个 (provider, base_url) 的连接复用统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_requests": reused,
+            "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+        }
+
+
+class LLMHttpPool:
+    """按 provider / base_url 复用 httpx 客户端并统计连接复用情况"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_clients: Dict[Tuple[str, str, Optional[str]], httpx.Client] = {}
+        self._async_clients: Dict[Tuple[str, str, Optional[str], int], Tuple[Any, httpx.AsyncClient]] = {}
+        self._stats: Dict[Tuple[str, str], _PoolStats] = {}
+
+    @staticmethod
+    def _client_kwargs(proxy: Optional[str]) -> Dict[str, Any]:
+        """构造共享客户端参数：连接上限、keep-alive 与超时均来自配置"""
+        kwargs: Dict[str, Any] = {
+            "limits": httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "timeout": httpx.Timeout(
+                settings.LLM_HTTP_READ_TIMEOUT,
+                connect=settings.LLM_HTTP_CONNECT_TIMEOUT,
+            ),
+            "http2": settings.LLM_HTTP2_ENABLED and _HTTP2_AVAILABLE,
+        }
+        if proxy:
+            kwargs["proxy"] = proxy
+        return kwargs
+
+    def _get_stats(self, provider: str, base_url: str) -> _PoolStats:
+        key = (provider, base_url)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = _PoolStats()
+            self._stats[key] = stats
+        return stats
+
+    def get_client(self, provider: str, base_url: str, proxy: Optional[str] = None) -> httpx.Client:
+        """
+        获取同步共享客户端
+
+        Args:
+            provider: 模型提供方，例如 openai、anthropic
+            base_url: 模型 API 基础地址
+            proxy: 可选代理地址
+
+        Returns:
+            httpx.Client: 进程内共享的同步客户端
+        """
+        key = (provider, base_url, proxy)
+        with self._lock:
+            client = self._sync_clients.get(key)
+            if client is None or client.is_closed:
+                stats = self._get_stats(provider, base_url)
+
+                def _trace(event_name: str, _info: Dict[str, Any]) -> None:
+                    if event_name == _NEW_CONNECTION_EVENT:
+                        stats.new_connections += 1
+
+                def _on_request(request: httpx.Request) -> None:
+                    stats.requests += 1
+                    request.extensions["trace"] = _trace
+
+                client = httpx.Client(event_hooks={"request": [_on_request]}, **self._client_kwargs(proxy))
+                self._sync_clients[key] = client
+                logger.info("[LLM HTTP Pool] 创建同步客户端 provider=%s, base_url=%s", provider, base_url)
+            return client
+
+    def get_async_client(self, provider: str, base_url: str, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        """
+        获取当前事件循环下的异步共享客户端
+
+        Args:
+            provider: 模型提供方，例如 openai、anthropic
+            base_url: 模型 API 基础地址
+            proxy: 可选代理地址
+
+        Returns:
+            httpx.AsyncClient: 绑定当前事件循环的共享异步客户端
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        key = (provider, base_url, proxy, id(loop) if loop is not None else 0)
+        with self._lock:
+            self._prune_closed_loops()
+            entry = self._async_clients.get(key)
+            if entry is not None and entry[0] is loop and not entry[1].is_closed:
+                return entry[1]
+
+            stats = self._get_stats(provider, base_url)
+
+            async def _trace(event_name: str, _info: Dict[str, Any]) -> None:
+                if event_name == _NEW_CONNECTION_EVENT:
+                    stats.new_connections += 1
+
+            async def _on_request(request: httpx.Request) -> None:
+                stats.requests += 1
+                request.extensions["trace"] = _trace
+
+            client = httpx.AsyncClient(event_hooks={"request": [_on_request]}, **self._client_kwargs(proxy))
+            self._async_clients[key] = (loop, client)
+            logger.info("[LLM HTTP Pool] 创建异步客户端 provider=%s, base_url=%s", provider, base_url)
+            return client
+
+    def _prune_closed_loops(self) -> None:
+        """丢弃事件循环已关闭的异步客户端（其连接无法在其他循环上复用）"""
+        for key, (loop, _client) in list(self._async_clients.items()):
+            if loop is not None and loop.is_closed():
+                del self._async_clients[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各 provider / base_url 的请求数、新建连接数与复用率"""
+        with self._lock:
+            return {
+                "http2": settings.LLM_HTTP2_ENABLED and _HTTP2_AVAILABLE,
+                "pools": [
+                    {"provider": provider, "base_url": base_url, **stats.snapshot()}
+                    for (provider, base_url), stats in self._stats.items()
+                ],
+            }
+
+    async def aclose(self) -> None:
+        """关闭全部共享客户端（应用关闭时调用）"""
+        with self._lock:
+            sync_clients = list(self._sync_clients.values())
+            async_entries = list(self._async_clients.values())
+            self._sync_clients.clear()
+            self._async_clients.clear()
+
+        current_loop = asyncio.get_running_loop()
+        for client in sync_clients:
+            client.close()
+        for loop, client in async_entries:
+            if loop is None or loop is current_loop:
+                await client.aclose()
+
+
+_pool_instance: Optional[LLMHttpPool] = None
+
+
+def get_llm_http_pool() -> LLMHttpPool:
+    """获取全局单例 LLMHttpPool"""
+    global _pool_instance
+    if _pool_instance is None:
+        _pool_instance = LLMHttpPool()
+    return _pool_instance
@@ -0,0 +1,319 @@
+"""
+LLM request routing: hedged requests and failover across two providers.
+
+Each call streams from the preferred endpoint first. If its first chunk has not
+arrived within LLM_HEDGE_DELAY_MS, the same request is sent to the other
+endpoint and whichever streams first wins; the slower stream is cancelled.
+A failure before the first chunk fails over immediately.
+
+Each endpoint has a circuit breaker driven by error rate and time-to-first-token
+inside a sliding window. While a breaker is open the other endpoint becomes the
+preferred one; after LLM_BREAKER_OPEN_SECONDS a single trial request is allowed.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = "closed"
+_OPEN = "open"
+_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Sliding-window circuit breaker for one LLM endpoint."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = _CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        horizon = now - settings.LLM_BREAKER_WINDOW_SECONDS
+        while self._outcomes and self._outcomes[0][0] < horizon:
+            self._outcomes.popleft()
+
+    def available(self) -> bool:
+        """Whether allow() would admit a request now, without taking the half-open trial."""
+        with self._lock:
+            if self.state == _CLOSED:
+                return True
+            if self.state == _OPEN:
+                return time.monotonic() - self._opened_at >= settings.LLM_BREAKER_OPEN_SECONDS
+            return not self._trial_in_flight
+
+    def allow(self) -> bool:
+        """Whether a request may be sent to this endpoint now; in half-open state this takes the single trial."""
+        with self._lock:
+            if self.state == _CLOSED:
+                return True
+            if self.state == _OPEN and time.monotonic() - self._opened_at >= settings.LLM_BREAKER_OPEN_SECONDS:
+                self.state = _HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == _HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a half-open trial whose request was cancelled without an outcome."""
+        with self._lock:
+            if self.state == _HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record(self, ok: bool, ttft: Optional[float] = None) -> None:
+        """
+        Record one request outcome; a first token slower than LLM_BREAKER_SLOW_TTFT_MS counts as a failure.
+
+        Args:
+            ok: whether the request produced a first chunk
+            ttft: time to first token in seconds
+        """
+        if ok and ttft is not None and ttft * 1000 > settings.LLM_BREAKER_SLOW_TTFT_MS:
+            ok = False
+        now = time.monotonic()
+        with self._lock:
+            if self.state == _HALF_OPEN:
+                self._trial_in_flight = False
+                self._outcomes.clear()
+                if ok:
+                    self.state = _CLOSED
+                else:
+                    self.state = _OPEN
+                    self._opened_at = now
+                    return
+            self._outcomes.append((now, ok))
+            self._prune(now)
+            total = len(self._outcomes)
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if (
+                self.state == _CLOSED
+                and total >= settings.LLM_BREAKER_MIN_REQUESTS
+                and failures / total >= settings.LLM_BREAKER_FAILURE_RATIO
+            ):
+                self.state = _OPEN
+                self._opened_at = now
+                logger.warning("[LLM Router] circuit opened for %s (%d/%d failed)", self.name, failures, total)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "state": self.state,
+                "requests": len(self._outcomes),
+                "failures": sum(1 for _, success in self._outcomes if not success),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker of an endpoint."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def get_llm_routing_stats() -> Dict[str, Any]:
+    """Circuit breaker state of every endpoint."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+async def _first_chunk(stream: AsyncIterator[Any]) -> Optional[Any]:
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _discard(task: asyncio.Task, stream: Any) -> None:
+    """Cancel a losing attempt and close its stream."""
+    task.cancel()
+    with suppress(BaseException):
+        await task
+    with suppress(BaseException):
+        await stream.aclose()
+
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model that hedges and fails over between a primary and a secondary model."""
+
+    primary: Any
+    secondary: Any
+    primary_name: str
+    secondary_name: str
+    hedge_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "HedgedChatModel":
+        return self.model_copy(update={
+            "primary": self.primary.bind_tools(tools, **kwargs),
+            "secondary": self.secondary.bind_tools(tools, **kwargs),
+        })
+
+    def _candidates(self) -> List[Tuple[str, Any, CircuitBreaker]]:
+        """
+        Endpoints in preference order; an endpoint whose breaker would reject the call goes last.
+
+        Breakers are only peeked here; allow() is called when an endpoint is actually launched,
+        so a half-open trial is not taken by an endpoint that never gets a request.
+        """
+        candidates = [
+            (self.primary_name, self.primary, get_circuit_breaker(self.primary_name)),
+            (self.secondary_name, self.secondary, get_circuit_breaker(self.secondary_name)),
+        ]
+        available = [candidate for candidate in candidates if candidate[2].available()]
+        unavailable = [candidate for candidate in candidates if candidate not in available]
+        return available + unavailable
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        candidates = self._candidates()
+        attempts: Dict[asyncio.Task, Tuple[str, Any, CircuitBreaker, float, bool]] = {}
+        launched = 0
+        last_error: Optional[BaseException] = None
+        winner = None
+        first = None
+        started = time.monotonic()
+
+        def launch() -> bool:
+            """Launch the next endpoint its breaker admits; the last one is tried anyway when nothing else runs."""
+            nonlocal launched
+            while launched < len(candidates):
+                name, runnable, breaker = candidates[launched]
+                launched += 1
+                admitted = breaker.allow()
+                last_resort = not attempts and launched == len(candidates)
+                if not admitted and not last_resort:
+                    continue
+                # Inner calls get no inherited callbacks so their tokens are not streamed twice.
+                stream = runnable.astream(messages, stop=stop, config={"callbacks": []}, **kwargs)
+                attempts[asyncio.ensure_future(_first_chunk(stream))] = (name, stream, breaker, time.monotonic(), admitted)
+                return True
+            return False
+
+        launch()
+        try:
+            while winner is None:
+                if not attempts:
+                    if launched < len(candidates):
+                        launch()
+                        continue
+                    raise last_error or RuntimeError("no LLM endpoint available")
+
+                timeout = None
+                if launched < len(candidates) and self.hedge_delay > 0:
+                    timeout = max(self.hedge_delay - (time.monotonic() - started), 0)
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        logger.info("[LLM Router] no first token from %s after %.1fs, hedging", candidates[0][0], self.hedge_delay)
+                    continue
+
+                for task in done:
+                    name, stream, breaker, launched_at, admitted = attempts.pop(task)
+                    error = task.exception()
+                    if error is None and winner is None:
+                        breaker.record(True, time.monotonic() - launched_at)
+                        winner, first = (name, stream, breaker), task.result()
+                        continue
+                    if error is None:
+                        if admitted:
+                            breaker.release()
+                        await _discard(task, stream)
+                        continue
+                    breaker.record(False)
+                    last_error = error
+                    logger.warning("[LLM Router] %s failed before first token: %s", name, error)
+                    with suppress(BaseException):
+                        await stream.aclose()
+                    if launched < len(candidates):
+                        launch()
+        finally:
+            for task, (name, stream, breaker, _launched_at, admitted) in list(attempts.items()):
+                # The endpoint that was asked first and lost the race counts as slow;
+                # other cancelled attempts have no outcome and give back a half-open trial.
+                if winner is not None and name == candidates[0][0]:
+                    breaker.record(False)
+                elif admitted:
+                    breaker.release()
+                await _discard(task, stream)
+
+        name, stream, breaker = winner
+        if name != candidates[0][0]:
+            logger.info("[LLM Router] served by %s", name)
+        chunk = first
+        try:
+            while chunk is not None:
+                generation = ChatGenerationChunk(message=chunk)
+                if run_manager:
+                    await run_manager.on_llm_new_token(generation.text, chunk=generation)
+                yield generation
+                chunk = await _first_chunk(stream)
+        except Exception:
+            breaker.record(False)
+            raise
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Synchronous calls only fail over; hedging needs the event loop.
+        last_error: Optional[BaseException] = None
+        candidates = self._candidates()
+        for index, (name, runnable, breaker) in enumerate(candidates):
+            if not breaker.allow() and index < len(candidates) - 1:
+                continue
+            started = time.monotonic()
+            try:
+                message = runnable.invoke(messages, stop=stop, config={"callbacks": []}, **kwargs)
+            except Exception as e:
+                breaker.record(False)
+                last_error = e
+                logger.warning("[LLM Router] %s failed: %s", name, e)
+                continue
+            breaker.record(True, time.monotonic() - started)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise last_error or RuntimeError("no LLM endpoint available")
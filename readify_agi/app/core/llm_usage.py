@@ -0,0 +1,104 @@
+"""
+LLM 用量统计 — 按调用记录输入 token 中命中提示词缓存与未命中的部分
+
+llm_factory 创建的聊天模型都挂载 LLMUsageCallbackHandler：每次调用结束时从
+usage_metadata 的 input_token_details 读取 cache_read / cache_creation，
+写一行日志并累计到进程级统计，统计结果见 `GET /metrics/llm-usage`。
+"""
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUsageStats:
+    """按模型累计的 token 用量"""
+
+    _FIELDS = ("calls", "input_tokens", "cache_read_tokens", "cache_creation_tokens", "uncached_input_tokens", "output_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: str, usage: Dict[str, int]) -> None:
+        with self._lock:
+            totals = self._models.setdefault(model, dict.fromkeys(self._FIELDS, 0))
+            totals["calls"] += 1
+            for field in self._FIELDS[1:]:
+                totals[field] += usage.get(field, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for model, totals in self._models.items():
+                item = dict(totals)
+                input_tokens = item["input_tokens"]
+                item["cache_hit_ratio"] = round(item["cache_read_tokens"] / input_tokens, 4) if input_tokens else 0.0
+                result[model] = item
+            return result
+
+
+def extract_usage(usage_metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    从 usage_metadata 中拆分缓存命中、缓存写入与未缓存的输入 token
+
+    Args:
+        usage_metadata: LangChain 消息上的 usage_metadata
+
+    Returns:
+        Optional[Dict[str, int]]: 用量明细，无用量信息时返回 None
+    """
+    if not usage_metadata:
+        return None
+    details = usage_metadata.get("input_token_details") or {}
+    input_tokens = int(usage_metadata.get("input_tokens") or 0)
+    cache_read = int(details.get("cache_read") or 0)
+    cache_creation = int(details.get("cache_creation") or 0)
+    return {
+        "input_tokens": input_tokens,
+        "cache_read_tokens": cache_read,
+        "cache_creation_tokens": cache_creation,
+        "uncached_input_tokens": max(input_tokens - cache_read - cache_creation, 0),
+        "output_tokens": int(usage_metadata.get("output_tokens") or 0),
+    }
+
+
+class LLMUsageCallbackHandler(BaseCallbackHandler):
+    """在每次 LLM 调用结束时记录提示词缓存命中情况"""
+
+    def __init__(self, model: str, stats: "LLMUsageStats"):
+        self.model = model
+        self.stats = stats
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = extract_usage(getattr(message, "usage_metadata", None))
+                if usage is None:
+                    continue
+                self.stats.record(self.model, usage)
+                logger.info(
+                    "[LLMUsage] model=%s, input=%d, cache_read=%d, cache_creation=%d, uncached=%d, output=%d",
+                    self.model,
+                    usage["input_tokens"],
+                    usage["cache_read_tokens"],
+                    usage["cache_creation_tokens"],
+                    usage["uncached_input_tokens"],
+                    usage["output_tokens"],
+                )
+
+
+_stats_instance: Optional[LLMUsageStats] = None
+
+
+def get_llm_usage_stats() -> LLMUsageStats:
+    """获取全局单例 LLMUsageStats"""
+    global _stats_instance
+    if _stats_instance is None:
+        _stats_instance = LLMUsageStats()
+    return _stats_instance
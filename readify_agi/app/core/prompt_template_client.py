@@ -4,7 +4,7 @@ Prompt Template Client — 从 readify_eval API 获取提示词模板并缓存
 """
 import logging
 import re
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import httpx
 
@@ -53,6 +53,19 @@ class PromptTemplateClient:
         self._cache: Dict[str, str] = {}
         self._system_cache: Dict[str, str] = {}
         self._initialized = False
+        # 模板版本号，每次 refresh 后递增，供下游缓存（如已编译的 Agent 定义）作为缓存键
+        self._version = 0
+        self._refresh_listeners: List[Callable[[], None]] = []
+
+    @property
+    def version(self) -> int:
+        """当前模板版本号"""
+        return self._version
+
+    def add_refresh_listener(self, listener: Callable[[], None]) -> None:
+        """注册模板刷新回调，refresh 完成后同步调用，用于失效依赖模板的缓存"""
+        if listener not in self._refresh_listeners:
+            self._refresh_listeners.append(listener)
 
     async def _ensure_initialized(self) -> None:
         """确保模板已加载，未加载则通过服务发现拉取"""
@@ -129,6 +142,12 @@ class PromptTemplateClient:
         self._system_cache.clear()
         self._initialized = False
         await self._ensure_initialized()
+        self._version += 1
+        for listener in list(self._refresh_listeners):
+            try:
+                listener()
+            except Exception:
+                logger.exception("提示词模板刷新回调执行失败")
 
 
 def get_prompt_client() -> "PromptTemplateClient":
@@ -0,0 +1,183 @@
+"""
+思考过程记录 — 请求内有界的思考文本与压缩的完整轨迹
+
+智能体流式输出的 token、工具调用与工具输出都会写入思考过程：
+- 内联文本（写入 assistant_thinking.content）受 THINKING_TRACE_MAX_CHARS 限制，
+  工具输出只保留前 THINKING_TRACE_TOOL_DIGEST_CHARS 个字符与长度、摘要哈希；
+- 完整轨迹边写入边流式压缩（安装 zstandard 时使用 zstd，否则使用 zlib），
+  内存中只保留压缩后的数据，原始大小超过 THINKING_TRACE_FULL_MAX_BYTES 后不再追加；
+- 只有内联文本被截断或摘要化时才导出完整轨迹，由后台写入队列存入 assistant_thinking_trace 表，按需读取。
+"""
+import hashlib
+import zlib
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard 未安装时回退到 zlib
+    zstandard = None
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+
+
+def _new_compressor():
+    """创建流式压缩器，返回 (编码名, 压缩对象)"""
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compressobj()
+    return CODEC_ZLIB, zlib.compressobj(6)
+
+
+def decompress_trace(codec: str, data: bytes) -> str:
+    """
+    解压完整思考轨迹
+
+    Args:
+        codec: 压缩编码（zstd 或 zlib）
+        data: 压缩数据
+
+    Returns:
+        str: 思考轨迹文本
+    """
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的思考轨迹需要安装 zstandard")
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    elif codec == CODEC_ZLIB:
+        raw = zlib.decompress(data)
+    else:
+        raise ValueError(f"未知的思考轨迹压缩编码: {codec}")
+    return raw.decode("utf-8")
+
+
+def digest_tool_output(output: Any, max_chars: Optional[int] = None) -> str:
+    """
+    生成工具输出摘要：过长时只保留开头部分，并附上总长度与内容哈希
+
+    Args:
+        output: 工具输出
+        max_chars: 保留的字符数，默认 THINKING_TRACE_TOOL_DIGEST_CHARS
+
+    Returns:
+        str: 工具输出摘要
+    """
+    text = "" if output is None else str(output)
+    max_chars = settings.THINKING_TRACE_TOOL_DIGEST_CHARS if max_chars is None else max_chars
+    if len(text) <= max_chars:
+        return text
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return f"{text[:max_chars]}…（共{len(text)}字，已截断，sha1:{digest}）"
+
+
+@dataclass
+class CompressedTrace:
+    """压缩后的完整思考轨迹"""
+    codec: str
+    data: bytes
+    raw_size: int
+
+
+class ThinkingTrace:
+    """
+    有界的思考过程记录，接口与原先收集思考片段的列表保持一致（append / extend / len）
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, full_max_bytes: Optional[int] = None):
+        self.max_chars = settings.THINKING_TRACE_MAX_CHARS if max_chars is None else max_chars
+        self.full_max_bytes = settings.THINKING_TRACE_FULL_MAX_BYTES if full_max_bytes is None else full_max_bytes
+        self._parts: List[str] = []
+        self._inline_chars = 0
+        self._omitted_chars = 0
+        # 内联文本是否与完整轨迹不同（被截断或工具输出被摘要化）
+        self.truncated = False
+
+        self._codec, self._compressor = _new_compressor()
+        self._compressed: List[bytes] = []
+        self._raw_size = 0
+        self._full_capped = False
+        self._exported: Optional[CompressedTrace] = None
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    def _write_full(self, text: str) -> None:
+        if self._full_capped or self._exported is not None:
+            return
+        data = text.encode("utf-8")
+        if self._raw_size + len(data) > self.full_max_bytes:
+            data = "\n…（完整思考轨迹超出大小上限，后续内容未记录）\n".encode("utf-8")
+            self._full_capped = True
+        self._raw_size += len(data)
+        chunk = self._compressor.compress(data)
+        if chunk:
+            self._compressed.append(chunk)
+
+    def _append_inline(self, text: str) -> None:
+        remaining = self.max_chars - self._inline_chars
+        if remaining <= 0:
+            self._omitted_chars += len(text)
+            self.truncated = True
+            return
+        if len(text) > remaining:
+            self._omitted_chars += len(text) - remaining
+            self.truncated = True
+            text = text[:remaining]
+        self._parts.append(text)
+        self._inline_chars += len(text)
+
+    def append(self, text: Any) -> None:
+        """追加思考片段"""
+        if text is None or text == "":
+            return
+        text = str(text)
+        self._write_full(text)
+        self._append_inline(text)
+
+    def extend(self, texts: Iterable[Any]) -> None:
+        """追加多个思考片段"""
+        for text in texts:
+            self.append(text)
+
+    def add_tool_output(self, tool_name: str, output: Any) -> None:
+        """
+        记录工具输出：完整内容只进入压缩轨迹，内联文本只保留摘要
+
+        Args:
+            tool_name: 工具名称
+            output: 工具输出
+        """
+        text = "" if output is None else str(output)
+        self._write_full(f"工具[{tool_name}]输出: {text}\n")
+        digest = digest_tool_output(text)
+        if len(digest) != len(text):
+            self.truncated = True
+        self._append_inline(f"工具[{tool_name}]输出: {digest}\n")
+
+    def render(self) -> str:
+        """渲染写入 assistant_thinking 的内联文本"""
+        text = "".join(self._parts)
+        if self._omitted_chars:
+            text += f"\n…（思考过程过长，已省略{self._omitted_chars}字，完整内容见思考轨迹）"
+        return text
+
+    def export_full(self) -> Optional[CompressedTrace]:
+        """
+        结束压缩并导出完整轨迹；内联文本已包含全部内容时返回 None
+
+        Returns:
+            Optional[CompressedTrace]: 压缩后的完整轨迹
+        """
+        if not self.truncated:
+            return None
+        if self._exported is None:
+            self._compressed.append(self._compressor.flush())
+            self._exported = CompressedTrace(
+                codec=self._codec,
+                data=b"".join(self._compressed),
+                raw_size=self._raw_size,
+            )
+            self._compressed = []
+        return self._exported
@@ -0,0 +1,79 @@
+"""
+Token 计数 — 使用模型分词器统计文本 token 数
+
+优先使用 tiktoken 按当前模型选择编码（未知模型回退到 cl100k_base）；
+tiktoken 不可用或编码文件无法加载时，按中日韩字符约 1 token、其他字符约 4 字符 1 token 估算。
+首次加载编码可能需要下载编码文件，应用启动时通过 warm_up 在线程中预先加载，避免阻塞事件循环。
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Optional
+
+from app.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken 未安装时使用估算
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model_name: str):
+    """按模型名获取 tiktoken 编码，失败返回 None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        pass
+    except Exception as exc:
+        logger.warning("加载模型 %s 的分词器失败，使用估算: %s", model_name, exc)
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as exc:
+        logger.warning("加载 cl100k_base 分词器失败，使用估算: %s", exc)
+        return None
+
+
+def warm_up(model_name: Optional[str] = None) -> bool:
+    """
+    预先加载模型分词器（同步且可能下载编码文件，应在线程中调用）
+
+    Args:
+        model_name: 模型名，默认使用 LLM_MODEL_NAME
+
+    Returns:
+        bool: 是否成功加载 tiktoken 编码
+    """
+    return _get_encoding(model_name or settings.LLM_MODEL_NAME) is not None
+
+
+def estimate_tokens(text: str) -> int:
+    """无分词器时的 token 估算"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def count_tokens(text: Optional[str], model_name: Optional[str] = None) -> int:
+    """
+    统计文本的 token 数
+
+    Args:
+        text: 待统计文本
+        model_name: 模型名，默认使用 LLM_MODEL_NAME
+
+    Returns:
+        int: token 数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model_name or settings.LLM_MODEL_NAME)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,105 @@
+"""
+工具并发控制 — 为智能体工具加上进程级的按工具并发上限
+
+模型在同一轮返回多个工具调用时，AgentExecutor 会用 asyncio.gather 并发执行并按调用顺序
+返回结果。这里为每个工具名维护一个进程级信号量，避免并发的检索 / 读库调用压垮 DB 与 Milvus。
+修改思维导图的工具共用一个上限为 1 的信号量，同一轮的多个写操作依次执行，不会基于同一份旧节点快照相互覆盖。
+"""
+import asyncio
+import functools
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_limits: Optional[Dict[str, int]] = None
+
+# 串行执行的工具组：组内工具共用一个上限为 1 的信号量
+SERIAL_TOOL_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "mind_map_write": (
+        "batch_add_child_nodes",
+        "update_mind_map_node",
+        "delete_mind_map_node",
+        "apply_mind_map_ops",
+        "generate_mind_map",
+    ),
+}
+
+
+def _get_limits() -> Dict[str, int]:
+    """解析 TOOL_CONCURRENCY_LIMITS 配置（JSON 对象：工具名 -> 并发上限）"""
+    global _limits
+    if _limits is not None:
+        return _limits
+
+    raw = settings.TOOL_CONCURRENCY_LIMITS.strip()
+    limits: Dict[str, int] = {}
+    if raw:
+        try:
+            parsed = json.loads(raw)
+            if isinstance(parsed, dict):
+                limits = {str(name): int(limit) for name, limit in parsed.items()}
+            else:
+                logger.warning("TOOL_CONCURRENCY_LIMITS 必须是 JSON 对象，已忽略")
+        except (json.JSONDecodeError, TypeError, ValueError) as exc:
+            logger.warning("解析 TOOL_CONCURRENCY_LIMITS 失败，已忽略: %s", exc)
+    _limits = limits
+    return _limits
+
+
+def get_tool_semaphore(tool_name: str) -> asyncio.Semaphore:
+    """
+    获取工具对应的进程级信号量，串行工具组内的工具返回同一个信号量
+
+    Args:
+        tool_name: 工具名称
+
+    Returns:
+        asyncio.Semaphore: 该工具共享的信号量
+    """
+    group = next((name for name, members in SERIAL_TOOL_GROUPS.items() if tool_name in members), None)
+    key = group or tool_name
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        limit = 1 if group else _get_limits().get(tool_name, settings.TOOL_DEFAULT_CONCURRENCY)
+        semaphore = asyncio.Semaphore(max(limit, 1))
+        _semaphores[key] = semaphore
+    return semaphore
+
+
+def _with_semaphore(coroutine, semaphore: asyncio.Semaphore):
+    """包装工具协程，执行期间占用信号量；保留原签名供 LangChain 识别 callbacks / config 参数"""
+
+    @functools.wraps(coroutine)
+    async def limited(*args, **kwargs):
+        async with semaphore:
+            return await coroutine(*args, **kwargs)
+
+    limited._concurrency_limited = True
+    return limited
+
+
+def limit_tool_concurrency(tools: List[BaseTool]) -> List[BaseTool]:
+    """
+    为异步工具包装并发上限，原地修改并返回工具列表
+
+    仅包装提供 coroutine 的工具；同步工具由 LangChain 放入线程池执行，不做限制。
+
+    Args:
+        tools: 工具列表
+
+    Returns:
+        List[BaseTool]: 同一工具列表
+    """
+    for tool_item in tools:
+        coroutine = getattr(tool_item, "coroutine", None)
+        if coroutine is None or getattr(coroutine, "_concurrency_limited", False):
+            continue
+        tool_item.coroutine = _with_semaphore(coroutine, get_tool_semaphore(tool_item.name))
+    return tools
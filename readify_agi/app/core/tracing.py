@@ -0,0 +1,245 @@
+"""
+请求级耗时追踪 — 记录一次智能体请求内各步骤的结构化耗时
+
+一次 /agent/stream 请求对应一个 RequestTrace（带 request_id），通过 ContextVar 传递，
+委派给子智能体或并发执行的子任务会继承同一个追踪，所有步骤以同一 request_id 关联：
+- 阶段步骤（提示词加载、生成前的数据库读取等）使用 trace_span 上下文管理器记录；
+- LLM 调用与工具调用由智能体事件流按 run_id 开始 / 结束，LLM 步骤额外记录首 token 延迟、
+  输入输出 token 数与输出速率。
+
+请求结束时在日志中输出按类型汇总的耗时；安装并启用 OpenTelemetry 时导出为一棵 span 树；
+请求开启 debug_timing 时还会通过 SSE 发送 debug_timing 事件。
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover - 未安装 OpenTelemetry 时只记录日志与 SSE 事件
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+@dataclass
+class TraceSpan:
+    """单个步骤的耗时记录"""
+    name: str
+    kind: str
+    start: float
+    end: Optional[float] = None
+    first_token: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return round((end - self.start) * 1000, 1)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": self.duration_ms,
+        }
+        if self.first_token is not None:
+            data["ttft_ms"] = round((self.first_token - self.start) * 1000, 1)
+        if self.attributes:
+            data.update(self.attributes)
+        return data
+
+
+class RequestTrace:
+    """
+    一次请求的耗时追踪，步骤数超过 TRACING_MAX_SPANS 后不再记录新步骤
+    """
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self._wall_start_ns = time.time_ns()
+        self.end: Optional[float] = None
+        self.spans: List[TraceSpan] = []
+        self._open: Dict[str, TraceSpan] = {}
+        self.dropped = 0
+
+    def _add(self, span: TraceSpan) -> Optional[TraceSpan]:
+        if len(self.spans) >= settings.TRACING_MAX_SPANS:
+            self.dropped += 1
+            return None
+        self.spans.append(span)
+        return span
+
+    def begin(self, key: str, name: str, kind: str, **attributes: Any) -> None:
+        """按 key（如事件 run_id）开始一个步骤，同一 key 重复开始时忽略"""
+        if key in self._open:
+            return
+        span = self._add(TraceSpan(name=name, kind=kind, start=time.perf_counter(), attributes=attributes))
+        if span is not None:
+            self._open[key] = span
+
+    def mark_first_token(self, key: str) -> None:
+        """记录 LLM 步骤的首 token 时间"""
+        span = self._open.get(key)
+        if span is not None and span.first_token is None:
+            span.first_token = time.perf_counter()
+
+    def finish_span(self, key: str, **attributes: Any) -> Optional[TraceSpan]:
+        """按 key 结束一个步骤"""
+        span = self._open.pop(key, None)
+        if span is None:
+            return None
+        span.end = time.perf_counter()
+        span.attributes.update({name: value for name, value in attributes.items() if value is not None})
+        return span
+
+    def finish_llm_span(self, key: str, usage: Optional[Dict[str, int]] = None) -> Optional[TraceSpan]:
+        """结束 LLM 步骤，记录输入输出 token 数与首 token 之后的输出速率"""
+        usage = usage or {}
+        span = self.finish_span(
+            key,
+            input_tokens=usage.get("input_tokens"),
+            cache_read_tokens=usage.get("cache_read_tokens") or None,
+            output_tokens=usage.get("output_tokens"),
+        )
+        output_tokens = usage.get("output_tokens")
+        if span is not None and output_tokens:
+            generation_seconds = span.end - (span.first_token or span.start)
+            if generation_seconds > 0:
+                span.attributes["tokens_per_second"] = round(output_tokens / generation_seconds, 1)
+        return span
+
+    def finish(self) -> None:
+        """结束请求追踪，仍未结束的步骤按当前时间结束"""
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        for span in self._open.values():
+            span.end = self.end
+            span.attributes["unfinished"] = True
+        self._open.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        """按步骤类型汇总耗时"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.kind] = round(totals.get(span.kind, 0.0) + span.duration_ms, 1)
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "request_id": self.request_id,
+            "total_ms": round((end - self.start) * 1000, 1),
+            "by_kind_ms": totals,
+            "span_count": len(self.spans),
+            "dropped_spans": self.dropped,
+        }
+
+    def to_event(self, project_id: Optional[int] = None) -> Dict[str, Any]:
+        """生成 debug_timing SSE 事件"""
+        return {
+            "type": "debug_timing",
+            "project_id": project_id,
+            **self.summary(),
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+
+    def export_otel(self) -> None:
+        """把请求及其步骤导出为 OpenTelemetry span 树"""
+        if otel_trace is None or not settings.TRACING_OTEL_ENABLED:
+            return
+
+        def _ns(moment: float) -> int:
+            return self._wall_start_ns + int((moment - self.start) * 1e9)
+
+        tracer = otel_trace.get_tracer("readify_agi.agent")
+        root = tracer.start_span(
+            "agent.request",
+            start_time=self._wall_start_ns,
+            attributes={"request_id": self.request_id},
+        )
+        parent_context = otel_trace.set_span_in_context(root)
+        for span in self.spans:
+            attributes = {
+                name: value for name, value in span.to_dict(self.start).items()
+                if isinstance(value, (str, bool, int, float))
+            }
+            attributes["request_id"] = self.request_id
+            child = tracer.start_span(
+                f"{span.kind}.{span.name}",
+                context=parent_context,
+                start_time=_ns(span.start),
+                attributes=attributes,
+            )
+            child.end(end_time=_ns(span.end if span.end is not None else self.end or time.perf_counter()))
+        root.end(end_time=_ns(self.end or time.perf_counter()))
+
+
+def get_current_trace() -> Optional[RequestTrace]:
+    """获取当前上下文中的请求追踪"""
+    return _current_trace.get()
+
+
+def activate_trace(trace: RequestTrace) -> Token:
+    """把请求追踪设置为当前上下文的追踪，返回用于恢复的 token"""
+    return _current_trace.set(trace)
+
+
+def deactivate_trace(token: Token) -> None:
+    """恢复 activate_trace 之前的追踪"""
+    _current_trace.reset(token)
+
+
+@contextmanager
+def use_trace(trace: RequestTrace) -> Iterator[RequestTrace]:
+    """在代码块内使用指定的请求追踪"""
+    token = activate_trace(trace)
+    try:
+        yield trace
+    finally:
+        deactivate_trace(token)
+
+
+@contextmanager
+def trace_span(name: str, kind: str, **attributes: Any) -> Iterator[Optional[TraceSpan]]:
+    """
+    记录代码块的耗时，当前没有请求追踪或追踪已关闭时不做任何事
+
+    Args:
+        name: 步骤名称
+        kind: 步骤类型（prompt / db / llm / tool / delegation 等）
+        attributes: 附加属性
+    """
+    trace = _current_trace.get()
+    if trace is None or not settings.TRACING_ENABLED:
+        yield None
+        return
+    key = uuid.uuid4().hex
+    trace.begin(key, name, kind, **attributes)
+    try:
+        yield trace._open.get(key)
+    except BaseException as exc:
+        trace.finish_span(key, error=type(exc).__name__)
+        raise
+    else:
+        trace.finish_span(key)
+
+
+def log_trace_summary(trace: RequestTrace) -> None:
+    """在日志中输出请求耗时汇总"""
+    summary = trace.summary()
+    logger.info(
+        "[Trace] request_id=%s total=%.1fms by_kind=%s spans=%d",
+        summary["request_id"],
+        summary["total_ms"],
+        summary["by_kind_ms"],
+        summary["span_count"],
+    )
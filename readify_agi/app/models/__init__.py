@@ -5,6 +5,7 @@ Domain Models Package
 
 from app.models.assistant_thinking import AssistantThinkingDB
 from app.models.conversation import ConversationHistoryDB
+from app.models.conversation_summary import ConversationSummaryDB
 from app.models.document import DocumentDB
 from app.models.file import FileDB
 from app.models.repair_document import RepairDocumentDB
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, DateTime, BigInteger
+from sqlalchemy import Column, DateTime, BigInteger, String
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT
 
 from app.core.database import Base
 
@@ -16,4 +16,19 @@ class AssistantThinkingDB(Base):
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now(), comment="更新时间")
 
     def __repr__(self):
-        return f"<AssistantThinking(id={self.id}, project_id={self.project_id}, user_message_id={self.user_message_id})" 
\ No newline at end of file
+        return f"<AssistantThinking(id={self.id}, project_id={self.project_id}, user_message_id={self.user_message_id})" 
+
+
+class AssistantThinkingTraceDB(Base):
+    __tablename__ = "assistant_thinking_trace"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True, comment="主键ID")
+    thinking_id = Column(BigInteger, nullable=False, unique=True, comment="对应的思考过程ID")
+    project_id = Column(BigInteger, nullable=False, index=True, comment="工程ID")
+    codec = Column(String(16), nullable=False, comment="压缩编码：zstd/zlib")
+    raw_size = Column(BigInteger, nullable=False, comment="压缩前字节数")
+    content = Column(LONGBLOB, nullable=False, comment="压缩后的完整思考轨迹")
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), comment="创建时间")
+
+    def __repr__(self):
+        return f"<AssistantThinkingTrace(id={self.id}, thinking_id={self.thinking_id}, codec={self.codec})"
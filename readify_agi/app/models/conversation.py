@@ -1,3 +1,6 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
 from sqlalchemy import Column, Integer, Boolean, DateTime, Enum, BigInteger
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.sql import func
@@ -20,8 +23,39 @@ class ConversationHistoryDB(Base):
     priority = Column(Integer, nullable=False, default=1, comment="优先级：数值越大优先级越高，裁剪时优先保留")
     is_included_in_context = Column(Boolean, nullable=False, default=True, comment="是否包含在上下文中：0-不包含，1-包含")
     sequence = Column(Integer, nullable=False, default=0, index=True, comment="对话序号，同一会话中的排序")
+    token_count = Column(Integer, nullable=False, default=0, comment="消息内容的token数，写入时计算")
     created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True, comment="创建时间")
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now(), comment="更新时间")
 
     def __repr__(self):
-        return f"<ConversationHistory(id={self.id}, project_id={self.project_id}, message_type={self.message_type}, sequence={self.sequence})>" 
\ No newline at end of file
+        return f"<ConversationHistory(id={self.id}, project_id={self.project_id}, message_type={self.message_type}, sequence={self.sequence})>" 
+
+
+class ConversationSequenceDB(Base):
+    """对话序号计数表，每个工程一行，用于原子分配对话序号并记录上下文消息数"""
+    __tablename__ = "conversation_sequence"
+
+    project_id = Column(BigInteger, primary_key=True, autoincrement=False, comment="工程ID")
+    last_sequence = Column(Integer, nullable=False, default=0, comment="已分配的最大对话序号")
+    context_count = Column(Integer, nullable=False, default=0, comment="包含在上下文中的消息数（近似值，修剪时校准）")
+
+
+class ConversationMessageCreate(BaseModel):
+    """待写入的对话消息"""
+    message_type: str
+    content: str
+    priority: int = 1
+    is_included_in_context: bool = True
+
+
+class ConversationTurnCreate(BaseModel):
+    """待写入的一轮对话：若干条消息及可选的思考过程，在同一事务中写入"""
+    project_id: int
+    messages: List[ConversationMessageCreate]
+    thinking: Optional[str] = None
+    # 思考过程关联的消息在 messages 中的下标
+    thinking_message_index: int = -1
+    # 思考过程被截断时附带的压缩完整轨迹，在本轮对话提交后单独保存
+    thinking_trace: Optional[bytes] = None
+    thinking_trace_codec: Optional[str] = None
+    thinking_trace_size: int = 0
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, BigInteger
+from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class ConversationSummaryDB(Base):
+    __tablename__ = "conversation_summary"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True, comment="主键ID")
+    project_id = Column(BigInteger, nullable=False, unique=True, comment="工程ID")
+    content = Column(LONGTEXT, nullable=False, comment="滚动摘要内容")
+    covered_sequence = Column(Integer, nullable=False, default=0, comment="摘要已覆盖到的对话序号（含）")
+    token_count = Column(Integer, nullable=False, default=0, comment="摘要内容的token数")
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    def __repr__(self):
+        return f"<ConversationSummary(id={self.id}, project_id={self.project_id}, covered_sequence={self.covered_sequence})>"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Literal, Union
 from sqlalchemy import Column, Integer, String, Boolean, BigInteger, Text, ForeignKey, Index
 from app.core.database import Base
 from datetime import datetime
@@ -23,6 +23,7 @@ class MindMapNodeDB(Base):
     # 索引
     __table_args__ = (
         Index('idx_file_id', file_id),
+        Index('idx_mind_map_id', mind_map_id),
         Index('idx_parent_id', parent_id),
         Index('idx_sort', file_id, parent_id, sequence)
     )
@@ -60,4 +61,19 @@ class MindMapNodeResponse(BaseModel):
 
 class MindMapNodeTreeResponse(MindMapNodeResponse):
     """思维导图节点树响应模型"""
-    children: List['MindMapNodeTreeResponse'] = [] 
\ No newline at end of file
+    children: List['MindMapNodeTreeResponse'] = []
+
+
+class MindMapNodeOperation(BaseModel):
+    """思维导图批量操作中的单个操作
+
+    node / parent 可以是已有节点ID，也可以是同一批次中 add 操作声明的临时ID（ref）
+    """
+    op: Literal["add", "update", "delete", "move"]
+    ref: Optional[str] = None
+    node: Optional[Union[int, str]] = None
+    parent: Optional[Union[int, str]] = None
+    content: Optional[str] = None
+    sequence: Optional[int] = None
+    delete_descendants: bool = True
+
@@ -1,8 +1,9 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.assistant_thinking import AssistantThinkingDB
+from app.core.thinking_trace import decompress_trace
+from app.models.assistant_thinking import AssistantThinkingDB, AssistantThinkingTraceDB
 from app.repositories import BaseRepository
 
 
@@ -45,6 +46,41 @@ class AssistantThinkingRepository(BaseRepository):
         finally:
             await self._cleanup_session()
 
+    async def save_trace(
+        self,
+        thinking_id: int,
+        project_id: int,
+        codec: str,
+        raw_size: int,
+        content: bytes
+    ) -> None:
+        """
+        在独立事务中保存压缩的完整思考轨迹
+
+        Args:
+            thinking_id: 思考过程ID
+            project_id: 工程ID
+            codec: 压缩编码
+            raw_size: 压缩前的字节数
+            content: 压缩后的轨迹
+        """
+        try:
+            db = await self._ensure_session()
+            try:
+                db.add(AssistantThinkingTraceDB(
+                    thinking_id=thinking_id,
+                    project_id=project_id,
+                    codec=codec,
+                    raw_size=raw_size,
+                    content=content
+                ))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        finally:
+            await self._cleanup_session()
+
     async def get_by_user_message(
         self,
         user_message_id: int
@@ -68,4 +104,47 @@ class AssistantThinkingRepository(BaseRepository):
             result = await db.execute(query)
             return result.scalar_one_or_none()
         finally:
-            await self._cleanup_session() 
\ No newline at end of file
+            await self._cleanup_session() 
+
+    async def get_full_trace(
+        self,
+        thinking_id: int,
+        project_id: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        读取完整思考轨迹：存在压缩轨迹时解压返回，否则返回思考过程内联文本
+
+        Args:
+            thinking_id: 思考过程ID
+            project_id: 工程ID
+
+        Returns:
+            包含 content 与 truncated 的字典，思考过程不存在时返回None
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(
+                AssistantThinkingDB.content,
+                AssistantThinkingTraceDB.codec,
+                AssistantThinkingTraceDB.content.label("trace")
+            ).outerjoin(
+                AssistantThinkingTraceDB,
+                AssistantThinkingTraceDB.thinking_id == AssistantThinkingDB.id
+            ).where(
+                AssistantThinkingDB.id == thinking_id,
+                AssistantThinkingDB.project_id == project_id
+            )
+
+            row = (await db.execute(query)).first()
+            if row is None:
+                return None
+            if row.trace is None:
+                return {"thinking_id": thinking_id, "content": row.content, "truncated": False}
+            return {
+                "thinking_id": thinking_id,
+                "content": decompress_trace(row.codec, row.trace),
+                "truncated": True
+            }
+        finally:
+            await self._cleanup_session()
@@ -1,16 +1,144 @@
-from typing import List
+import asyncio
+import logging
+from typing import List, Optional, Tuple
 
-from sqlalchemy import select, desc, func, update
+from sqlalchemy import select, desc, func, update, text
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.conversation import ConversationHistoryDB
+from app.core.config import settings
+from app.core.token_counter import count_tokens
+from app.models.assistant_thinking import AssistantThinkingDB
+from app.models.conversation import ConversationHistoryDB, ConversationSequenceDB, ConversationTurnCreate
 from app.repositories import BaseRepository
 
+logger = logging.getLogger(__name__)
+
+# 原子累加对话序号与上下文消息计数；UPDATE 持有计数行的行锁直到事务提交
+_BUMP_SEQUENCE_SQL = text(
+    "UPDATE conversation_sequence "
+    "SET last_sequence = last_sequence + :count, context_count = context_count + :context_count "
+    "WHERE project_id = :project_id"
+)
+
+# 计数行不存在时以该工程现有的最大序号与上下文消息数为起点创建（每个工程只执行一次）
+_SEED_SEQUENCE_SQL = text(
+    "INSERT INTO conversation_sequence (project_id, last_sequence, context_count) "
+    "SELECT :project_id, COALESCE(MAX(sequence), 0) + :count, "
+    "COALESCE(SUM(is_included_in_context), 0) + :context_count "
+    "FROM conversation_history WHERE project_id = :project_id "
+    "ON DUPLICATE KEY UPDATE "
+    "last_sequence = conversation_sequence.last_sequence + :count, "
+    "context_count = conversation_sequence.context_count + :context_count"
+)
+
 
 class ConversationRepository(BaseRepository):
     """
     对话历史仓储层
     """
 
+    @staticmethod
+    async def _allocate_sequences(
+        db: AsyncSession,
+        project_id: int,
+        count: int,
+        context_count: int = 0
+    ) -> Tuple[int, int]:
+        """
+        在当前事务中为工程原子分配 count 个连续的对话序号，并累加上下文消息计数
+
+        Args:
+            db: 数据库会话
+            project_id: 工程ID
+            count: 需要的序号数量
+            context_count: 本次新增的包含在上下文中的消息数
+
+        Returns:
+            (分配到的第一个序号, 累加后的上下文消息计数)
+        """
+        params = {"project_id": project_id, "count": count, "context_count": context_count}
+        result = await db.execute(_BUMP_SEQUENCE_SQL, params)
+        if result.rowcount == 0:
+            await db.execute(_SEED_SEQUENCE_SQL, params)
+
+        row = (await db.execute(
+            select(
+                ConversationSequenceDB.last_sequence,
+                ConversationSequenceDB.context_count
+            ).where(ConversationSequenceDB.project_id == project_id)
+        )).one()
+        return int(row.last_sequence) - count + 1, int(row.context_count)
+
+    @staticmethod
+    async def _trim_to(db: AsyncSession, project_id: int, max_context_messages: int) -> int:
+        """
+        在当前事务中把序号早于第 N 条最新上下文消息的记录移出上下文，并校准上下文消息计数
+
+        Args:
+            db: 数据库会话
+            project_id: 工程ID
+            max_context_messages: 保留在上下文中的最大消息数
+
+        Returns:
+            int: 从上下文中移除的记录数
+        """
+        cutoff_result = await db.execute(
+            select(ConversationHistoryDB.sequence).where(
+                ConversationHistoryDB.project_id == project_id,
+                ConversationHistoryDB.is_included_in_context == True
+            ).order_by(desc(ConversationHistoryDB.sequence)).offset(max(max_context_messages - 1, 0)).limit(1)
+        )
+        cutoff = cutoff_result.scalar()
+
+        removed = 0
+        if cutoff is not None:
+            update_result = await db.execute(
+                update(ConversationHistoryDB).where(
+                    ConversationHistoryDB.project_id == project_id,
+                    ConversationHistoryDB.is_included_in_context == True,
+                    ConversationHistoryDB.sequence < cutoff
+                ).values(is_included_in_context=False)
+            )
+            removed = update_result.rowcount or 0
+            remaining = max_context_messages
+        else:
+            remaining = (await db.execute(
+                select(func.count(ConversationHistoryDB.id)).where(
+                    ConversationHistoryDB.project_id == project_id,
+                    ConversationHistoryDB.is_included_in_context == True
+                )
+            )).scalar() or 0
+
+        await db.execute(
+            update(ConversationSequenceDB).where(
+                ConversationSequenceDB.project_id == project_id
+            ).values(context_count=remaining)
+        )
+        return removed
+
+    async def _maybe_trim(self, db: AsyncSession, project_id: int, context_count: int) -> int:
+        """
+        上下文消息计数超过上限加余量时才执行修剪，把修剪成本分摊到多次写入
+
+        Args:
+            db: 数据库会话
+            project_id: 工程ID
+            context_count: 当前上下文消息计数
+
+        Returns:
+            int: 从上下文中移除的记录数
+        """
+        max_context_messages = settings.CONTEXT_TRIM_MAX_MESSAGES
+        if max_context_messages <= 0 or context_count <= max_context_messages + settings.CONTEXT_TRIM_SLACK:
+            return 0
+        # 先把本事务中新增的消息写入，保证截断点包含它们
+        await db.flush()
+        removed = await self._trim_to(db, project_id, max_context_messages)
+        if removed:
+            logger.info("[ConversationRepository] 已修剪 project_id=%s 的 %d 条上下文消息", project_id, removed)
+        return removed
+
     async def create(
         self,
         project_id: int,
@@ -35,12 +163,10 @@ class ConversationRepository(BaseRepository):
         try:
             db = await self._ensure_session()
             
-            # 获取当前工程的最大序号
-            stmt = select(func.max(ConversationHistoryDB.sequence)).where(
-                ConversationHistoryDB.project_id == project_id
+            # 原子分配序号，避免并发写入时读取 max(sequence) 产生重复序号
+            sequence, context_count = await self._allocate_sequences(
+                db, project_id, 1, 1 if is_included_in_context else 0
             )
-            result = await db.execute(stmt)
-            max_sequence = result.scalar() or 0
             
             # 创建新消息记录
             new_message = ConversationHistoryDB(
@@ -49,10 +175,12 @@ class ConversationRepository(BaseRepository):
                 content=content,
                 priority=priority,
                 is_included_in_context=is_included_in_context,
-                sequence=max_sequence + 1
+                sequence=sequence,
+                token_count=count_tokens(content)
             )
             
             db.add(new_message)
+            await self._maybe_trim(db, project_id, context_count)
             await db.commit()
             await db.refresh(new_message)
             
@@ -60,6 +188,66 @@ class ConversationRepository(BaseRepository):
         finally:
             await self._cleanup_session()
 
+    async def create_turn(self, turn: ConversationTurnCreate) -> Optional[int]:
+        """
+        在一个事务中写入一轮对话的消息与思考过程
+
+        每轮对话单独提交：事务只锁定该工程的序号计数行，某一轮写入失败也不会影响其他轮次。
+        压缩的完整思考轨迹体积可能很大，不在此事务中写入，由调用方另行保存。
+
+        Args:
+            turn: 待写入的对话轮次
+
+        Returns:
+            Optional[int]: 思考过程ID，本轮没有思考过程时返回None
+        """
+        if not turn.messages:
+            return None
+        thinking_id = None
+        try:
+            db = await self._ensure_session()
+            try:
+                first_sequence, context_count = await self._allocate_sequences(
+                    db,
+                    turn.project_id,
+                    len(turn.messages),
+                    sum(1 for message in turn.messages if message.is_included_in_context)
+                )
+                records = [
+                    ConversationHistoryDB(
+                        project_id=turn.project_id,
+                        message_type=message.message_type,
+                        content=message.content,
+                        priority=message.priority,
+                        is_included_in_context=message.is_included_in_context,
+                        sequence=first_sequence + offset,
+                        token_count=count_tokens(message.content)
+                    )
+                    for offset, message in enumerate(turn.messages)
+                ]
+                db.add_all(records)
+
+                if turn.thinking:
+                    # flush 以获取思考过程需要关联的消息ID
+                    await db.flush()
+                    thinking = AssistantThinkingDB(
+                        project_id=turn.project_id,
+                        user_message_id=records[turn.thinking_message_index].id,
+                        content=turn.thinking
+                    )
+                    db.add(thinking)
+                    await db.flush()
+                    thinking_id = thinking.id
+
+                await self._maybe_trim(db, turn.project_id, context_count)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        finally:
+            await self._cleanup_session()
+        return thinking_id
+
     async def get_project_history(
         self,
         project_id: int,
@@ -94,6 +282,135 @@ class ConversationRepository(BaseRepository):
         finally:
             await self._cleanup_session()
 
+    async def get_context_window(
+        self,
+        project_id: int,
+        after_sequence: int = 0,
+        limit: int = 20,
+        min_priority: int = 2,
+        only_context: bool = True
+    ) -> List[Row]:
+        """
+        获取构建提示词上下文所需的最近消息（仅查询必要列）
+
+        Args:
+            project_id: 工程ID
+            after_sequence: 仅返回序号大于该值的消息（已被摘要覆盖的消息不再返回）
+            limit: 返回的最大记录数
+            min_priority: 最低优先级
+            only_context: 是否只返回包含在上下文中的消息；滚动摘要按序号读取，需要包含已被修剪的消息
+
+        Returns:
+            按序号倒序排列的 (id, message_type, content, token_count, sequence) 行
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(
+                ConversationHistoryDB.id,
+                ConversationHistoryDB.message_type,
+                ConversationHistoryDB.content,
+                ConversationHistoryDB.token_count,
+                ConversationHistoryDB.sequence
+            ).where(
+                ConversationHistoryDB.project_id == project_id,
+                ConversationHistoryDB.priority >= min_priority,
+                ConversationHistoryDB.sequence > after_sequence
+            )
+            if only_context:
+                query = query.where(ConversationHistoryDB.is_included_in_context == True)
+            query = query.order_by(desc(ConversationHistoryDB.sequence)).limit(limit)
+
+            result = await db.execute(query)
+            return list(result.all())
+        finally:
+            await self._cleanup_session()
+
+    async def get_unsummarized_stats(
+        self,
+        project_id: int,
+        after_sequence: int = 0,
+        min_priority: int = 2,
+        only_context: bool = True
+    ) -> Tuple[int, int]:
+        """
+        统计尚未被摘要覆盖的消息
+
+        Args:
+            project_id: 工程ID
+            after_sequence: 摘要已覆盖到的序号
+            min_priority: 最低优先级
+            only_context: 是否只统计包含在上下文中的消息
+
+        Returns:
+            (消息数, token 总数)
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(
+                func.count(ConversationHistoryDB.id),
+                func.coalesce(func.sum(ConversationHistoryDB.token_count), 0)
+            ).where(
+                ConversationHistoryDB.project_id == project_id,
+                ConversationHistoryDB.priority >= min_priority,
+                ConversationHistoryDB.sequence > after_sequence
+            )
+            if only_context:
+                query = query.where(ConversationHistoryDB.is_included_in_context == True)
+
+            result = await db.execute(query)
+            message_count, token_total = result.one()
+            return int(message_count or 0), int(token_total or 0)
+        finally:
+            await self._cleanup_session()
+
+    async def fill_missing_token_counts(
+        self,
+        project_id: int,
+        after_sequence: int = 0,
+        limit: int = 500
+    ) -> int:
+        """
+        为升级前写入、token_count 仍为 0 的消息补算 token 数
+
+        升级脚本新增的 token_count 列对已有消息默认为 0，不补算时按 token 总数触发的滚动摘要永远不会执行。
+        每次最多补算 limit 条，分词在线程中执行。
+
+        Args:
+            project_id: 工程ID
+            after_sequence: 仅处理序号大于该值的消息
+            limit: 单次补算的最大记录数
+
+        Returns:
+            int: 补算的记录数
+        """
+        try:
+            db = await self._ensure_session()
+
+            rows = (await db.execute(
+                select(ConversationHistoryDB.id, ConversationHistoryDB.content).where(
+                    ConversationHistoryDB.project_id == project_id,
+                    ConversationHistoryDB.sequence > after_sequence,
+                    ConversationHistoryDB.token_count == 0,
+                    ConversationHistoryDB.content != ""
+                ).order_by(ConversationHistoryDB.sequence).limit(limit)
+            )).all()
+            if not rows:
+                return 0
+
+            token_counts = await asyncio.to_thread(lambda: [count_tokens(row.content) for row in rows])
+            for row, token_count in zip(rows, token_counts):
+                await db.execute(
+                    update(ConversationHistoryDB).where(
+                        ConversationHistoryDB.id == row.id
+                    ).values(token_count=token_count)
+                )
+            await db.commit()
+            return len(rows)
+        finally:
+            await self._cleanup_session()
+
     async def trim_context_messages(
         self,
         project_id: int,
@@ -101,51 +418,61 @@ class ConversationRepository(BaseRepository):
     ) -> int:
         """
         修剪项目的上下文消息数量，保留最新的N条记录在上下文中
-        
+
+        写入对话时已按计数增量修剪，此方法用于手动或运维场景下立即修剪。
+
         Args:
             project_id: 工程ID
             max_context_messages: 保留在上下文中的最大消息数
-            
+
         Returns:
             int: 从上下文中移除的记录数
         """
         try:
             db = await self._ensure_session()
-            
-            # 获取项目中所有包含在上下文中的消息ID，按序号排序
-            context_query = select(
-                ConversationHistoryDB.id,
-                ConversationHistoryDB.sequence
-            ).where(
-                ConversationHistoryDB.project_id == project_id,
-                ConversationHistoryDB.is_included_in_context == True
-            ).order_by(desc(ConversationHistoryDB.sequence))
-            
-            context_result = await db.execute(context_query)
-            context_messages = context_result.all()
-            
-            # 如果消息数量没有超过限制，不需要修剪
-            if len(context_messages) <= max_context_messages:
-                return 0
-            
-            # 获取需要从上下文中移除的消息ID
-            messages_to_remove = context_messages[max_context_messages:]
-            ids_to_remove = [msg.id for msg in messages_to_remove]
-            
-            # 更新这些消息，将它们从上下文中移除
-            if ids_to_remove:
-                update_stmt = update(ConversationHistoryDB).where(
-                    ConversationHistoryDB.id.in_(ids_to_remove)
-                ).values(
-                    is_included_in_context=False
+            removed = await self._trim_to(db, project_id, max_context_messages)
+            await db.commit()
+            return removed
+        finally:
+            await self._cleanup_session()
+
+    async def _set_included_in_context(self, message_id: int, included: bool) -> bool:
+        """
+        修改消息是否包含在上下文中，并在同一事务中调整工程的上下文消息计数
+
+        Args:
+            message_id: 消息ID
+            included: 是否包含在上下文中
+
+        Returns:
+            bool: 消息是否存在
+        """
+        try:
+            db = await self._ensure_session()
+
+            project_id = (await db.execute(
+                select(ConversationHistoryDB.project_id).where(ConversationHistoryDB.id == message_id)
+            )).scalar()
+            if project_id is None:
+                return False
+
+            # 只更新状态确实发生变化的记录，计数按实际变化的行数调整
+            result = await db.execute(
+                update(ConversationHistoryDB).where(
+                    ConversationHistoryDB.id == message_id,
+                    ConversationHistoryDB.is_included_in_context == (not included)
+                ).values(is_included_in_context=included)
+            )
+            if result.rowcount:
+                delta = 1 if included else -1
+                await db.execute(
+                    update(ConversationSequenceDB).where(
+                        ConversationSequenceDB.project_id == project_id,
+                        ConversationSequenceDB.context_count + delta >= 0
+                    ).values(context_count=ConversationSequenceDB.context_count + delta)
                 )
-                
-                result = await db.execute(update_stmt)
-                await db.commit()
-                
-                return result.rowcount
-            
-            return 0
+            await db.commit()
+            return True
         finally:
             await self._cleanup_session()
 
@@ -162,22 +489,7 @@ class ConversationRepository(BaseRepository):
         Returns:
             bool: 操作是否成功
         """
-        try:
-            db = await self._ensure_session()
-            
-            # 更新消息状态，将其从上下文中排除
-            update_stmt = update(ConversationHistoryDB).where(
-                ConversationHistoryDB.id == message_id
-            ).values(
-                is_included_in_context=False
-            )
-            
-            result = await db.execute(update_stmt)
-            await db.commit()
-            
-            return result.rowcount > 0
-        finally:
-            await self._cleanup_session()
+        return await self._set_included_in_context(message_id, False)
 
     async def include_in_context(
         self,
@@ -192,19 +504,4 @@ class ConversationRepository(BaseRepository):
         Returns:
             bool: 操作是否成功
         """
-        try:
-            db = await self._ensure_session()
-            
-            # 更新消息状态，将其添加到上下文中
-            update_stmt = update(ConversationHistoryDB).where(
-                ConversationHistoryDB.id == message_id
-            ).values(
-                is_included_in_context=True
-            )
-            
-            result = await db.execute(update_stmt)
-            await db.commit()
-            
-            return result.rowcount > 0
-        finally:
-            await self._cleanup_session() 
\ No newline at end of file
+        return await self._set_included_in_context(message_id, True)
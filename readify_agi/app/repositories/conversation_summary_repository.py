@@ -0,0 +1,75 @@
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.core.token_counter import count_tokens
+from app.models.conversation_summary import ConversationSummaryDB
+from app.repositories import BaseRepository
+
+
+class ConversationSummaryRepository(BaseRepository):
+    """
+    对话滚动摘要仓储层
+    """
+
+    async def get_by_project(self, project_id: int) -> Optional[ConversationSummaryDB]:
+        """
+        获取项目的滚动摘要
+
+        Args:
+            project_id: 工程ID
+
+        Returns:
+            滚动摘要记录，如果不存在则返回None
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(ConversationSummaryDB).where(
+                ConversationSummaryDB.project_id == project_id
+            )
+
+            result = await db.execute(query)
+            return result.scalar_one_or_none()
+        finally:
+            await self._cleanup_session()
+
+    async def upsert(
+        self,
+        project_id: int,
+        content: str,
+        covered_sequence: int
+    ) -> ConversationSummaryDB:
+        """
+        创建或更新项目的滚动摘要
+
+        Args:
+            project_id: 工程ID
+            content: 摘要内容
+            covered_sequence: 摘要已覆盖到的对话序号（含）
+
+        Returns:
+            更新后的摘要记录
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(ConversationSummaryDB).where(
+                ConversationSummaryDB.project_id == project_id
+            )
+            result = await db.execute(query)
+            summary = result.scalar_one_or_none()
+
+            if summary is None:
+                summary = ConversationSummaryDB(project_id=project_id)
+                db.add(summary)
+            summary.content = content
+            summary.covered_sequence = covered_sequence
+            summary.token_count = count_tokens(content)
+
+            await db.commit()
+            await db.refresh(summary)
+
+            return summary
+        finally:
+            await self._cleanup_session()
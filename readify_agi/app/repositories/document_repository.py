@@ -1,5 +1,6 @@
 from typing import List, Optional, Tuple
 from sqlalchemy import select, update, func
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.document import DocumentDB, DocumentCreate
 from app.repositories import BaseRepository
@@ -95,6 +96,98 @@ class DocumentRepository(BaseRepository):
         finally:
             await self._cleanup_session()
             
+    async def get_window(
+        self,
+        file_id: int,
+        start_sequence: int,
+        end_sequence: Optional[int] = None,
+        limit: int = 20
+    ) -> List[Row]:
+        """
+        按序号窗口读取文档块（仅查询 id、sequence、content 列）
+
+        Args:
+            file_id: 文件ID
+            start_sequence: 起始序号（包含）
+            end_sequence: 结束序号（包含），为空时不限制
+            limit: 最多返回的文档块数
+
+        Returns:
+            按序号升序排列的 (id, sequence, content) 行
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(
+                DocumentDB.id,
+                DocumentDB.sequence,
+                DocumentDB.content
+            ).where(
+                DocumentDB.file_id == file_id,
+                DocumentDB.deleted == False,
+                DocumentDB.sequence >= start_sequence
+            )
+            if end_sequence is not None:
+                query = query.where(DocumentDB.sequence <= end_sequence)
+            query = query.order_by(DocumentDB.sequence).limit(limit)
+
+            result = await db.execute(query)
+            return list(result.all())
+        finally:
+            await self._cleanup_session()
+
+    async def get_sequence_bounds(self, file_id: int) -> Tuple[Optional[int], Optional[int], int]:
+        """
+        获取文件文档块的最小、最大序号与块数
+
+        Args:
+            file_id: 文件ID
+
+        Returns:
+            (最小序号, 最大序号, 块数)
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(
+                func.min(DocumentDB.sequence),
+                func.max(DocumentDB.sequence),
+                func.count(DocumentDB.id)
+            ).where(
+                DocumentDB.file_id == file_id,
+                DocumentDB.deleted == False
+            )
+            result = await db.execute(query)
+            min_sequence, max_sequence, count = result.one()
+            return min_sequence, max_sequence, int(count or 0)
+        finally:
+            await self._cleanup_session()
+
+    async def find_sequence_containing(self, file_id: int, text: str) -> Optional[int]:
+        """
+        查找包含指定文本片段的第一个文档块序号（用于定位向量检索命中的位置）
+
+        Args:
+            file_id: 文件ID
+            text: 文本片段
+
+        Returns:
+            Optional[int]: 文档块序号，未找到时返回 None
+        """
+        try:
+            db = await self._ensure_session()
+
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = select(DocumentDB.sequence).where(
+                DocumentDB.file_id == file_id,
+                DocumentDB.deleted == False,
+                DocumentDB.content.like(f"%{escaped}%", escape="\\")
+            ).order_by(DocumentDB.sequence).limit(1)
+            result = await db.execute(query)
+            return result.scalar()
+        finally:
+            await self._cleanup_session()
+
     async def get_by_id(self, document_id: int) -> Optional[DocumentDB]:
         """通过ID获取文档"""
         try:
@@ -1,12 +1,87 @@
-from typing import Optional, List, Dict
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, List, Dict, Tuple
+import threading
 import time
 
-from sqlalchemy import select, update
+from sqlalchemy import Integer, select, update, func, text
 from sqlalchemy.sql import and_
 
+from app.core.config import settings
 from app.models.mind_map_node import MindMapNodeDB, MindMapNodeTreeResponse, MindMapNodeCreate
 from app.repositories import BaseRepository
 
+if TYPE_CHECKING:
+    from app.services.mind_map_ops import MindMapChangeSet
+
+# 递归查询节点及其全部未删除的后代节点ID
+_SUBTREE_IDS_SQL = text(
+    "WITH RECURSIVE subtree (id) AS ("
+    "SELECT id FROM mind_map_node WHERE id = :node_id AND deleted = 0 "
+    "UNION ALL "
+    "SELECT child.id FROM mind_map_node child JOIN subtree ON child.parent_id = subtree.id "
+    "WHERE child.deleted = 0"
+    ") SELECT id FROM subtree"
+)
+
+# 大于该值的时间戳视为毫秒：本服务按秒写入 updated_time，Java 服务按毫秒写入
+_MILLISECOND_TIMESTAMP_THRESHOLD = 10 ** 11
+
+
+def _to_epoch_seconds(timestamp: int) -> int:
+    """把秒或毫秒时间戳统一换算为秒"""
+    return timestamp // 1000 if timestamp >= _MILLISECOND_TIMESTAMP_THRESHOLD else timestamp
+
+
+class MindMapTreeSnapshotCache:
+    """
+    进程内思维导图树快照缓存
+
+    本进程写入节点时递增该导图的本地版本；读取快照时同时校验数据库指纹
+    （行数、已删除行数、最大更新时间），以感知其他服务对节点的修改。
+    快照为共享对象，调用方不得修改。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._versions: Dict[int, int] = {}
+        self._snapshots: "OrderedDict[int, Tuple[int, Tuple, MindMapNodeTreeResponse]]" = OrderedDict()
+
+    def version(self, mind_map_id: int) -> int:
+        return self._versions.get(mind_map_id, 0)
+
+    def bump(self, mind_map_id: int) -> None:
+        with self._lock:
+            self._versions[mind_map_id] = self._versions.get(mind_map_id, 0) + 1
+            self._snapshots.pop(mind_map_id, None)
+
+    def get(self, mind_map_id: int, fingerprint: Tuple) -> Optional[MindMapNodeTreeResponse]:
+        with self._lock:
+            entry = self._snapshots.get(mind_map_id)
+            if entry is None:
+                return None
+            version, cached_fingerprint, tree = entry
+            if version != self.version(mind_map_id) or cached_fingerprint != fingerprint:
+                self._snapshots.pop(mind_map_id, None)
+                return None
+            self._snapshots.move_to_end(mind_map_id)
+            return tree
+
+    def put(self, mind_map_id: int, version: int, fingerprint: Tuple, tree: MindMapNodeTreeResponse) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            # 构建期间有本进程的写入时不缓存
+            if version != self.version(mind_map_id):
+                return
+            self._snapshots[mind_map_id] = (version, fingerprint, tree)
+            self._snapshots.move_to_end(mind_map_id)
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+
+
+_tree_snapshot_cache = MindMapTreeSnapshotCache(settings.MIND_MAP_TREE_CACHE_SIZE)
+
 
 class MindMapNodeRepository(BaseRepository):
     """思维导图节点仓储层"""
@@ -31,6 +106,7 @@ class MindMapNodeRepository(BaseRepository):
             db.add(db_node)
             await db.commit()
             await db.refresh(db_node)
+            _tree_snapshot_cache.bump(db_node.mind_map_id)
             return db_node
         finally:
             await self._cleanup_session()
@@ -98,6 +174,7 @@ class MindMapNodeRepository(BaseRepository):
             node.updated_time = int(time.time())
             await db.commit()
             await db.refresh(node)
+            _tree_snapshot_cache.bump(node.mind_map_id)
             return node
         finally:
             await self._cleanup_session()
@@ -122,29 +199,9 @@ class MindMapNodeRepository(BaseRepository):
 
             node_ids_to_delete = [node.id]
             if delete_descendants:
-                subtree_query = select(MindMapNodeDB).where(
-                    and_(
-                        MindMapNodeDB.mind_map_id == node.mind_map_id,
-                        MindMapNodeDB.deleted == False
-                    )
-                )
-                subtree_result = await db.execute(subtree_query)
-                nodes = subtree_result.scalars().all()
-
-                children_by_parent: Dict[int, List[int]] = {}
-                for item in nodes:
-                    if item.parent_id is not None:
-                        children_by_parent.setdefault(item.parent_id, []).append(item.id)
-
-                stack = [node.id]
-                seen = {node.id}
-                while stack:
-                    current_id = stack.pop()
-                    for child_id in children_by_parent.get(current_id, []):
-                        if child_id not in seen:
-                            seen.add(child_id)
-                            node_ids_to_delete.append(child_id)
-                            stack.append(child_id)
+                # 递归 CTE 只取出子树节点ID，无需加载整张导图
+                subtree_result = await db.execute(_SUBTREE_IDS_SQL, {"node_id": node.id})
+                node_ids_to_delete = [row[0] for row in subtree_result.all()]
 
             current_time = int(time.time())
             stmt = update(MindMapNodeDB).where(
@@ -156,6 +213,7 @@ class MindMapNodeRepository(BaseRepository):
             )
             await db.execute(stmt)
             await db.commit()
+            _tree_snapshot_cache.bump(node.mind_map_id)
 
             return {
                 "deleted_count": len(node_ids_to_delete),
@@ -164,68 +222,161 @@ class MindMapNodeRepository(BaseRepository):
         finally:
             await self._cleanup_session()
             
+    async def apply_change_set(
+        self,
+        mind_map_id: int,
+        project_id: Optional[int],
+        file_id: int,
+        change_set: "MindMapChangeSet"
+    ) -> Dict[str, int]:
+        """在单个事务中执行批量操作的变更集
+
+        新节点按层次分批插入，每批一次 flush 取回节点ID供下一批引用；
+        随后更新已有节点（父节点引用临时ID时替换为新节点ID），最后批量软删除。
+
+        Args:
+            mind_map_id: 思维导图ID
+            project_id: 工程ID
+            file_id: 文件ID
+            change_set: 校验通过的变更集
+
+        Returns:
+            临时ID到新节点ID的映射
+        """
+        try:
+            db = await self._ensure_session()
+            now = int(time.time())
+            ref_ids: Dict[str, int] = {}
+            try:
+                for wave in change_set.new_node_waves:
+                    created = [
+                        MindMapNodeDB(
+                            project_id=project_id,
+                            mind_map_id=mind_map_id,
+                            file_id=file_id,
+                            parent_id=ref_ids[new_node.parent_key] if isinstance(new_node.parent_key, str) else new_node.parent_key,
+                            content=new_node.content,
+                            sequence=new_node.sequence,
+                            level=new_node.level,
+                            created_time=now,
+                            updated_time=now
+                        )
+                        for new_node in wave
+                    ]
+                    db.add_all(created)
+                    await db.flush()
+                    for new_node, db_node in zip(wave, created):
+                        ref_ids[new_node.ref] = db_node.id
+
+                for node_id, changes in change_set.updates.items():
+                    values = dict(changes)
+                    if isinstance(values.get("parent_id"), str):
+                        values["parent_id"] = ref_ids[values["parent_id"]]
+                    await db.execute(
+                        update(MindMapNodeDB).where(
+                            MindMapNodeDB.id == node_id,
+                            MindMapNodeDB.deleted == False
+                        ).values(**values, updated_time=now)
+                    )
+
+                if change_set.deleted_ids:
+                    await db.execute(
+                        update(MindMapNodeDB).where(
+                            MindMapNodeDB.id.in_(change_set.deleted_ids),
+                            MindMapNodeDB.deleted == False
+                        ).values(deleted=True, updated_time=now)
+                    )
+
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            _tree_snapshot_cache.bump(mind_map_id)
+            return ref_ids
+        finally:
+            await self._cleanup_session()
+
+    async def _get_tree_fingerprint(self, mind_map_id: int) -> Tuple[int, int, int]:
+        """获取导图节点的数据库指纹：任何新增、修改或删除都会改变该值"""
+        try:
+            db = await self._ensure_session()
+            query = select(
+                func.count(MindMapNodeDB.id),
+                func.coalesce(func.sum(MindMapNodeDB.deleted, type_=Integer), 0),
+                func.coalesce(func.max(MindMapNodeDB.updated_time), 0)
+            ).where(MindMapNodeDB.mind_map_id == mind_map_id)
+            result = await db.execute(query)
+            total, deleted, max_updated_time = result.one()
+            return int(total), int(deleted), int(max_updated_time)
+        finally:
+            await self._cleanup_session()
+
     async def get_mind_map_tree(self, mind_map_id: int) -> MindMapNodeTreeResponse:
-        """获取完整的思维导图树形结构
-        
+        """获取完整的思维导图树形结构（优先返回未失效的快照）
+
         Args:
             mind_map_id: 思维导图ID
-            
+
         Returns:
-            树形结构的思维导图
+            树形结构的思维导图，快照为共享对象，调用方不得修改
         """
-        # 获取所有节点
+        version = _tree_snapshot_cache.version(mind_map_id)
+        fingerprint = await self._get_tree_fingerprint(mind_map_id)
+        tree = _tree_snapshot_cache.get(mind_map_id, fingerprint)
+        if tree is not None:
+            return tree
+
         nodes = await self.get_nodes_by_mind_map_id(mind_map_id)
-        if not nodes:
-            return None
-            
-        # 将节点列表转换为字典，方便查找
-        node_dict: Dict[int, MindMapNodeDB] = {node.id: node for node in nodes}
-        
-        # 找出根节点
-        root_nodes = [node for node in nodes if node.parent_id is None]
-        if not root_nodes:
-            return None
-        
-        # 构建树形结构
-        root_node = root_nodes[0]  # 取第一个根节点，通常思维导图只有一个根节点
-        tree = self._build_tree_recursively(root_node, node_dict)
-        
+        tree = self._build_tree(nodes)
+        # 最近一秒内有写入时，同一时间单位内的后续修改可能无法被指纹区分，暂不缓存
+        if tree is not None and _to_epoch_seconds(fingerprint[2]) < int(time.time()):
+            _tree_snapshot_cache.put(mind_map_id, version, fingerprint, tree)
         return tree
-        
-    def _build_tree_recursively(self, node: MindMapNodeDB, node_dict: Dict[int, MindMapNodeDB]) -> MindMapNodeTreeResponse:
-        """递归构建树形结构
-        
+
+    @staticmethod
+    def _build_tree(nodes: List[MindMapNodeDB]) -> Optional[MindMapNodeTreeResponse]:
+        """按父节点建立邻接表，一次遍历构建树形结构
+
         Args:
-            node: 当前节点
-            node_dict: 节点字典
-            
+            nodes: 导图的全部节点
+
         Returns:
-            树形结构的节点
+            树形结构的根节点，没有根节点时返回None
         """
-        # 创建当前节点的响应对象
-        tree_node = MindMapNodeTreeResponse(
-            id=node.id,
-            project_id=node.project_id,
-            mind_map_id=node.mind_map_id,
-            file_id=node.file_id,
-            parent_id=node.parent_id,
-            content=node.content,
-            sequence=node.sequence,
-            level=node.level,
-            created_time=node.created_time,
-            updated_time=node.updated_time,
-            children=[]
-        )
-        
-        # 查找当前节点的所有子节点
-        child_nodes = [n for n in node_dict.values() if n.parent_id == node.id]
-        
-        # 按顺序排序子节点
-        child_nodes.sort(key=lambda x: x.sequence)
-        
-        # 递归处理子节点
-        for child in child_nodes:
-            child_tree = self._build_tree_recursively(child, node_dict)
-            tree_node.children.append(child_tree)
-            
-        return tree_node 
+        if not nodes:
+            return None
+
+        tree_nodes: Dict[int, MindMapNodeTreeResponse] = {}
+        for node in nodes:
+            # 数据来自数据库，跳过校验直接构造
+            tree_nodes[node.id] = MindMapNodeTreeResponse.model_construct(
+                id=node.id,
+                project_id=node.project_id,
+                mind_map_id=node.mind_map_id,
+                file_id=node.file_id,
+                parent_id=node.parent_id,
+                content=node.content,
+                sequence=node.sequence,
+                level=node.level,
+                created_time=node.created_time,
+                updated_time=node.updated_time,
+                children=[]
+            )
+
+        root = None
+        for node in nodes:
+            tree_node = tree_nodes[node.id]
+            if node.parent_id is None:
+                # 取第一个根节点，通常思维导图只有一个根节点
+                if root is None:
+                    root = tree_node
+                continue
+            parent = tree_nodes.get(node.parent_id)
+            if parent is not None:
+                parent.children.append(tree_node)
+
+        for tree_node in tree_nodes.values():
+            if len(tree_node.children) > 1:
+                tree_node.children.sort(key=lambda x: x.sequence)
+
+        return root
@@ -1,9 +1,10 @@
 from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Integer, select, func
 from sqlalchemy.sql import and_
 import time
 
+from app.models.file import FileDB
 from app.models.project_file import ProjectFileDB, ProjectFileCreate
 from app.repositories import BaseRepository
 
@@ -60,4 +61,37 @@ class ProjectFileRepository(BaseRepository):
             result = await db.execute(query)
             return result.scalar_one_or_none()
         finally:
-            await self._cleanup_session() 
\ No newline at end of file
+            await self._cleanup_session()
+
+    async def get_content_version(self, project_id: int) -> str:
+        """
+        获取项目文件内容版本：文件增删、更新或向量化状态变化都会改变该值
+
+        Args:
+            project_id: 项目ID
+
+        Returns:
+            str: 内容版本标识
+        """
+        try:
+            db = await self._ensure_session()
+
+            query = select(
+                func.count(ProjectFileDB.id),
+                func.max(ProjectFileDB.update_time),
+                func.max(FileDB.update_time),
+                func.sum(FileDB.vectorized, type_=Integer)
+            ).select_from(ProjectFileDB).join(
+                FileDB, FileDB.id == ProjectFileDB.file_id
+            ).where(
+                and_(
+                    ProjectFileDB.project_id == project_id,
+                    ProjectFileDB.deleted == False,
+                    FileDB.deleted == False
+                )
+            )
+            result = await db.execute(query)
+            file_count, link_time, file_time, vectorized_count = result.one()
+            return f"{file_count or 0}:{link_time or 0}:{file_time or 0}:{int(vectorized_count or 0)}"
+        finally:
+            await self._cleanup_session()
@@ -0,0 +1,75 @@
+"""
+Agent 定义缓存 — 进程内复用已编译的提示词、工具与执行器
+
+/agent/stream 每次请求都会新建智能体实例，但提示词模板、工具 schema 与
+AgentExecutor 在请求之间并不变化。这里按 (智能体类型, 名称, 温度, 模板版本)
+缓存一次构建结果，请求级状态通过 AgentService 的上下文绑定传入工具。
+提示词模板刷新后缓存整体失效。
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AgentDefinition:
+    """可在请求间共享的 Agent 定义，不包含任何请求级状态"""
+    prompt_template: Optional[str]
+    system_prompt: Optional[str]
+    llm: Optional[BaseChatModel]
+    tools: List[BaseTool]
+    agent_executor: Optional[Runnable]
+
+
+class AgentDefinitionCache:
+    """Agent 定义缓存，同一缓存键的并发构建只执行一次"""
+
+    def __init__(self):
+        self._definitions: Dict[Tuple[Any, ...], AgentDefinition] = {}
+        self._locks: Dict[Tuple[Any, ...], asyncio.Lock] = {}
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[AgentDefinition]:
+        """按缓存键获取 Agent 定义，未命中返回 None"""
+        return self._definitions.get(key)
+
+    def put(self, key: Tuple[Any, ...], definition: AgentDefinition) -> None:
+        """写入 Agent 定义"""
+        self._definitions[key] = definition
+
+    def lock(self, key: Tuple[Any, ...]) -> asyncio.Lock:
+        """获取缓存键对应的构建锁"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def invalidate(self) -> None:
+        """清空全部 Agent 定义（提示词模板刷新时调用）"""
+        if self._definitions:
+            logger.info("提示词模板已刷新，清空 %d 个已缓存的 Agent 定义", len(self._definitions))
+        # 构建锁保留：正在进行的构建仍持有旧锁，换新锁会让并发请求重复构建同一定义
+        self._definitions.clear()
+
+    def __len__(self) -> int:
+        return len(self._definitions)
+
+
+_cache_instance: Optional[AgentDefinitionCache] = None
+
+
+def get_agent_definition_cache() -> AgentDefinitionCache:
+    """获取全局单例 AgentDefinitionCache，并注册提示词刷新时的失效回调"""
+    global _cache_instance
+    if _cache_instance is None:
+        from app.core.prompt_template_client import get_prompt_client
+        _cache_instance = AgentDefinitionCache()
+        get_prompt_client().add_refresh_listener(_cache_instance.invalidate)
+    return _cache_instance
@@ -1,24 +1,48 @@
-﻿import json
+﻿import asyncio
+import json
 import logging
-from typing import Dict, Any, List, Optional, Union, Callable, Awaitable
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union, Callable, Awaitable
 
-import dotenv
-from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain.agents import AgentExecutor
+from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import Runnable
+from langchain_core.runnables import Runnable, RunnablePassthrough
 from langchain_core.tools import BaseTool, tool
 from langchain_core.language_models import BaseChatModel
 
 from app.core.config import settings
 from app.core.llm_factory import create_chat_model
+from app.core.llm_usage import extract_usage
+from app.core.thinking_trace import ThinkingTrace
+from app.core.token_counter import count_tokens
+from app.core.tool_concurrency import limit_tool_concurrency
+from app.core.tracing import (
+    RequestTrace,
+    activate_trace,
+    deactivate_trace,
+    get_current_trace,
+    log_trace_summary,
+    trace_span,
+)
+from app.models.conversation import ConversationMessageCreate, ConversationTurnCreate
 from app.repositories.assistant_thinking_repository import AssistantThinkingRepository
 from app.repositories.conversation_repository import ConversationRepository
+from app.repositories.conversation_summary_repository import ConversationSummaryRepository
 from app.repositories.document_repository import DocumentRepository
 from app.repositories.file_repository import FileRepository
 from app.repositories.project_repository import ProjectRepository
+from app.services.agent_definition_cache import AgentDefinition, get_agent_definition_cache
+from app.services.conversation_persistence_service import get_conversation_persistence_service
 
 logger = logging.getLogger(__name__)
 
+# 当前请求绑定的智能体实例。
+# 工具与执行器随 Agent 定义在进程内共享，工具通过它读取请求级状态（项目、用户、回调等）。
+_active_agent: ContextVar[Optional["AgentService"]] = ContextVar("active_agent", default=None)
+
 
 def get_llm_config():
     """获取LLM配置，使用统一的配置项"""
@@ -68,11 +92,9 @@ class AgentService:
         # 是否保存思考过程到数据库
         self.should_save_thinking = True
         
-        # 加载环境变量
-        dotenv.load_dotenv()
-        
         # 初始化仓库，如果提供了db则传入，否则让仓库自己管理
         self.conversation_repo = ConversationRepository()
+        self.summary_repo = ConversationSummaryRepository()
         self.thinking_repo = AssistantThinkingRepository()
         self.document_repo = DocumentRepository()
         self.file_repo = FileRepository()
@@ -80,9 +102,12 @@ class AgentService:
         
         # 用于保存当前回调函数
         self._current_callback = None
+
+        # 由路由预先创建的请求追踪，覆盖提示词加载等请求开始前的步骤
+        self.request_trace: Optional[RequestTrace] = None
         
-        # 用于保存思考过程
-        self.all_thoughts = []
+        # 用于保存思考过程（内联文本有界，完整轨迹压缩保存）
+        self.all_thoughts = ThinkingTrace()
 
         # 缓存当前对话历史文本，供 search_files_tool 查询改写使用
         self._current_history_text = ""
@@ -93,9 +118,105 @@ class AgentService:
         if not self.project_id:
             raise ValueError("工程ID不能为空")
     
+    @contextmanager
+    def bind(self) -> Iterator["AgentService"]:
+        """
+        在当前上下文中把本实例绑定为活动智能体，run / generate_stream_response 执行期间自动绑定
+
+        Yields:
+            AgentService: 当前实例
+        """
+        token = _active_agent.set(self)
+        try:
+            yield self
+        finally:
+            _active_agent.reset(token)
+
+    def _bound(self) -> "AgentService":
+        """
+        返回当前请求绑定的智能体实例
+
+        工具在首次构建 Agent 定义时创建并被后续请求复用，
+        因此工具内部应通过此方法而非闭包中的 self 读取请求级状态。
+        闭包中的 self 属于构建定义的那次请求，回退到它会读到其他请求的项目、上下文与用户，
+        因此未绑定或绑定的智能体类型不符时直接抛出异常。
+
+        Raises:
+            RuntimeError: 当前上下文没有绑定同类型的智能体
+        """
+        agent = _active_agent.get()
+        if agent is None or type(agent) is not type(self):
+            raise RuntimeError(
+                f"{type(self).__name__} 的工具必须在已绑定智能体的上下文中调用"
+                f"（当前绑定: {type(agent).__name__ if agent is not None else '无'}）"
+            )
+        return agent
+
+    def _definition_cache_key(self) -> tuple:
+        """Agent 定义缓存键：智能体类型、名称、温度与提示词模板版本"""
+        from app.core.prompt_template_client import get_prompt_client
+        agent_type = f"{type(self).__module__}.{type(self).__qualname__}"
+        return agent_type, self.agent_name, self.temperature, get_prompt_client().version
+
     async def initialize(self) -> None:
         """
         初始化Agent，加载必要的组件
+
+        提示词、LLM、工具与执行器按缓存键在进程内只构建一次，后续请求直接复用。
+        """
+        cache = get_agent_definition_cache()
+        cache_key = self._definition_cache_key()
+        definition = cache.get(cache_key)
+        if definition is None:
+            async with cache.lock(cache_key):
+                definition = cache.get(cache_key)
+                if definition is None:
+                    with trace_span("build_definition", "prompt", agent=self.agent_name):
+                        definition = await self._build_definition()
+                    cache.put(cache_key, definition)
+                    logger.info("[AgentService] 已构建并缓存 Agent 定义: %s", self.agent_name)
+        self._apply_definition(definition)
+
+    def _apply_definition(self, definition: AgentDefinition) -> None:
+        """将共享的 Agent 定义挂载到当前实例"""
+        self.prompt_template = definition.prompt_template
+        self.system_prompt = definition.system_prompt
+        self.llm = definition.llm
+        self.tools = definition.tools
+        self.agent_executor = definition.agent_executor
+
+    def spawn(self) -> "AgentService":
+        """
+        创建一个与当前实例配置相同的新实例，直接复用已构建的 Agent 定义
+
+        同一请求内需要并发运行同一智能体的多个任务时使用，
+        新实例拥有独立的运行状态与仓库，使用完毕后需调用 aclose。
+
+        Returns:
+            AgentService: 新的智能体实例
+        """
+        clone = type(self)(
+            project_id=self.project_id,
+            context=dict(self.context),
+            temperature=self.temperature,
+            agent_name=self.agent_name,
+            description=self.description,
+        )
+        clone._apply_definition(AgentDefinition(
+            prompt_template=self.prompt_template,
+            system_prompt=self.system_prompt,
+            llm=self.llm,
+            tools=self.tools,
+            agent_executor=self.agent_executor,
+        ))
+        return clone
+
+    async def _build_definition(self) -> AgentDefinition:
+        """
+        构建 Agent 定义（缓存未命中时调用）
+
+        Returns:
+            AgentDefinition: 可在请求间共享的 Agent 定义
         """
         # 异步加载提示词模板（子类可重写）
         await self._load_prompt_template_async()
@@ -106,13 +227,21 @@ class AgentService:
         # 初始化LLM
         self.llm = self._create_llm()
 
-        # 加载工具
-        self.tools = await self._load_tools()
+        # 加载工具，并为工具加上按工具名的并发上限（同一轮的多个工具调用会并发执行）
+        self.tools = limit_tool_concurrency(await self._load_tools())
 
         # 创建Agent执行器
         if self.prompt_template or self.system_prompt:
             self.agent_executor = self._create_agent_executor()
 
+        return AgentDefinition(
+            prompt_template=self.prompt_template,
+            system_prompt=self.system_prompt,
+            llm=self.llm,
+            tools=self.tools,
+            agent_executor=self.agent_executor,
+        )
+
     async def _load_prompt_template_async(self):
         """异步模板加载钩子，子类重写以从远程或本地加载提示词模板"""
         pass
@@ -158,15 +287,95 @@ class AgentService:
         """
         config = get_llm_config()
         logger.info("[AgentService] 创建LLM实例，配置: %s", config)
-        return create_chat_model(temperature=self.temperature)
+        return create_chat_model(temperature=self.temperature, profile="agent")
 
     def _get_query_rewrite_service(self):
         """获取查询改写服务实例（延迟初始化）"""
         if self._query_rewrite_service is None:
-            from app.services.query_rewrite_service import QueryRewriteService
-            self._query_rewrite_service = QueryRewriteService()
+            from app.services.query_rewrite_service import get_query_rewrite_service
+            self._query_rewrite_service = get_query_rewrite_service()
         return self._query_rewrite_service
 
+    async def _vector_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        在当前项目中执行一次向量检索
+
+        Args:
+            query: 检索查询
+            top_k: 返回结果数量
+
+        Returns:
+            List[Dict[str, Any]]: 检索结果列表
+        """
+        from app.services.file_service import FileService
+        from app.services.vector_store_service import UserRole
+        file_service = FileService(self.file_repo)
+
+        # 从上下文中获取用户信息
+        user_id = self.context.get("user_id")
+        user_role = self.context.get("user_role", UserRole.USER)
+        logger.info("[search_files_tool] 调用 search_files_by_vector: project_id=%s, query=%s, top_k=%s, user_id=%s, user_role=%s",
+                    self.project_id, query, top_k, user_id, user_role)
+        with trace_span("vector_search", "retrieval", top_k=top_k):
+            return await file_service.search_files_by_vector(
+                project_id=self.project_id,
+                input_text=query,
+                top_k=top_k,
+                user_id=user_id,
+                user_role=user_role,
+            )
+
+    async def _search_with_rewrite(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        结合对话历史改写查询后检索
+
+        改写结果已缓存或查询可独立理解时不调用 LLM；推测模式下原始查询的检索与改写并发执行，
+        改写结果与原查询有实质差异时再检索改写查询并合并两组结果。
+
+        Args:
+            query: 原始检索查询
+            top_k: 返回结果数量
+
+        Returns:
+            List[Dict[str, Any]]: 检索结果列表
+        """
+        history = self._current_history_text
+        if not settings.QUERY_REWRITE_ENABLED or not history:
+            return await self._vector_search(query, top_k)
+
+        from app.services.query_rewrite_service import merge_search_results
+        rewrite_service = self._get_query_rewrite_service()
+        if not rewrite_service.needs_rewrite(query):
+            return await self._vector_search(query, top_k)
+
+        cached = rewrite_service.get_cached(query, history)
+        if cached is not None:
+            return await self._vector_search(cached, top_k)
+
+        if not settings.QUERY_REWRITE_SPECULATIVE:
+            rewritten = await rewrite_service.rewrite(query, history)
+            if rewritten != query:
+                logger.info("[search_files_tool] 查询已改写: '%s' -> '%s'", query, rewritten)
+            return await self._vector_search(rewritten, top_k)
+
+        original_task = asyncio.create_task(self._vector_search(query, top_k))
+        try:
+            rewritten = await rewrite_service.rewrite(query, history)
+        except asyncio.CancelledError:
+            original_task.cancel()
+            raise
+        except Exception as e:
+            logger.warning("[search_files_tool] 查询改写失败，使用原始查询: %s", str(e))
+            rewritten = query
+        original_results = await original_task
+
+        if not rewrite_service.is_material_change(query, rewritten):
+            return original_results
+
+        logger.info("[search_files_tool] 查询已改写，合并检索结果: '%s' -> '%s'", query, rewritten)
+        rewritten_results = await self._vector_search(rewritten, top_k)
+        return merge_search_results(original_results, rewritten_results, top_k)
+
     def _render_tools_for_prompt(self) -> str:
         """
         将当前可用工具渲染为适合注入提示词的文本。
@@ -241,6 +450,7 @@ class AgentService:
                 str: 格式化的搜索结果
             """
             logger.info("[search_files_tool] 开始执行，输入: %s", input_str)
+            agent = self._bound()
             try:
                 # 解析输入参数
                 params = json.loads(input_str) if isinstance(input_str, str) else input_str
@@ -255,42 +465,7 @@ class AgentService:
                     logger.warning("[search_files_tool] 查询为空")
                     return "错误: 搜索查询不能为空"
 
-                # 查询改写：结合对话历史改写查询以提升检索质量
-                if settings.QUERY_REWRITE_ENABLED and self._current_history_text:
-                    try:
-                        rewrite_service = self._get_query_rewrite_service()
-                        original_query = query
-                        query = await rewrite_service.rewrite(query, self._current_history_text)
-                        if query != original_query:
-                            logger.info("[search_files_tool] 查询已改写: '%s' -> '%s'",
-                                        original_query, query)
-                    except Exception as e:
-                        logger.warning("[search_files_tool] 查询改写失败，使用原始查询: %s", str(e))
-
-                # 使用当前实例的项目ID
-                project_id = self.project_id
-                logger.info("[search_files_tool] project_id=%s, context=%s", project_id, self.context)
-
-                # 使用文件仓库进行向量检索
-                from app.services.file_service import FileService
-                from app.services.vector_store_service import UserRole
-                file_service = FileService(self.file_repo)
-
-                # 从上下文中获取用户信息
-                user_id = self.context.get("user_id")
-                user_role = self.context.get("user_role", UserRole.USER)
-                logger.info("[search_files_tool] user_id=%s, user_role=%s", user_id, user_role)
-
-                # 执行向量检索
-                logger.info("[search_files_tool] 调用 search_files_by_vector: project_id=%s, query=%s, top_k=%s, user_id=%s, user_role=%s",
-                            project_id, query, top_k, user_id, user_role)
-                results = await file_service.search_files_by_vector(
-                    project_id=project_id,
-                    input_text=query,
-                    top_k=top_k,
-                    user_id=user_id,
-                    user_role=user_role,
-                )
+                results = await agent._search_with_rewrite(query, top_k)
                 logger.info("[search_files_tool] 检索返回 %d 条结果", len(results) if results else 0)
 
                 # 格式化结果
@@ -304,7 +479,7 @@ class AgentService:
                                  i, result.get('file_name'), result.get('distance'))
                     formatted_results.append(
                         f"结果 {i}:\n"
-                        f"文件: {result['file_name']}\n"
+                        f"文件: {result['file_name']} (ID: {result.get('file_id')})\n"
                         f"内容: {result['content']}\n"
                         f"相似度: {1 - result['distance']:.2f}\n"
                     )
@@ -377,10 +552,24 @@ class AgentService:
 
         prompt = ChatPromptTemplate.from_messages(messages)
 
-        return create_tool_calling_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=prompt
+        # 工具列表在定义构建时渲染进系统提示词，每次请求的系统提示词前缀保持不变，便于命中提示词缓存
+        if "available_tools" in prompt.input_variables:
+            prompt = prompt.partial(available_tools=self._render_tools_for_prompt())
+
+        # 与 create_tool_calling_agent 相同的结构；parallel_tool_calls 只在绑定了工具的请求上发送，
+        # 未携带 tools 的请求（如打标签、改写、摘要）带上该参数会被 OpenAI 接口拒绝
+        if self.tools:
+            llm_with_tools = self.llm.bind_tools(self.tools, parallel_tool_calls=settings.LLM_PARALLEL_TOOL_CALLS)
+        else:
+            llm_with_tools = self.llm.bind_tools(self.tools)
+
+        return (
+            RunnablePassthrough.assign(
+                agent_scratchpad=lambda x: format_to_tool_messages(x["intermediate_steps"]),
+            )
+            | prompt
+            | llm_with_tools
+            | ToolsAgentOutputParser()
         )
 
     async def run(self, input_text: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
@@ -400,7 +589,12 @@ class AgentService:
             
         if not self.agent_executor:
             raise ValueError("Agent执行器未初始化")
-            
+
+        with self.bind():
+            return await self._run_bound(input_text)
+
+    async def _run_bound(self, input_text: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """在已绑定当前实例的上下文中执行 run 的主体逻辑"""
         # 记录用户输入到对话历史
         task_content = input_text if isinstance(input_text, str) else input_text.get("input", "")
         await self.conversation_repo.create(
@@ -447,6 +641,7 @@ class AgentService:
         """显式关闭 Agent 持有的仓库会话，避免连接滞留到 GC 阶段。"""
         repo_names = [
             "conversation_repo",
+            "summary_repo",
             "thinking_repo",
             "document_repo",
             "file_repo",
@@ -490,58 +685,58 @@ class AgentService:
         max_messages: int = 20
     ) -> List[Dict[str, str]]:
         """
-        获取对话上下文，并根据token限制和优先级进行修剪
+        获取对话上下文：项目滚动摘要 + 摘要之后的最近消息，按 token 预算修剪
 
         Args:
             project_id: 工程ID
-            max_tokens: 最大允许的token数量
+            max_tokens: 最大允许的token数量（含摘要）
             max_messages: 最大消息数量限制
 
         Returns:
             格式化的上下文消息列表，可直接用于大模型输入
         """
-        # 从数据库获取标记为包含在上下文中的历史消息
-        # 注意：只包含system、user和assistant类型的消息，不包含assistant_thinking
-        messages = await self.conversation_repo.get_project_history(
+        # 对话写后持久化，先等待上一轮写完，避免上下文漏掉刚结束的问答
+        await get_conversation_persistence_service().wait_for_project(project_id)
+        summary = await self.summary_repo.get_by_project(project_id)
+        covered_sequence = summary.covered_sequence if summary else 0
+        remaining_tokens = max_tokens
+        if summary and summary.content:
+            remaining_tokens -= summary.token_count or count_tokens(summary.content)
+
+        # 仅查询高优先级、仍在上下文中且未被摘要覆盖的最近消息，按序号倒序返回
+        rows = await self.conversation_repo.get_context_window(
             project_id=project_id,
-            limit=max_messages * 2,  # 获取足够多的消息，以便后续筛选
-            only_context=True  # 仅获取标记为包含在上下文中的消息
+            after_sequence=covered_sequence,
+            limit=max_messages
         )
 
-        # 按照序号排序，确保对话顺序正确
-        messages.sort(key=lambda x: x.sequence)
+        # 从最新的消息往前累加，超出预算即停止，保证保留的是连续的最近对话
+        selected = []
+        for row in rows:
+            # 历史数据可能没有写入 token 数，按需计算
+            tokens = row.token_count or count_tokens(row.content)
+            if tokens > remaining_tokens:
+                break
+            remaining_tokens -= tokens
+            selected.append(row)
+        selected.reverse()
 
-        # 开始构建上下文，从最新的消息开始处理
         context = []
-        current_tokens = 0
-        message_count = 0
-
-        # 首先添加高优先级消息
-        high_priority_messages = [m for m in messages if m.priority > 1]
-        high_priority_messages.sort(key=lambda x: x.sequence)
-
-        for msg in high_priority_messages:
-            # 粗略估计token数量：按照每个字符大约对应0.5个token
-            estimated_tokens = len(msg.content) // 2
-
-            if current_tokens + estimated_tokens <= max_tokens and message_count < max_messages:
-                message_type = msg.message_type
-                role = "system"
-                if message_type == "user":
-                    role = "user"
-                elif message_type == "assistant":
-                    role = "assistant"
-
-                context.append({
-                    "role": role,
-                    "content": msg.content
-                })
-
-                current_tokens += estimated_tokens
-                message_count += 1
-            else:
-                # 如果添加该消息会超出限制，则跳过
-                continue
+        if summary and summary.content:
+            context.append({
+                "role": "system",
+                "content": f"此前对话摘要：\n{summary.content}"
+            })
+        for row in selected:
+            role = "system"
+            if row.message_type == "user":
+                role = "user"
+            elif row.message_type == "assistant":
+                role = "assistant"
+            context.append({
+                "role": role,
+                "content": row.content
+            })
         return context
     
     # 以下是新增的流式响应和事件处理方法
@@ -558,7 +753,7 @@ class AgentService:
             Dict[str, Any]: 传递给LLM的上下文数据
         """
         # 重置思考过程
-        self.all_thoughts = []
+        self.all_thoughts = ThinkingTrace()
         self._current_callback = callback
         
         # 获取项目信息
@@ -571,7 +766,9 @@ class AgentService:
         # 获取历史上下文
         history_text = ""
         context_messages = await self._get_conversation_context(
-            self.project_id, max_tokens=8000, max_messages=20
+            self.project_id,
+            max_tokens=settings.CONTEXT_MAX_TOKENS,
+            max_messages=settings.CONTEXT_MAX_MESSAGES
         )
         if context_messages:
             history_text = "对话历史：\n"
@@ -593,8 +790,9 @@ class AgentService:
             "project_id": self.project_id,
             "project_name": project_name,
             "project_description": project_description,
-            "context": json.dumps(self.context),
-            "available_tools": self._render_tools_for_prompt(),
+            # 固定键顺序，相同上下文渲染出相同文本，避免破坏提示词缓存前缀
+            # 工具列表已在构建 Agent 定义时通过 prompt.partial 渲染，这里不再逐请求传入
+            "context": json.dumps(self.context, ensure_ascii=False, sort_keys=True),
         }
     
     async def _handle_chain_end(self, event: Dict, callback: Callable, project_id: int, query: str) -> bool:
@@ -632,35 +830,27 @@ class AgentService:
 
             # 只有当should_save_thinking为True时才保存对话记录和思考过程
             if self.should_save_thinking:
-                # 保存用户问题和助手回答
+                # 用户问题、助手回答与思考过程交给后台队列在同一事务中写入，不阻塞响应结束
                 try:
-                    # 保存用户问题
-                    await self.conversation_repo.create(
+                    get_conversation_persistence_service().submit(ConversationTurnCreate(
                         project_id=project_id,
-                        message_type="user",
-                        content=query,
-                        priority=2,
-                        is_included_in_context=True
-                    )
-
-                    # 保存助手回答
-                    assist_message = await self.conversation_repo.create(
-                        project_id=project_id,
-                        message_type='assistant',
-                        content=final_answer,
-                        priority=2,
-                        is_included_in_context=True
-                    )
-
-                    # 保存思考过程
-                    if self.all_thoughts:
-                        complete_thinking = "".join(self.all_thoughts)
-
-                        await self.thinking_repo.create(
-                            project_id=project_id,
-                            user_message_id=assist_message.id,
-                            content=complete_thinking
-                        )
+                        messages=[
+                            ConversationMessageCreate(
+                                message_type="user",
+                                content=query,
+                                priority=2,
+                                is_included_in_context=True
+                            ),
+                            ConversationMessageCreate(
+                                message_type="assistant",
+                                content=final_answer,
+                                priority=2,
+                                is_included_in_context=True
+                            ),
+                        ],
+                        thinking_message_index=1,
+                        **self._thinking_fields()
+                    ))
                 except Exception as e:
                     await callback({
                         'type': 'system',
@@ -734,8 +924,8 @@ class AgentService:
             'agent_name': self.agent_name,
             'project_id': project_id
         })
-        # 收集工具输出（完整文本用于DB持久化）
-        self.all_thoughts.append(f"工具[{tool_name}]输出: {tool_output}\n")
+        # 收集工具输出：思考过程只保留摘要，完整文本进入压缩轨迹
+        self.all_thoughts.add_tool_output(tool_name, tool_output)
     
     async def _handle_tool_error(self, event: Dict, callback: Callable, project_id: int) -> None:
         """
@@ -808,35 +998,27 @@ class AgentService:
         # 记录错误
         self.all_thoughts.append(f"\n处理出错: {error_message}\n")
 
-        # 出错情况下也保存用户问题和错误信息
+        # 出错情况下也保存用户问题、错误信息（作为系统消息）与思考过程
         try:
-            # 保存用户问题
-            user_message = await self.conversation_repo.create(
+            get_conversation_persistence_service().submit(ConversationTurnCreate(
                 project_id=project_id,
-                message_type="user",
-                content=query,
-                priority=2,
-                is_included_in_context=True
-            )
-
-            # 保存错误信息作为系统消息
-            await self.conversation_repo.create(
-                project_id=project_id,
-                message_type="system",
-                content=f"错误: {error_message}",
-                priority=1,
-                is_included_in_context=False
-            )
-
-            # 保存思考过程
-            if self.all_thoughts:
-                complete_thinking = "".join(self.all_thoughts)
-
-                await self.thinking_repo.create(
-                    project_id=project_id,
-                    user_message_id=user_message.id,
-                    content=complete_thinking
-                )
+                messages=[
+                    ConversationMessageCreate(
+                        message_type="user",
+                        content=query,
+                        priority=2,
+                        is_included_in_context=True
+                    ),
+                    ConversationMessageCreate(
+                        message_type="system",
+                        content=f"错误: {error_message}",
+                        priority=1,
+                        is_included_in_context=False
+                    ),
+                ],
+                thinking_message_index=0,
+                **self._thinking_fields()
+            ))
         except Exception as e:
             await callback({
                 'type': 'system',
@@ -844,6 +1026,23 @@ class AgentService:
                 'project_id': project_id
             })
 
+    def _thinking_fields(self) -> Dict[str, Any]:
+        """
+        生成写入对话轮次的思考过程字段：有界的内联文本，以及被截断时的压缩完整轨迹
+
+        Returns:
+            Dict[str, Any]: ConversationTurnCreate 的思考过程相关字段
+        """
+        fields: Dict[str, Any] = {"thinking": self.all_thoughts.render() or None}
+        trace = self.all_thoughts.export_full()
+        if trace is not None:
+            fields.update(
+                thinking_trace=trace.data,
+                thinking_trace_codec=trace.codec,
+                thinking_trace_size=trace.raw_size
+            )
+        return fields
+
     @staticmethod
     def _extract_text_content(content) -> str:
         """
@@ -932,23 +1131,78 @@ class AgentService:
         if should_save_thinking is not None:
             self.should_save_thinking = should_save_thinking
         
-        try:
-            await self.validation()
-            # 响应生成前的准备工作
-            context = await self._before_generation(query, callback)
+        with self.bind():
+            trace, trace_token = self._enter_trace()
+            try:
+                await self.validation()
+                # 响应生成前的准备工作
+                with trace_span("before_generation", "db", agent=self.agent_name):
+                    context = await self._before_generation(query, callback)
             
-            # 开始生成响应
-            async for event in self.agent_executor.astream_events(context, version="v2"):
-                # 处理事件
-                completed = await self._handle_event(event, callback, self.project_id, query)
+                # 开始生成响应
+                async for event in self.agent_executor.astream_events(context, version="v2"):
+                    self._trace_event(event)
+                    # 处理事件
+                    completed = await self._handle_event(event, callback, self.project_id, query)
                 
-                # 如果已完成，退出循环
-                if completed:
-                    break
+                    # 如果已完成，退出循环
+                    if completed:
+                        break
                     
-        except Exception as e:
-            # 处理错误
-            await self._handle_error(e, callback, self.project_id, query)
+            except Exception as e:
+                # 处理错误
+                await self._handle_error(e, callback, self.project_id, query)
+            finally:
+                if trace_token is not None:
+                    await self._finish_trace(trace, trace_token, callback)
+
+    def _enter_trace(self) -> Tuple[Optional[RequestTrace], Optional[Token]]:
+        """
+        进入请求追踪：已有追踪（如被协调器委派）时沿用，否则创建并激活新的追踪
+
+        Returns:
+            Tuple[Optional[RequestTrace], Optional[Token]]: 追踪与激活 token，沿用已有追踪时 token 为 None
+        """
+        current = get_current_trace()
+        if current is not None or not settings.TRACING_ENABLED:
+            return current, None
+        trace = self.request_trace or RequestTrace()
+        return trace, activate_trace(trace)
+
+    def _trace_event(self, event: Dict) -> None:
+        """根据智能体事件记录 LLM 调用与工具调用的耗时"""
+        trace = get_current_trace()
+        run_id = event.get("run_id")
+        if trace is None or not run_id:
+            return
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            trace.begin(run_id, event.get("name") or "chat_model", "llm", agent=self.agent_name)
+        elif kind == "on_chat_model_stream":
+            trace.mark_first_token(run_id)
+        elif kind == "on_chat_model_end":
+            output = event.get("data", {}).get("output")
+            trace.finish_llm_span(run_id, extract_usage(getattr(output, "usage_metadata", None)))
+        elif kind == "on_tool_start":
+            trace.begin(run_id, event.get("name") or "tool", "tool", agent=self.agent_name)
+        elif kind == "on_tool_end":
+            trace.finish_span(run_id)
+        elif kind == "on_tool_error":
+            trace.finish_span(run_id, error=str(event.get("data", {}).get("error", ""))[:200])
+
+    async def _finish_trace(self, trace: RequestTrace, trace_token: Token, callback: Callable) -> None:
+        """结束请求追踪：输出日志、导出 OpenTelemetry，按需发送 debug_timing 事件"""
+        try:
+            trace.finish()
+            log_trace_summary(trace)
+            try:
+                trace.export_otel()
+            except Exception as e:
+                logger.warning("导出 OpenTelemetry 追踪失败: %s", str(e))
+            if settings.TRACING_DEBUG_EVENT_ENABLED or self.context.get("debug_timing"):
+                await callback(trace.to_event(self.project_id))
+        finally:
+            deactivate_trace(trace_token)
             
             
             
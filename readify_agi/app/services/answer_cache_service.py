@@ -0,0 +1,189 @@
+"""
+语义答案缓存 — 同一项目、同一权限范围内近似重复的问题直接返回此前的最终答案
+
+缓存按 (项目, 用户, 角色) 划分范围，条目记录问题向量、答案与写入时的项目文件内容版本；
+查询时先校验内容版本（文件增删、更新或向量化状态变化都会使旧条目失效），
+再以余弦相似度匹配，超过阈值即命中。依赖对话历史才能理解的追问不参与缓存。
+缓存保存在进程内存中，默认关闭（ANSWER_CACHE_ENABLED）。
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.config import settings
+from app.repositories.project_file_repository import ProjectFileRepository
+from app.services.query_rewrite_service import QueryRewriteService
+
+logger = logging.getLogger(__name__)
+
+ScopeKey = Tuple[int, Optional[int], str]
+
+
+@dataclass
+class AnswerCacheEntry:
+    """缓存条目"""
+    query: str
+    embedding: List[float]
+    answer: str
+    version: str
+    created_at: float
+
+
+@dataclass
+class AnswerCacheLookup:
+    """一次缓存查询的结果，未命中时保留向量与版本供写入复用"""
+    scope: ScopeKey
+    embedding: List[float]
+    version: str
+    entry: Optional[AnswerCacheEntry] = None
+    similarity: float = 0.0
+
+    @property
+    def hit(self) -> bool:
+        return self.entry is not None
+
+
+def _normalize_vector(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        return list(vector)
+    return [value / norm for value in vector]
+
+
+def _dot(left: List[float], right: List[float]) -> float:
+    return sum(a * b for a, b in zip(left, right))
+
+
+class AnswerCacheService:
+    """
+    进程内语义答案缓存，每个范围按最近使用顺序保留有限条目。
+    """
+
+    def __init__(self):
+        self._embeddings: Optional[OpenAIEmbeddings] = None
+        self._scopes: "OrderedDict[ScopeKey, List[AnswerCacheEntry]]" = OrderedDict()
+
+    def _get_embeddings(self) -> OpenAIEmbeddings:
+        if self._embeddings is None:
+            self._embeddings = OpenAIEmbeddings(
+                model=settings.EMBEDDING_MODEL,
+                api_key=settings.EMBEDDING_API_KEY,
+                base_url=settings.EMBEDDING_API_BASE,
+                check_embedding_ctx_length=False,
+            )
+        return self._embeddings
+
+    async def _embed(self, query: str) -> List[float]:
+        return _normalize_vector(await self._get_embeddings().aembed_query(query))
+
+    @staticmethod
+    async def _get_version(project_id: int) -> str:
+        repo = ProjectFileRepository()
+        try:
+            return await repo.get_content_version(project_id)
+        finally:
+            await repo.close()
+
+    @staticmethod
+    def is_cacheable(query: str) -> bool:
+        """
+        判断问题是否适合缓存：依赖对话历史的追问答案随上下文变化，不参与缓存
+
+        Args:
+            query: 用户问题
+
+        Returns:
+            bool: 是否可缓存
+        """
+        return bool(query and query.strip()) and not QueryRewriteService.needs_rewrite(query)
+
+    async def lookup(
+        self,
+        project_id: int,
+        user_id: Optional[int],
+        user_role: str,
+        query: str
+    ) -> AnswerCacheLookup:
+        """
+        查找与问题语义相近的已缓存答案
+
+        Args:
+            project_id: 项目ID
+            user_id: 用户ID
+            user_role: 用户角色
+            query: 用户问题
+
+        Returns:
+            AnswerCacheLookup: 查询结果，hit 为 True 时 entry 为命中的条目
+        """
+        scope: ScopeKey = (project_id, user_id, str(user_role))
+        version = await self._get_version(project_id)
+        embedding = await self._embed(query)
+        lookup = AnswerCacheLookup(scope=scope, embedding=embedding, version=version)
+
+        entries = self._scopes.get(scope)
+        if not entries:
+            return lookup
+
+        now = time.time()
+        entries[:] = [
+            entry for entry in entries
+            if entry.version == version and now - entry.created_at <= settings.ANSWER_CACHE_TTL
+        ]
+        best: Optional[AnswerCacheEntry] = None
+        best_score = 0.0
+        for entry in entries:
+            score = _dot(embedding, entry.embedding)
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best is not None and best_score >= settings.ANSWER_CACHE_SIMILARITY_THRESHOLD:
+            self._scopes.move_to_end(scope)
+            lookup.entry = best
+            lookup.similarity = best_score
+            logger.info(
+                "[AnswerCache] 命中缓存 project_id=%s, similarity=%.4f, query='%s', cached_query='%s'",
+                project_id, best_score, query, best.query,
+            )
+        return lookup
+
+    def store(self, lookup: AnswerCacheLookup, query: str, answer: str) -> None:
+        """
+        写入最终答案，复用查询时计算的向量与内容版本
+
+        Args:
+            lookup: 本次问题的缓存查询结果
+            query: 用户问题
+            answer: 最终答案
+        """
+        if not answer or not answer.strip():
+            return
+        entries = self._scopes.setdefault(lookup.scope, [])
+        entries.append(AnswerCacheEntry(
+            query=query,
+            embedding=lookup.embedding,
+            answer=answer,
+            version=lookup.version,
+            created_at=time.time(),
+        ))
+        if len(entries) > settings.ANSWER_CACHE_MAX_ENTRIES_PER_SCOPE:
+            del entries[:len(entries) - settings.ANSWER_CACHE_MAX_ENTRIES_PER_SCOPE]
+        self._scopes.move_to_end(lookup.scope)
+        while len(self._scopes) > settings.ANSWER_CACHE_MAX_SCOPES:
+            self._scopes.popitem(last=False)
+
+
+_service_instance: Optional[AnswerCacheService] = None
+
+
+def get_answer_cache_service() -> AnswerCacheService:
+    """获取全局单例 AnswerCacheService"""
+    global _service_instance
+    if _service_instance is None:
+        _service_instance = AnswerCacheService()
+    return _service_instance
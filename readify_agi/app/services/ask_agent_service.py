@@ -10,6 +10,7 @@ from app.config.agent_names import AgentNames
 from app.core.config import settings
 from app.repositories.project_file_repository import ProjectFileRepository
 from app.services.agent_service import AgentService
+from app.services.document_reader_service import DocumentReaderService
 
 logger = logging.getLogger(__name__)
 
@@ -80,10 +81,11 @@ class AskAgentService(AgentService):
             Returns:
                 str: JSON格式的文件列表信息
             """
+            agent = self._bound()
             try:
-                project_id = self.project_id
+                project_id = agent.project_id
 
-                file_ids = await self.project_file_repo.get_file_ids_by_project_id(
+                file_ids = await agent.project_file_repo.get_file_ids_by_project_id(
                     project_id=project_id
                 )
 
@@ -92,7 +94,7 @@ class AskAgentService(AgentService):
 
                 file_list = []
                 for file_id in file_ids:
-                    file = await self.file_repo.get_file_by_id(file_id=file_id)
+                    file = await agent.file_repo.get_file_by_id(file_id=file_id)
                     if file:
                         file_info = {
                             "id": file.id,
@@ -112,51 +114,101 @@ class AskAgentService(AgentService):
             except Exception as e:
                 return json.dumps({"error": f"获取文件列表时发生错误: {str(e)}"})
 
+        def _parse_params(input_str: Any) -> Dict[str, Any]:
+            params = json.loads(input_str) if isinstance(input_str, str) else input_str
+            if not isinstance(params, dict):
+                raise ValueError("参数必须为JSON对象")
+            if not params.get("file_id"):
+                raise ValueError("缺少必要参数: file_id")
+            try:
+                params["file_id"] = int(params["file_id"])
+            except (ValueError, TypeError):
+                raise ValueError("参数类型错误，file_id必须为整数")
+            return params
+
+        async def _run_read(input_str: Any, reader) -> str:
+            agent = self._bound()
+            try:
+                params = _parse_params(input_str)
+                file = await agent.file_repo.get_file_by_id(file_id=params["file_id"])
+                if not file:
+                    return json.dumps({"error": f"文件不存在 (ID: {params['file_id']})"}, ensure_ascii=False)
+                result = await reader(DocumentReaderService(agent.document_repo), params)
+                if not result["chunks"]:
+                    result["message"] = "指定范围内没有内容"
+                return json.dumps(result, ensure_ascii=False)
+            except json.JSONDecodeError:
+                return json.dumps({"error": "无效的JSON格式参数"}, ensure_ascii=False)
+            except ValueError as e:
+                return json.dumps({"error": str(e)}, ensure_ascii=False)
+            except Exception as e:
+                return json.dumps({"error": f"读取文件内容时发生错误: {str(e)}"}, ensure_ascii=False)
+
         @tool
         async def read_file_content(input_str: str) -> str:
             """
-            读取指定文件的全文内容，仅当文件小于1M时可用
+            按 token 预算从游标处连续读取文件内容，返回的 next_cursor 不为空时可传入继续读取
 
             Args:
-                input_str: 输入参数JSON字符串，格式为 {"file_id": 文件ID}
+                input_str: 输入参数JSON字符串，格式为 {"file_id": 文件ID, "cursor": 起始序号(可选), "max_tokens": token预算(可选)}
 
             Returns:
-                str: 文件的完整内容
+                str: JSON格式的文档块列表（sequence、content）、token_count、next_cursor 与 total_chunks
             """
-            try:
-                params = json.loads(input_str) if isinstance(input_str, str) else input_str
-
-                file_id = params.get("file_id")
+            async def reader(service: DocumentReaderService, params: Dict[str, Any]):
+                return await service.read_by_budget(
+                    file_id=params["file_id"],
+                    cursor=params.get("cursor"),
+                    max_tokens=params.get("max_tokens"),
+                )
 
-                if not file_id:
-                    return json.dumps({"error": "缺少必要参数: file_id"}, ensure_ascii=False)
+            return await _run_read(input_str, reader)
 
-                try:
-                    file_id = int(file_id)
-                except (ValueError, TypeError):
-                    return json.dumps({"error": "参数类型错误，file_id必须为整数"}, ensure_ascii=False)
+        @tool
+        async def read_document_range(input_str: str) -> str:
+            """
+            按文档块序号范围读取文件内容，超出 token 预算时截断并返回 next_cursor
 
-                file = await self.file_repo.get_file_by_id(file_id=file_id)
-                if not file:
-                    return json.dumps({"error": f"文件不存在 (ID: {file_id})"})
+            Args:
+                input_str: 输入参数JSON字符串，格式为 {"file_id": 文件ID, "start_sequence": 起始序号, "end_sequence": 结束序号, "max_tokens": token预算(可选)}
 
-                if file.size > 1000000:
-                    return json.dumps({"error": f"文件过大 (ID: {file_id})，请使用向量检索或分页阅读"})
+            Returns:
+                str: JSON格式的文档块列表、token_count 与 next_cursor
+            """
+            async def reader(service: DocumentReaderService, params: Dict[str, Any]):
+                if params.get("start_sequence") is None or params.get("end_sequence") is None:
+                    raise ValueError("缺少必要参数: start_sequence 和 end_sequence")
+                return await service.read_range(
+                    file_id=params["file_id"],
+                    start_sequence=int(params["start_sequence"]),
+                    end_sequence=int(params["end_sequence"]),
+                    max_tokens=params.get("max_tokens"),
+                )
 
-                documents = await self.document_repo.get_by_file_id(file_id=file_id)
+            return await _run_read(input_str, reader)
 
-                if not documents:
-                    return json.dumps({"error": f"文件存在但没有内容 (ID: {file_id})"})
+        @tool
+        async def read_document_neighbors(input_str: str) -> str:
+            """
+            读取检索命中位置前后的相邻文档块，用于补全语义检索结果的上下文
 
-                content_parts = [doc.content for doc in documents if doc.content]
+            Args:
+                input_str: 输入参数JSON字符串，格式为 {"file_id": 文件ID, "sequence": 命中序号(可选), "text": 命中的文本片段(未提供sequence时必填), "window": 前后各读取的块数(默认1)}
 
-                full_content = "\n".join(content_parts)
+            Returns:
+                str: JSON格式的命中序号 hit_sequence、文档块列表与 token_count
+            """
+            async def reader(service: DocumentReaderService, params: Dict[str, Any]):
+                sequence = params.get("sequence")
+                return await service.read_neighbors(
+                    file_id=params["file_id"],
+                    sequence=int(sequence) if sequence is not None else None,
+                    text=params.get("text"),
+                    window=params.get("window", 1),
+                    max_tokens=params.get("max_tokens"),
+                )
 
-                return full_content
-            except json.JSONDecodeError:
-                return json.dumps({"error": "无效的JSON格式参数"}, ensure_ascii=False)
-            except Exception as e:
-                return json.dumps({"error": f"读取文件内容时发生错误: {str(e)}"})
+            return await _run_read(input_str, reader)
 
         if search_tool:
             tools.append(
@@ -170,6 +222,8 @@ class AskAgentService(AgentService):
         tools.extend([
             list_project_files,
             read_file_content,
+            read_document_range,
+            read_document_neighbors,
         ])
 
         self.tools = tools
@@ -197,4 +251,4 @@ class AskAgentService(AgentService):
             'project_id': project_id
         })
 
-        self.all_thoughts.append(f"工具[{tool_name}]输出: {tool_output}\n")
+        self.all_thoughts.add_tool_output(tool_name, tool_output)
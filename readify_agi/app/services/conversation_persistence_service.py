@@ -0,0 +1,205 @@
+"""
+对话写后持久化服务 — 把对话消息与思考过程的写库移出流式响应的关键路径
+
+智能体产出最终答案后只把本轮对话放入队列即可结束响应；后台工作协程批量取出队列中的
+对话轮次，按工程ID升序逐轮写入（每轮一个事务），之后触发滚动摘要检查。
+某一轮重试后仍写入失败时只把该轮记入死信日志，不影响同批的其他轮次。
+读取对话上下文前调用 wait_for_project 等待该工程已提交的轮次写完，下一问不会漏掉刚结束的一轮。
+应用关闭时会把队列中剩余的数据全部写完。
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.models.conversation import ConversationTurnCreate
+from app.repositories.assistant_thinking_repository import AssistantThinkingRepository
+from app.repositories.conversation_repository import ConversationRepository
+
+logger = logging.getLogger(__name__)
+# 重试后仍写入失败的对话轮次，以 JSON 记录完整内容，便于人工补录
+dead_letter_logger = logging.getLogger(f"{__name__}.dead_letter")
+
+
+class ConversationPersistenceService:
+    """
+    对话写后持久化服务，单个后台工作协程按批取出、逐轮写入，写入失败按配置重试。
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # 工程ID -> 尚未写完的轮数；该工程的轮次全部写完时置位对应事件
+        self._pending: Dict[int, int] = {}
+        self._idle: Dict[int, asyncio.Event] = {}
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """在当前事件循环上懒启动队列与工作协程"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return self._queue
+
+    def submit(self, turn: ConversationTurnCreate) -> None:
+        """
+        提交一轮对话等待写入，不阻塞调用方
+
+        Args:
+            turn: 待写入的对话轮次
+        """
+        queue = self._ensure_worker()
+        self._pending[turn.project_id] = self._pending.get(turn.project_id, 0) + 1
+        self._idle.setdefault(turn.project_id, asyncio.Event())
+        queue.put_nowait(turn)
+
+    def _mark_done(self, project_id: int) -> None:
+        """一轮写入结束（成功或记入死信），该工程没有待写轮次时唤醒等待方"""
+        remaining = self._pending.get(project_id, 0) - 1
+        if remaining > 0:
+            self._pending[project_id] = remaining
+            return
+        self._pending.pop(project_id, None)
+        event = self._idle.pop(project_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait_for_project(self, project_id: int, timeout: Optional[float] = None) -> bool:
+        """
+        等待工程已提交的对话轮次全部写完
+
+        Args:
+            project_id: 工程ID
+            timeout: 最长等待秒数，默认 CONVERSATION_PERSIST_WAIT_TIMEOUT
+
+        Returns:
+            bool: 是否已全部写完；超时返回 False
+        """
+        event = self._idle.get(project_id)
+        if event is None:
+            return True
+        timeout = settings.CONVERSATION_PERSIST_WAIT_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("[ConversationPersistence] 等待对话写入超时，project_id=%s，待写入 %d 轮",
+                           project_id, self._pending.get(project_id, 0))
+            return False
+
+    async def _run(self) -> None:
+        """工作协程：取出一批对话轮次并写入"""
+        queue = self._queue
+        while True:
+            turn = await queue.get()
+            batch: List[ConversationTurnCreate] = [turn]
+            while len(batch) < settings.CONVERSATION_PERSIST_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._write_batch(batch)
+            finally:
+                for item in batch:
+                    self._mark_done(item.project_id)
+                    queue.task_done()
+
+    async def _write_batch(self, batch: List[ConversationTurnCreate]) -> None:
+        """按工程ID升序逐轮写入一批对话轮次，写入成功的工程触发后续处理"""
+        written: List[ConversationTurnCreate] = []
+        # sorted 是稳定排序，同一工程内的轮次保持提交顺序
+        for turn in sorted(batch, key=lambda item: item.project_id):
+            if await self._write_turn(turn):
+                written.append(turn)
+        if written:
+            self._after_write(written)
+
+    async def _write_turn(self, turn: ConversationTurnCreate) -> bool:
+        """
+        写入一轮对话，失败时重试，最终失败记入死信日志
+
+        Returns:
+            bool: 是否写入成功
+        """
+        max_attempts = max(settings.CONVERSATION_PERSIST_MAX_RETRIES, 0) + 1
+        for attempt in range(1, max_attempts + 1):
+            repo = ConversationRepository()
+            try:
+                thinking_id = await repo.create_turn(turn)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if attempt >= max_attempts:
+                    logger.exception("[ConversationPersistence] 写入对话失败，已记入死信日志，project_id=%s", turn.project_id)
+                    dead_letter_logger.error(turn.model_dump_json(exclude={"thinking_trace"}))
+                    return False
+                logger.warning("[ConversationPersistence] 写入对话失败，第 %d 次重试", attempt, exc_info=True)
+                await asyncio.sleep(0.5 * attempt)
+            finally:
+                await repo.close()
+
+        if turn.thinking_trace and thinking_id is not None:
+            await self._write_trace(turn, thinking_id)
+        return True
+
+    @staticmethod
+    async def _write_trace(turn: ConversationTurnCreate, thinking_id: int) -> None:
+        """
+        单独保存压缩的完整思考轨迹，失败只记录日志
+
+        轨迹可能达到数 MB，单独写入避免超大数据包影响对话本身的写入；
+        保存失败时仍可读取思考过程的内联文本。
+        """
+        repo = AssistantThinkingRepository()
+        try:
+            await repo.save_trace(
+                thinking_id=thinking_id,
+                project_id=turn.project_id,
+                codec=turn.thinking_trace_codec,
+                raw_size=turn.thinking_trace_size,
+                content=turn.thinking_trace,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(
+                "[ConversationPersistence] 保存完整思考轨迹失败，thinking_id=%s，raw_size=%d",
+                thinking_id,
+                turn.thinking_trace_size,
+            )
+        finally:
+            await repo.close()
+
+    @staticmethod
+    def _after_write(batch: List[ConversationTurnCreate]) -> None:
+        """写入完成后的后续处理：检查是否需要更新滚动摘要"""
+        from app.services.conversation_summary_service import get_conversation_summary_service
+        summary_service = get_conversation_summary_service()
+        for project_id in {turn.project_id for turn in batch}:
+            summary_service.schedule(project_id)
+
+    async def flush(self) -> None:
+        """等待队列中已提交的对话全部写入"""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def aclose(self) -> None:
+        """写完剩余数据并停止工作协程（应用关闭时调用）"""
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+_service_instance: Optional[ConversationPersistenceService] = None
+
+
+def get_conversation_persistence_service() -> ConversationPersistenceService:
+    """获取全局单例 ConversationPersistenceService"""
+    global _service_instance
+    if _service_instance is None:
+        _service_instance = ConversationPersistenceService()
+    return _service_instance
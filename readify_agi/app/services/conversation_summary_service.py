@@ -0,0 +1,201 @@
+"""
+对话滚动摘要服务 — 在后台把较早的对话压缩为每个项目一份的滚动摘要
+
+未被摘要覆盖的消息 token 总数超过阈值时，保留最近若干条消息，
+把更早的消息连同已有摘要交给 LLM 合并为新摘要，并记录摘要覆盖到的对话序号。
+构建提示词上下文时只需读取摘要 + 覆盖序号之后的最近消息。
+
+摘要按序号读取消息，不看 is_included_in_context：写入时的增量修剪可能在摘要覆盖之前
+就把较早的消息移出上下文，这些消息仍需进入摘要，否则会同时从上下文和摘要中丢失。
+
+提示词模板优先从 readify_eval 加载（template_code='conversation_summary'，变量 summary、history），
+未配置时使用内置模板。
+"""
+import asyncio
+import logging
+from typing import Optional, Set, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.core.llm_factory import create_chat_model
+from app.core.token_counter import count_tokens
+from app.repositories.conversation_repository import ConversationRepository
+from app.repositories.conversation_summary_repository import ConversationSummaryRepository
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_SYSTEM_PROMPT = "你是对话记录整理助手，负责把多轮对话压缩为供后续对话参考的摘要。"
+
+_DEFAULT_USER_PROMPT = """请将已有摘要与新增对话合并为一份新的摘要。
+要求：
+1. 保留用户的目标、关键问题、已得出的结论、涉及的文件与具体数据；
+2. 删除寒暄和重复内容，不要编造对话中没有的信息；
+3. 使用简洁的中文条目输出，只输出摘要本身。
+
+已有摘要：
+{summary}
+
+新增对话：
+{history}"""
+
+_ROLE_NAMES = {"user": "用户", "assistant": "助手"}
+
+
+class ConversationSummaryService:
+    """
+    对话滚动摘要服务，摘要任务在后台执行，同一项目同一时间只运行一个任务。
+    """
+
+    def __init__(self, temperature: float = 0.2):
+        self.temperature = temperature
+        self._llm: Optional[BaseChatModel] = None
+        self._prompts: Optional[Tuple[Optional[str], str]] = None
+        self._running_projects: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get_llm(self) -> BaseChatModel:
+        if self._llm is None:
+            self._llm = create_chat_model(
+                temperature=self.temperature,
+                max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+                profile="summary",
+            )
+        return self._llm
+
+    async def _load_prompts(self) -> Tuple[Optional[str], str]:
+        """加载摘要提示词，eval 中未配置时使用内置模板"""
+        if self._prompts is not None:
+            return self._prompts
+
+        from app.core.prompt_template_client import get_prompt_client
+        client = get_prompt_client()
+        try:
+            user_template = await client.get_template("conversation_summary")
+            system_prompt = await client.get_system_prompt("conversation_summary")
+            logger.info("[ConversationSummary] 成功从 eval 数据库加载摘要提示词模板")
+        except (KeyError, RuntimeError) as e:
+            logger.info("[ConversationSummary] 未加载到 eval 摘要模板，使用内置模板: %s", str(e))
+            user_template, system_prompt = _DEFAULT_USER_PROMPT, _DEFAULT_SYSTEM_PROMPT
+        self._prompts = (system_prompt, user_template)
+        return self._prompts
+
+    def schedule(self, project_id: int) -> None:
+        """
+        检查并在后台更新项目摘要，不阻塞调用方
+
+        Args:
+            project_id: 工程ID
+        """
+        if not settings.CONVERSATION_SUMMARY_ENABLED or project_id in self._running_projects:
+            return
+        self._running_projects.add(project_id)
+        task = asyncio.create_task(self._summarize_if_needed(project_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize_if_needed(self, project_id: int) -> None:
+        """未摘要的上下文超过阈值时，合并较早的消息到滚动摘要"""
+        summary_repo = ConversationSummaryRepository()
+        conversation_repo = ConversationRepository()
+        keep_recent = settings.CONVERSATION_SUMMARY_KEEP_RECENT
+        try:
+            summary = await summary_repo.get_by_project(project_id)
+            covered_sequence = summary.covered_sequence if summary else 0
+
+            # 升级前的消息 token_count 为 0，先补算，否则 token 总数达不到触发阈值
+            filled = await conversation_repo.fill_missing_token_counts(project_id, after_sequence=covered_sequence)
+            if filled:
+                logger.info("[ConversationSummary] 已为 project_id=%s 的 %d 条历史消息补算 token 数", project_id, filled)
+
+            message_count, token_total = await conversation_repo.get_unsummarized_stats(
+                project_id, after_sequence=covered_sequence, only_context=False
+            )
+            if token_total < settings.CONVERSATION_SUMMARY_TRIGGER_TOKENS or message_count <= keep_recent:
+                return
+
+            rows = await conversation_repo.get_context_window(
+                project_id, after_sequence=covered_sequence, limit=message_count, only_context=False
+            )
+            rows = list(reversed(rows))
+            to_summarize = self._take_batch(rows[:-keep_recent] if keep_recent > 0 else rows)
+            if not to_summarize:
+                return
+
+            history = "\n".join(
+                f"{_ROLE_NAMES.get(row.message_type, '系统')}: {row.content}" for row in to_summarize
+            )
+            system_prompt, user_template = await self._load_prompts()
+            user_text = user_template.format(
+                summary=summary.content if summary else "无",
+                history=history,
+            )
+
+            messages = []
+            if system_prompt:
+                messages.append(SystemMessage(content=system_prompt))
+            messages.append(HumanMessage(content=user_text))
+            response = await self._get_llm().ainvoke(messages)
+            content = response.content
+            if isinstance(content, list):
+                content = "".join(
+                    block.get("text", "") if isinstance(block, dict) else str(block) for block in content
+                )
+            content = (content or "").strip()
+            if not content:
+                logger.warning("[ConversationSummary] LLM 返回空摘要，project_id=%s", project_id)
+                return
+
+            await summary_repo.upsert(
+                project_id=project_id,
+                content=content,
+                covered_sequence=to_summarize[-1].sequence,
+            )
+            logger.info(
+                "[ConversationSummary] 已更新项目摘要 project_id=%s, 覆盖 %d 条消息至序号 %s",
+                project_id,
+                len(to_summarize),
+                to_summarize[-1].sequence,
+            )
+        except Exception:
+            logger.exception("[ConversationSummary] 更新项目摘要失败 project_id=%s", project_id)
+        finally:
+            self._running_projects.discard(project_id)
+            await summary_repo.close()
+            await conversation_repo.close()
+
+    @staticmethod
+    def _take_batch(rows: list) -> list:
+        """
+        从最早的消息起取出本次合并的一批，token 总数不超过触发阈值的 2 倍
+
+        积压较多时（如启用摘要前已被移出上下文的历史）随后续对话写入分批合并，单次调用的输入保持有界。
+        """
+        budget = settings.CONVERSATION_SUMMARY_TRIGGER_TOKENS * 2
+        batch = []
+        for row in rows:
+            budget -= row.token_count or count_tokens(row.content)
+            if batch and budget < 0:
+                break
+            batch.append(row)
+        return batch
+
+    async def aclose(self) -> None:
+        """取消尚未完成的摘要任务（应用关闭时调用）"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_service_instance: Optional[ConversationSummaryService] = None
+
+
+def get_conversation_summary_service() -> ConversationSummaryService:
+    """获取全局单例 ConversationSummaryService"""
+    global _service_instance
+    if _service_instance is None:
+        _service_instance = ConversationSummaryService()
+    return _service_instance
@@ -1,13 +1,18 @@
+import asyncio
 import json
 import logging
 
-from typing import Dict, Any, Callable, List, Optional, Literal, Tuple
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Literal, Tuple
 
 from langchain_core.tools import BaseTool, tool
 from pydantic import BaseModel, Field
 
 from app.config.agent_names import AgentNames
+from app.core.config import settings
+from app.core.tracing import trace_span
+from app.models.conversation import ConversationMessageCreate, ConversationTurnCreate
 from app.services.agent_service import AgentService
+from app.services.conversation_persistence_service import get_conversation_persistence_service
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +35,34 @@ class DelegateTaskInput(BaseModel):
     )
 
 
+class DelegateSubtask(BaseModel):
+    """delegate_tasks 中单个子任务的定义。"""
+
+    agent_name: Optional[str] = Field(
+        default=None,
+        description="要委派的专业智能体名称，例如 QUESTIONER 或 NOTE_AGENT。",
+    )
+    task_type: Optional[Literal["ask", "note"]] = Field(
+        default=None,
+        description="任务类型。可选值为 ask 或 note，可作为 agent_name 的辅助或回退选择。",
+    )
+    task: str = Field(
+        ...,
+        min_length=1,
+        description="子任务的具体描述，必须包含完整上下文，不能依赖其他子任务的结果。",
+    )
+
+
+class DelegateTasksInput(BaseModel):
+    """delegate_tasks 的结构化参数定义。"""
+
+    subtasks: List[DelegateSubtask] = Field(
+        ...,
+        min_length=1,
+        description="相互独立、可同时执行的子任务列表。",
+    )
+
+
 class CoordinatorAgentService(AgentService):
     """
     协调Agent服务，用于管理和协调多个专业Agent进行协作
@@ -132,6 +165,164 @@ class CoordinatorAgentService(AgentService):
 
         return None, None
 
+    async def _run_delegation(
+        self,
+        task: str,
+        agent_name: Optional[str],
+        task_type: Optional[str],
+        thoughts: List[str],
+        subtask_id: Optional[int] = None,
+        spawn: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        将单个任务委派给专业智能体并收集其结果
+
+        Args:
+            task: 任务描述
+            agent_name: 目标智能体名称
+            task_type: 任务类型，作为 agent_name 的回退
+            thoughts: 本次委派过程文本的写入位置
+            subtask_id: 批量委派时的子任务序号，会附加到转发给前端的事件上
+            spawn: 是否使用新建的智能体实例执行（并发委派同一智能体时必须为 True）
+
+        Returns:
+            Dict[str, Any]: 委派结果；无法解析目标智能体时返回包含 error 的字典
+        """
+        resolved_agent_name, agent = self._resolve_agent_name(agent_name=agent_name, task_type=task_type)
+
+        if not resolved_agent_name:
+            if agent_name:
+                return {"error": f"错误: 未找到名为 '{agent_name}' 的智能体"}
+            return {"error": "错误: 未指定可解析的智能体，请提供 agent_name 或可用的 task_type"}
+        if not agent:
+            return {"error": f"错误: 智能体 '{resolved_agent_name}' 当前不可用"}
+
+        self.last_task_status["current_agent"] = resolved_agent_name
+        history_entry = {
+            "agent": resolved_agent_name,
+            "task_type": task_type,
+            "task": task,
+            "completed": False
+        }
+        if subtask_id is not None:
+            history_entry["subtask_id"] = subtask_id
+        self.last_task_status["task_history"].append(history_entry)
+
+        main_callback = self._current_callback
+        event_tags = {} if subtask_id is None else {"subtask_id": subtask_id}
+
+        if main_callback:
+            await main_callback({
+                'type': 'delegation_start',
+                'content': f'正在将任务委派给 {resolved_agent_name}...',
+                'delegate_to': resolved_agent_name,
+                'task_type': task_type,
+                'task': task[:200],
+                'project_id': self.project_id,
+                **event_tags
+            })
+            thoughts.append(f"\n--- 委派任务给 {resolved_agent_name}: {task} ---\n")
+
+        result = {"output": "子智能体未返回有效结果"}
+
+        if hasattr(agent, 'generate_stream_response'):
+            collected_output = []
+            sub_agent_thoughts = []
+
+            async def forward_callback(data):
+                """转发子Agent事件到主SSE流，同时收集结果"""
+                content_type = data.get('type', '')
+                content = data.get('content', '')
+
+                if content_type == "thought":
+                    sub_agent_thoughts.append(content)
+
+                if content_type == 'final_answer' and content:
+                    collected_output.append(content)
+                    return
+
+                if main_callback and content_type not in ('final_answer', '[DONE]', 'system', 'thought'):
+                    await main_callback({**data, **event_tags} if event_tags else data)
+
+            runner = agent.spawn() if spawn else agent
+            try:
+                with trace_span(resolved_agent_name, "delegation", **event_tags):
+                    await runner.generate_stream_response(
+                        query=task,
+                        callback=forward_callback,
+                        should_save_thinking=False
+                    )
+            finally:
+                if runner is not agent:
+                    await runner.aclose()
+
+            if sub_agent_thoughts:
+                sub_agent_thought_content = "".join(sub_agent_thoughts)
+                thoughts.append(f"\n{sub_agent_thought_content}\n")
+
+            result_output = "\n".join(collected_output) if collected_output else "子智能体未返回有效结果"
+            result = {"output": result_output}
+
+        if main_callback:
+            summary = result.get("output", "")[:200]
+            await main_callback({
+                'type': 'delegation_end',
+                'content': f'{resolved_agent_name} 已完成任务',
+                'delegate_to': resolved_agent_name,
+                'task_type': task_type,
+                'summary': summary,
+                'project_id': self.project_id,
+                **event_tags
+            })
+            thoughts.append(f"\n--- {resolved_agent_name} 完成任务 ---\n")
+
+        history_entry["completed"] = True
+        history_entry["result"] = result.get("output", "未返回结果")
+        return {
+            "agent": resolved_agent_name,
+            "task_type": task_type,
+            "task": task,
+            "result": result.get("output", "未返回结果")
+        }
+
+    async def _run_delegations_concurrently(self, subtasks: List["DelegateSubtask"]) -> List[Dict[str, Any]]:
+        """
+        并发执行多个委派子任务
+
+        每个子任务使用独立的专业智能体实例，同时运行的子任务数受 DELEGATION_MAX_CONCURRENCY 限制。
+        结果与过程文本均按子任务顺序合并，与完成先后无关。
+
+        Args:
+            subtasks: 子任务列表
+
+        Returns:
+            List[Dict[str, Any]]: 按子任务顺序排列的结果
+        """
+        semaphore = asyncio.Semaphore(max(settings.DELEGATION_MAX_CONCURRENCY, 1))
+        subtask_thoughts: List[List[str]] = [[] for _ in subtasks]
+
+        async def _run_one(index: int, subtask: "DelegateSubtask") -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    payload = await self._run_delegation(
+                        task=subtask.task,
+                        agent_name=subtask.agent_name,
+                        task_type=subtask.task_type,
+                        thoughts=subtask_thoughts[index],
+                        subtask_id=index,
+                        spawn=True,
+                    )
+                except Exception as e:
+                    logger.exception("子任务 %d 委派失败", index)
+                    payload = {"error": f"委派任务时发生错误: {str(e)}"}
+            return {"subtask_id": index, **payload}
+
+        results = await asyncio.gather(*(_run_one(index, subtask) for index, subtask in enumerate(subtasks)))
+
+        for thoughts in subtask_thoughts:
+            self.all_thoughts.extend(thoughts)
+        return list(results)
+
     async def _load_tools(self) -> List[BaseTool]:
         """
         加载协调Agent专用工具
@@ -149,11 +340,12 @@ class CoordinatorAgentService(AgentService):
             Returns:
                 str: 所有可用智能体列表及其描述
             """
-            if not self.specialized_agents:
+            coordinator = self._bound()
+            if not coordinator.specialized_agents:
                 return "当前没有可用的专业智能体"
 
             agent_info = []
-            for key, agent in self.specialized_agents.items():
+            for key, agent in coordinator.specialized_agents.items():
                 name = str(key) if isinstance(key, tuple) else key
                 description = getattr(agent, "description", "无描述")
                 agent_info.append(f"名称: {name}\n描述: {description}")
@@ -172,99 +364,42 @@ class CoordinatorAgentService(AgentService):
             Returns:
                 str: 专业智能体的响应结果
             """
+            coordinator = self._bound()
             try:
-                resolved_agent_name, agent = self._resolve_agent_name(agent_name=agent_name, task_type=task_type)
-
-                if not resolved_agent_name:
-                    if agent_name:
-                        return f"错误: 未找到名为 '{agent_name}' 的智能体"
-                    return "错误: 未指定可解析的智能体，请提供 agent_name 或可用的 task_type"
-                if not agent:
-                    return f"错误: 智能体 '{resolved_agent_name}' 当前不可用"
-
-                self.last_task_status["current_agent"] = resolved_agent_name
-                self.last_task_status["task_history"].append({
-                    "agent": resolved_agent_name,
-                    "task_type": task_type,
-                    "task": task,
-                    "completed": False
-                })
-
-                main_callback = self._current_callback
-
-                if main_callback:
-                    await main_callback({
-                        'type': 'delegation_start',
-                        'content': f'正在将任务委派给 {resolved_agent_name}...',
-                        'delegate_to': resolved_agent_name,
-                        'task_type': task_type,
-                        'task': task[:200],
-                        'project_id': self.project_id
-                    })
-                    self.all_thoughts.append(f"\n--- 委派任务给 {resolved_agent_name}: {task} ---\n")
-
-                result = {"output": "子智能体未返回有效结果"}
-
-                if hasattr(agent, 'generate_stream_response'):
-                    collected_output = []
-                    sub_agent_thoughts = []
-
-                    async def forward_callback(data):
-                        """转发子Agent事件到主SSE流，同时收集结果"""
-                        content_type = data.get('type', '')
-                        content = data.get('content', '')
-
-                        if content_type == "thought":
-                            sub_agent_thoughts.append(content)
-
-                        if content_type == 'final_answer' and content:
-                            collected_output.append(content)
-                            return
-
-                        if main_callback and content_type not in ('final_answer', '[DONE]', 'system', 'thought'):
-                            await main_callback(data)
-
-                    await agent.generate_stream_response(
-                        query=task,
-                        callback=forward_callback,
-                        should_save_thinking=False
-                    )
-
-                    if sub_agent_thoughts and hasattr(self, 'all_thoughts'):
-                        sub_agent_thought_content = "".join(sub_agent_thoughts)
-                        self.all_thoughts.append(f"\n{sub_agent_thought_content}\n")
-
-                    result_output = "\n".join(collected_output) if collected_output else "子智能体未返回有效结果"
-                    result = {"output": result_output}
-
-                if main_callback:
-                    summary = result.get("output", "")[:200]
-                    await main_callback({
-                        'type': 'delegation_end',
-                        'content': f'{resolved_agent_name} 已完成任务',
-                        'delegate_to': resolved_agent_name,
-                        'task_type': task_type,
-                        'summary': summary,
-                        'project_id': self.project_id
-                    })
-                    self.all_thoughts.append(f"\n--- {resolved_agent_name} 完成任务 ---\n")
-
-                task_index = len(self.last_task_status["task_history"]) - 1
-                self.last_task_status["task_history"][task_index]["completed"] = True
-                self.last_task_status["task_history"][task_index]["result"] = result.get("output", "未返回结果")
-                return json.dumps({
-                    "agent": resolved_agent_name,
-                    "task_type": task_type,
-                    "task": task,
-                    "result": result.get("output", "未返回结果")
-                }, ensure_ascii=False)
-
+                payload = await coordinator._run_delegation(
+                    task=task,
+                    agent_name=agent_name,
+                    task_type=task_type,
+                    thoughts=coordinator.all_thoughts,
+                    # 同一轮可能并发调用多次 delegate_task，每次使用独立实例，避免共享专业智能体的运行状态
+                    spawn=True,
+                )
+                if "error" in payload:
+                    return payload["error"]
+                return json.dumps(payload, ensure_ascii=False)
             except KeyError as e:
                 return f"委派任务时缺少必要参数: {str(e)}"
             except Exception as e:
                 logger.exception("委派任务时发生未预期的错误")
                 return f"委派任务时发生错误: {str(e)}"
 
+        @tool(args_schema=DelegateTasksInput)
+        async def delegate_tasks(subtasks: List[DelegateSubtask]) -> str:
+            """
+            将多个相互独立的子任务同时委派给专业智能体并行执行，全部完成后一并返回结果。
+            子任务之间存在依赖（后一个需要前一个的结果）时，请改用 delegate_task 逐个委派。
+
+            Returns:
+                str: 按子任务顺序排列的结果列表（JSON）
+            """
+            coordinator = self._bound()
+            try:
+                results = await coordinator._run_delegations_concurrently(subtasks)
+                return json.dumps({"results": results}, ensure_ascii=False)
+            except Exception as e:
+                logger.exception("批量委派任务时发生未预期的错误")
+                return f"批量委派任务时发生错误: {str(e)}"
+
         @tool
         async def get_task_status(query: str) -> str:
             """
@@ -276,11 +411,13 @@ class CoordinatorAgentService(AgentService):
             Returns:
                 str: 任务状态信息
             """
-            return json.dumps(self.last_task_status, ensure_ascii=False)
+            coordinator = self._bound()
+            return json.dumps(coordinator.last_task_status, ensure_ascii=False)
 
         tools.extend([
             list_available_agents,
             delegate_task,
+            delegate_tasks,
             get_task_status
         ])
         self.tools = tools
@@ -302,7 +439,7 @@ class CoordinatorAgentService(AgentService):
 
     async def _before_generation(self, query: str, callback: Callable) -> Dict[str, Any]:
         """
-        响应生成前的准备工作，添加可用智能体信息
+        响应生成前的准备工作，添加任务类型与可用智能体信息
 
         Args:
             query: 用户查询
@@ -313,7 +450,6 @@ class CoordinatorAgentService(AgentService):
         """
         context = await super()._before_generation(query, callback)
         context["task_type"] = self.task_type
-        context["available_tools"] = self._render_tools_for_prompt()
 
         available_agents = "无"
         if self.specialized_agents:
@@ -330,6 +466,88 @@ class CoordinatorAgentService(AgentService):
 
         return context
 
+    async def generate_stream_response(
+        self,
+        query: str,
+        callback: Callable[[Dict[str, Any]], Awaitable[None]] = None,
+        should_save_thinking: bool = None
+    ):
+        """
+        生成流式响应；启用答案缓存时，ask 任务先查找同一项目与权限范围内语义相近的历史答案，
+        命中则直接返回带 cached 标记的最终答案，不再调用智能体
+
+        Args:
+            query: 用户查询
+            callback: 回调函数，用于发送响应给客户端
+            should_save_thinking: 是否保存思考过程
+        """
+        if not callback or not settings.ANSWER_CACHE_ENABLED or self.task_type != "ask":
+            await super().generate_stream_response(query, callback, should_save_thinking)
+            return
+
+        from app.services.answer_cache_service import get_answer_cache_service
+        answer_cache = get_answer_cache_service()
+        lookup = None
+        if answer_cache.is_cacheable(query):
+            try:
+                lookup = await answer_cache.lookup(
+                    project_id=self.project_id,
+                    user_id=self.context.get("user_id"),
+                    user_role=self.context.get("user_role", "user"),
+                    query=query,
+                )
+            except Exception:
+                logger.warning("[AnswerCache] 查询答案缓存失败，继续正常生成", exc_info=True)
+
+        if lookup is not None and lookup.hit:
+            await self._answer_from_cache(query, lookup.entry.answer, callback, should_save_thinking)
+            return
+
+        final_answers: List[str] = []
+
+        async def capture_callback(data: Dict[str, Any]) -> None:
+            if data.get("type") == "final_answer":
+                final_answers.append(data.get("content", ""))
+            await callback(data)
+
+        await super().generate_stream_response(query, capture_callback, should_save_thinking)
+
+        if lookup is not None and final_answers:
+            answer_cache.store(lookup, query, final_answers[-1])
+
+    async def _answer_from_cache(
+        self,
+        query: str,
+        answer: str,
+        callback: Callable[[Dict[str, Any]], Awaitable[None]],
+        should_save_thinking: Optional[bool]
+    ) -> None:
+        """发送缓存的最终答案，并照常记录本轮对话"""
+        await callback({
+            'type': 'final_answer',
+            'content': answer,
+            'project_id': self.project_id,
+            'cached': True
+        })
+
+        save = self.should_save_thinking if should_save_thinking is None else should_save_thinking
+        if not save:
+            return
+        try:
+            get_conversation_persistence_service().submit(ConversationTurnCreate(
+                project_id=self.project_id,
+                messages=[
+                    ConversationMessageCreate(message_type="user", content=query, priority=2),
+                    ConversationMessageCreate(message_type="assistant", content=answer, priority=2),
+                ],
+            ))
+        except Exception as e:
+            await callback({
+                'type': 'system',
+                'content': f'保存对话记录时出错: {str(e)}',
+                'project_id': self.project_id
+            })
+
     async def _handle_tool_end(self, event: Dict, callback: Callable, project_id: int) -> None:
         """
         处理工具执行结束事件
@@ -340,7 +558,7 @@ class CoordinatorAgentService(AgentService):
             project_id: 项目ID
         """
         tool_name = event.get("name", "")
-        ignore_tools = ["get_task_status", "execute_multi_agent_workflow", "delegate_task"]
+        ignore_tools = ["get_task_status", "execute_multi_agent_workflow", "delegate_task", "delegate_tasks"]
         if tool_name in ignore_tools:
             return
 
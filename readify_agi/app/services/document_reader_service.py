@@ -0,0 +1,161 @@
+"""
+文档窗口读取服务 — 供智能体按需读取文件的局部内容
+
+提供三种读取方式，均只查询需要的文档块与列：
+- 按序号范围读取；
+- 按 token 预算从游标处连续读取，返回下一次读取的游标；
+- 读取某个检索命中位置前后的相邻文档块。
+单次返回的内容都受 DOCUMENT_READ_MAX_TOKENS 限制，避免把整份文件塞进提示词。
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.token_counter import count_tokens
+from app.repositories.document_repository import DocumentRepository
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentReaderService:
+    """
+    文档窗口读取服务
+    """
+
+    def __init__(self, document_repository: DocumentRepository):
+        self.document_repository = document_repository
+
+    @staticmethod
+    def _clamp_budget(max_tokens: Optional[int]) -> int:
+        limit = settings.DOCUMENT_READ_MAX_TOKENS
+        if not max_tokens or max_tokens <= 0:
+            return limit
+        return min(int(max_tokens), limit)
+
+    async def _collect(
+        self,
+        file_id: int,
+        start_sequence: int,
+        end_sequence: Optional[int],
+        budget: int
+    ) -> Dict[str, Any]:
+        """从起始序号开始按页读取文档块，直到读完范围或用完 token 预算"""
+        chunks: List[Dict[str, Any]] = []
+        used_tokens = 0
+        next_cursor: Optional[int] = None
+        cursor = start_sequence
+        page_size = max(settings.DOCUMENT_READ_PAGE_SIZE, 1)
+
+        while True:
+            rows = await self.document_repository.get_window(
+                file_id=file_id,
+                start_sequence=cursor,
+                end_sequence=end_sequence,
+                limit=page_size
+            )
+            for row in rows:
+                tokens = count_tokens(row.content)
+                # 至少返回一个文档块，避免单块超出预算时游标无法前进
+                if chunks and used_tokens + tokens > budget:
+                    next_cursor = row.sequence
+                    break
+                chunks.append({"sequence": row.sequence, "content": row.content})
+                used_tokens += tokens
+            if next_cursor is not None or len(rows) < page_size:
+                break
+            cursor = rows[-1].sequence + 1
+
+        return {
+            "file_id": file_id,
+            "chunks": chunks,
+            "token_count": used_tokens,
+            "next_cursor": next_cursor,
+        }
+
+    async def read_range(
+        self,
+        file_id: int,
+        start_sequence: int,
+        end_sequence: int,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        按序号范围读取文档块，超出 token 预算时截断并返回续读游标
+
+        Args:
+            file_id: 文件ID
+            start_sequence: 起始序号（包含）
+            end_sequence: 结束序号（包含）
+            max_tokens: token 预算
+
+        Returns:
+            Dict[str, Any]: 文档块列表、token 数与续读游标
+        """
+        if end_sequence < start_sequence:
+            raise ValueError("end_sequence 不能小于 start_sequence")
+        return await self._collect(file_id, start_sequence, end_sequence, self._clamp_budget(max_tokens))
+
+    async def read_by_budget(
+        self,
+        file_id: int,
+        cursor: Optional[int] = None,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        从游标处按 token 预算连续读取，next_cursor 为空表示已读到文件末尾
+
+        Args:
+            file_id: 文件ID
+            cursor: 起始序号，为空时从文件开头读取
+            max_tokens: token 预算
+
+        Returns:
+            Dict[str, Any]: 文档块列表、token 数、续读游标与文件块总数
+        """
+        min_sequence, max_sequence, total_chunks = await self.document_repository.get_sequence_bounds(file_id)
+        if total_chunks == 0:
+            return {"file_id": file_id, "chunks": [], "token_count": 0, "next_cursor": None, "total_chunks": 0}
+
+        start = min_sequence if cursor is None else int(cursor)
+        result = await self._collect(file_id, start, max_sequence, self._clamp_budget(max_tokens))
+        result["total_chunks"] = total_chunks
+        return result
+
+    async def read_neighbors(
+        self,
+        file_id: int,
+        sequence: Optional[int] = None,
+        text: Optional[str] = None,
+        window: int = 1,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        读取检索命中位置及其前后 window 个文档块
+
+        Args:
+            file_id: 文件ID
+            sequence: 命中的文档块序号
+            text: 命中的文本片段，未提供 sequence 时用于定位文档块
+            window: 前后各读取的文档块数
+            max_tokens: token 预算
+
+        Returns:
+            Dict[str, Any]: 命中序号、文档块列表与 token 数
+        """
+        if sequence is None:
+            if not text or not text.strip():
+                raise ValueError("需要提供 sequence 或 text 以定位文档块")
+            snippet = text.strip()[:settings.DOCUMENT_LOCATE_SNIPPET_CHARS]
+            sequence = await self.document_repository.find_sequence_containing(file_id, snippet)
+            if sequence is None:
+                return {"file_id": file_id, "hit_sequence": None, "chunks": [], "token_count": 0, "next_cursor": None}
+
+        window = max(0, min(int(window), settings.DOCUMENT_NEIGHBOR_MAX_WINDOW))
+        result = await self._collect(
+            file_id,
+            max(int(sequence) - window, 0),
+            int(sequence) + window,
+            self._clamp_budget(max_tokens)
+        )
+        result["hit_sequence"] = int(sequence)
+        return result
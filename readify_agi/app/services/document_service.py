@@ -1,7 +1,7 @@
 import logging
 import os
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from fastapi import HTTPException
 from langchain.prompts import ChatPromptTemplate
@@ -11,6 +11,7 @@ from app.core.llm_factory import create_chat_model
 from app.models.document import DocumentCreate
 from app.repositories.document_repository import DocumentRepository
 from app.repositories.file_repository import FileRepository
+from app.services.extractive_labeler import ExtractiveLabeler
 from app.services.object_storage_service import ObjectStorageService
 from app.services.parser.parser_service import ParserService
 
@@ -57,14 +58,16 @@ class DocumentService:
 
         logger.info("解析文件 '%s' (ID:%d) 得到 %d 个文档块", file.original_name, file_id, len(documents))
 
+        contents = [doc.get_content() for doc in documents]
+        labeler = self._create_labeler(content for content in contents if content)
+
         doc_creates = []
-        for i, doc in enumerate(documents):
-            content = doc.get_content()
+        for i, content in enumerate(contents):
             if not content:
                 continue
 
             logger.info("为文档块 %d/%d 生成标签...", i + 1, len(documents))
-            label = await self._generate_label_with_4o_mini(content)
+            label = await self._label_content(content, labeler)
 
             doc_create = DocumentCreate(
                 file_id=file_id,
@@ -107,7 +110,11 @@ class DocumentService:
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
 
-        label = await self._generate_label_with_4o_mini(document.content)
+        labeler = None
+        if settings.LABEL_MODE in ("extractive", "hybrid"):
+            file_documents = await self.document_repository.get_by_file_id(document.file_id)
+            labeler = self._create_labeler(doc.content for doc in file_documents)
+        label = await self._label_content(document.content, labeler)
         await self.document_repository.update_label(document_id, label)
         return label
 
@@ -137,6 +144,7 @@ class DocumentService:
         total_docs = len(documents)
         logger.info("开始为文件 '%s' (ID:%d)的%d个文档生成标签", file.original_name, file_id, total_docs)
 
+        labeler = self._create_labeler(doc.content for doc in documents)
         document_ids = []
         labels = []
 
@@ -147,7 +155,7 @@ class DocumentService:
                     continue
 
                 logger.info("处理文档 [%d/%d] ID:%d", idx, total_docs, doc.id)
-                label = await self._generate_label_with_4o_mini(doc.content)
+                label = await self._label_content(doc.content, labeler)
                 if label:
                     document_ids.append(doc.id)
                     labels.append(label)
@@ -169,9 +177,35 @@ class DocumentService:
             logger.info("没有文档需要更新标签")
             return 0
 
-    async def _generate_label_with_4o_mini(self, content: str) -> str:
+    @staticmethod
+    def _create_labeler(corpus) -> Optional[ExtractiveLabeler]:
+        """LABEL_MODE 为 extractive / hybrid 时以文件的全部文档块为语料创建抽取式标签生成器"""
+        if settings.LABEL_MODE not in ("extractive", "hybrid"):
+            return None
+        return ExtractiveLabeler(corpus)
+
+    async def _label_content(self, content: str, labeler: Optional[ExtractiveLabeler]) -> str:
+        """
+        按 LABEL_MODE 为文档块生成标签
+
+        Args:
+            content: 文档内容
+            labeler: 抽取式标签生成器，为 None 时使用 LLM
+
+        Returns:
+            str: 生成的标签
+        """
+        if labeler is None:
+            return await self._generate_label(content)
+        result = labeler.label(content)
+        if settings.LABEL_MODE == "hybrid" and result.confidence < settings.LABEL_HYBRID_MIN_CONFIDENCE:
+            logger.debug("抽取式标签置信度 %.2f 过低，改用 LLM 生成", result.confidence)
+            return await self._generate_label(content) or result.label
+        return result.label
+
+    async def _generate_label(self, content: str) -> str:
         """
-        使用4o-mini模型生成标签
+        使用 label 模型配置生成标签
 
         Args:
             content: 文档内容
@@ -184,7 +218,7 @@ class DocumentService:
         prompt_template = (await client.get_template("label")).strip()
 
         try:
-            chat = create_chat_model(temperature=0.5)
+            chat = create_chat_model(temperature=0.5, profile="label")
 
             prompt = ChatPromptTemplate.from_messages([
                 ("system", "你是一个文本标签生成助手，请生成简短的标签来概括文本内容。"),
@@ -0,0 +1,146 @@
+"""
+抽取式标签生成 — 不调用 LLM，按 TF-IDF 从文档块中抽取关键词作为标签
+
+以同一文件的全部文档块为语料计算逆文档频率，文档块内词频高、在其他文档块中少见的词得分高，
+取得分最高的若干个关键词拼接为标签。中文在安装 jieba 时按分词结果抽取，否则使用 2~4 字的
+字符 n-gram，并去掉被更高分候选包含的片段；英文按单词抽取。
+
+置信度综合入选关键词在文档块内的重复次数与在语料中的区分度，关键词只出现一次或在各文档块中
+都很常见时置信度低，混合模式下低置信度的文档块再交给 LLM 生成标签。
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+
+try:
+    import jieba
+except ImportError:  # pragma: no cover - 未安装 jieba 时中文使用字符 n-gram
+    jieba = None
+
+_CJK_RUN = re.compile(r"[一-鿿]+")
+_LATIN_WORD = re.compile(r"[A-Za-z][A-Za-z0-9\-]{2,}")
+
+_ENGLISH_STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here
+hers him his how however i if in into is it its itself just may me might more most must my no nor not now
+of off on once only or other our ours out over own same she should so some such than that the their theirs
+them then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours chapter page section figure table
+""".split())
+
+_CHINESE_STOPWORDS = frozenset("""
+我们 你们 他们 她们 它们 这个 那个 这些 那些 这样 那样 因为 所以 但是 而且 如果 虽然 然后 可以 没有 不是 就是 还是
+一个 一些 一种 什么 怎么 为什么 如何 自己 已经 可能 需要 进行 通过 对于 以及 或者 并且 其中 之后 之前 时候 现在
+非常 比较 应该 能够 这种 那种 第一 第二 同时 只是 还有 不过 因此 于是 然而 即使 这里 那里 出来 起来 下来 上来
+""".split())
+
+# n-gram 以这些字开头或结尾时多半跨越了词边界
+_CJK_EDGE_CHARS = frozenset("的了是在和与及或等也就都而被把对从为以于之其这那个着过们上下中有不很更最")
+# 含有这些虚词的 n-gram 视为跨词片段
+_CJK_BREAK_CHARS = frozenset("的了是与及或着")
+
+# 关键词在文档块内重复达到该次数时视为充分突出
+_SALIENT_COUNT = 3
+
+
+def _cjk_terms(run: str) -> List[str]:
+    if jieba is not None:
+        return [word for word in jieba.lcut(run) if len(word) >= 2 and word not in _CHINESE_STOPWORDS]
+    terms = []
+    for size in (2, 3, 4):
+        for start in range(len(run) - size + 1):
+            gram = run[start:start + size]
+            if gram[0] in _CJK_EDGE_CHARS or gram[-1] in _CJK_EDGE_CHARS or _CJK_BREAK_CHARS.intersection(gram):
+                continue
+            if any(gram[offset:offset + 2] in _CHINESE_STOPWORDS for offset in range(size - 1)):
+                continue
+            terms.append(gram)
+    return terms
+
+
+def extract_terms(text: str) -> List[str]:
+    """
+    把文本切分为候选关键词
+
+    Args:
+        text: 文本
+
+    Returns:
+        List[str]: 候选关键词（可重复，用于统计词频）
+    """
+    terms: List[str] = []
+    for run in _CJK_RUN.findall(text or ""):
+        terms.extend(_cjk_terms(run))
+    for word in _LATIN_WORD.findall(text or ""):
+        lowered = word.lower()
+        if lowered not in _ENGLISH_STOPWORDS:
+            terms.append(lowered)
+    return terms
+
+
+@dataclass
+class ExtractiveLabel:
+    """抽取式标签结果"""
+    label: str
+    confidence: float
+    keywords: List[str]
+
+
+class ExtractiveLabeler:
+    """
+    基于文件语料的 TF-IDF 关键词标签生成器
+    """
+
+    def __init__(self, corpus: Iterable[str], max_keywords: Optional[int] = None):
+        self.max_keywords = max(max_keywords or settings.LABEL_EXTRACTIVE_KEYWORDS, 1)
+        self._document_count = 0
+        self._document_frequency: Counter = Counter()
+        for content in corpus:
+            self._document_count += 1
+            self._document_frequency.update(set(extract_terms(content)))
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + self._document_count) / (1 + self._document_frequency.get(term, 0))) + 1
+
+    def label(self, content: str) -> ExtractiveLabel:
+        """
+        为文档块生成标签
+
+        Args:
+            content: 文档块内容
+
+        Returns:
+            ExtractiveLabel: 标签、置信度与入选关键词
+        """
+        term_counts = Counter(extract_terms(content))
+        if not term_counts:
+            return ExtractiveLabel(label="", confidence=0.0, keywords=[])
+
+        scores: Dict[str, float] = {
+            term: (1 + math.log(count)) * self._idf(term) * math.sqrt(len(term) if _CJK_RUN.fullmatch(term) else 2)
+            for term, count in term_counts.items()
+        }
+        keywords: List[str] = []
+        for term in sorted(scores, key=lambda candidate: (-scores[candidate], candidate)):
+            # 片段与已选关键词互相包含时只保留得分高的一个
+            if any(term in chosen or chosen in term for chosen in keywords):
+                continue
+            keywords.append(term)
+            if len(keywords) >= self.max_keywords:
+                break
+
+        max_idf = self._idf("")
+        confidence = sum(
+            min(term_counts[term], _SALIENT_COUNT) / _SALIENT_COUNT * self._idf(term) / max_idf for term in keywords
+        ) / len(keywords)
+        separator = "、" if any(_CJK_RUN.search(keyword) for keyword in keywords) else ", "
+        return ExtractiveLabel(
+            label=separator.join(keywords)[:50],
+            confidence=round(confidence, 4),
+            keywords=keywords,
+        )
@@ -0,0 +1,286 @@
+"""
+思维导图生成服务 — 按 map / reduce / write 三个阶段从文件内容生成思维导图
+
+- map：把文件的文档块按 token 预算切成连续批次，在并发上限内并行提炼每批的小标题与要点；
+- reduce：把相邻的摘要交给 LLM 聚类合并为上一级主题，逐层归并直到顶层主题数不超过上限；
+- write：把生成的层级结构转换为批量新增操作，在单个事务中写入根节点之下。
+
+各阶段通过回调推送 mind_map_progress 事件，整体耗时随并发度而非智能体迭代次数增长。
+"""
+import asyncio
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.core.llm_factory import create_chat_model
+from app.core.token_counter import count_tokens
+from app.models.mind_map import MindMapDB
+from app.models.mind_map_node import MindMapNodeOperation
+from app.repositories.document_repository import DocumentRepository
+from app.repositories.mind_map_node_repository import MindMapNodeRepository
+from app.services.mind_map_ops import MindMapOpsPlanner
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_SYSTEM_PROMPT = "你是读书笔记整理助手，负责把书籍内容整理为结构清晰的思维导图。只输出 JSON。"
+
+_MAP_PROMPT = """请阅读下面的文档片段，提炼一个小标题和不超过 {max_points} 条关键要点。
+要求：要点简洁、不编造原文没有的信息。
+输出格式：{{"title": "小标题", "points": ["要点1", "要点2"]}}
+
+文档片段：
+{content}"""
+
+_REDUCE_PROMPT = """下面是一本书中按顺序排列的若干部分的小标题与要点。
+请把相邻且主题相近的部分归为一组，并为每组拟定一个概括性的上级标题。
+要求：每个部分恰好属于一组，组内编号必须连续且保持原有顺序，组数少于部分数。
+输出格式：{{"groups": [{{"title": "上级标题", "items": [编号列表]}}]}}
+
+各部分：
+{sections}"""
+
+_JSON_BLOCK = re.compile(r"\{.*\}", re.S)
+
+
+@dataclass
+class MindMapSection:
+    """生成中的主题节点"""
+    title: str
+    points: List[str] = field(default_factory=list)
+    children: List["MindMapSection"] = field(default_factory=list)
+
+
+def _parse_json_object(text: str) -> Dict[str, Any]:
+    """从模型输出中解析 JSON 对象，兼容 ```json 代码块和前后多余文字"""
+    match = _JSON_BLOCK.search(text or "")
+    if not match:
+        raise ValueError("模型输出中没有 JSON 对象")
+    parsed = json.loads(match.group(0))
+    if not isinstance(parsed, dict):
+        raise ValueError("模型输出不是 JSON 对象")
+    return parsed
+
+
+def _message_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+    return content or ""
+
+
+class MindMapGenerationService:
+    """
+    思维导图生成服务
+    """
+
+    def __init__(
+        self,
+        document_repository: DocumentRepository,
+        mind_map_node_repository: MindMapNodeRepository,
+        llm: Optional[BaseChatModel] = None
+    ):
+        self.document_repository = document_repository
+        self.mind_map_node_repository = mind_map_node_repository
+        self._llm = llm
+
+    def _get_llm(self) -> BaseChatModel:
+        if self._llm is None:
+            self._llm = create_chat_model(temperature=0.3, profile="mind_map")
+        return self._llm
+
+    async def _invoke_json(self, prompt: str) -> Dict[str, Any]:
+        response = await self._get_llm().ainvoke([
+            SystemMessage(content=_SYSTEM_PROMPT),
+            HumanMessage(content=prompt),
+        ])
+        return _parse_json_object(_message_text(response.content))
+
+    @staticmethod
+    def _batch_documents(documents: List[Any]) -> List[List[Any]]:
+        """把文档块按 token 预算切成连续批次"""
+        budget = max(settings.MIND_MAP_GEN_MAP_BATCH_TOKENS, 1)
+        batches: List[List[Any]] = []
+        current: List[Any] = []
+        used_tokens = 0
+        for document in documents:
+            tokens = count_tokens(document.content)
+            if current and used_tokens + tokens > budget:
+                batches.append(current)
+                current, used_tokens = [], 0
+            current.append(document)
+            used_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _run_parallel(
+        self,
+        jobs: List[Callable[[], Awaitable[Any]]],
+        phase: str,
+        progress: Optional[ProgressCallback]
+    ) -> List[Any]:
+        """在并发上限内执行任务，每完成一个推送一次进度，结果按任务顺序返回"""
+        semaphore = asyncio.Semaphore(max(settings.MIND_MAP_GEN_CONCURRENCY, 1))
+        results: List[Any] = [None] * len(jobs)
+
+        async def _run(index: int) -> int:
+            async with semaphore:
+                results[index] = await jobs[index]()
+            return index
+
+        completed = 0
+        for finished in asyncio.as_completed([_run(index) for index in range(len(jobs))]):
+            await finished
+            completed += 1
+            await self._emit(progress, phase, completed, len(jobs))
+        return results
+
+    @staticmethod
+    async def _emit(progress: Optional[ProgressCallback], phase: str, completed: int, total: int, **extra) -> None:
+        if progress is None:
+            return
+        phase_names = {"map": "提炼文档要点", "reduce": "归并主题层级", "write": "写入思维导图"}
+        await progress({
+            "type": "mind_map_progress",
+            "phase": phase,
+            "completed": completed,
+            "total": total,
+            "content": f"{phase_names.get(phase, phase)} {completed}/{total}",
+            **extra
+        })
+
+    async def _summarize_batch(self, batch: List[Any]) -> MindMapSection:
+        """map 阶段：提炼一个批次的小标题与要点，失败时退化为首段文本"""
+        content = "\n".join(document.content for document in batch)
+        try:
+            parsed = await self._invoke_json(_MAP_PROMPT.format(
+                max_points=settings.MIND_MAP_GEN_MAX_POINTS, content=content
+            ))
+            title = str(parsed.get("title") or "").strip()
+            points = [str(point).strip() for point in parsed.get("points") or [] if str(point).strip()]
+            if title:
+                return MindMapSection(title=title, points=points[:settings.MIND_MAP_GEN_MAX_POINTS])
+        except Exception as e:
+            logger.warning("提炼文档块 %s-%s 要点失败: %s", batch[0].sequence, batch[-1].sequence, str(e))
+        return MindMapSection(title=content.strip().splitlines()[0][:30] if content.strip() else "未命名")
+
+    async def _group_window(self, window: List[MindMapSection]) -> List[MindMapSection]:
+        """reduce 阶段：把一个窗口内相邻的主题聚类为上一级主题，输出不合法时整窗作为一组"""
+        sections_text = "\n".join(
+            f"{index}. {section.title}：{'；'.join(section.points[:3])}" for index, section in enumerate(window)
+        )
+        try:
+            parsed = await self._invoke_json(_REDUCE_PROMPT.format(sections=sections_text))
+            groups = parsed.get("groups") or []
+            flat = [int(item) for group in groups for item in group.get("items") or []]
+            if flat == list(range(len(window))) and 0 < len(groups) < len(window):
+                return [
+                    MindMapSection(
+                        title=str(group.get("title") or window[int(group["items"][0])].title).strip(),
+                        children=[window[int(item)] for item in group["items"]],
+                    )
+                    for group in groups
+                ]
+            logger.warning("主题归并结果不合法，整组合并: %s", parsed)
+        except Exception as e:
+            logger.warning("主题归并失败，整组合并: %s", str(e))
+        return [MindMapSection(title=window[0].title, children=list(window))]
+
+    async def _reduce(self, sections: List[MindMapSection], progress: Optional[ProgressCallback]) -> List[MindMapSection]:
+        """逐层归并，直到顶层主题数不超过 MIND_MAP_GEN_TOP_FANOUT"""
+        window_size = max(settings.MIND_MAP_GEN_REDUCE_WINDOW, 2)
+        level = sections
+        while len(level) > settings.MIND_MAP_GEN_TOP_FANOUT:
+            windows = [level[start:start + window_size] for start in range(0, len(level), window_size)]
+            jobs = [
+                (lambda window=window: self._group_window(window)) if len(window) > 1
+                else (lambda window=window: asyncio.sleep(0, result=list(window)))
+                for window in windows
+            ]
+            grouped = await self._run_parallel(jobs, "reduce", progress)
+            next_level = [section for groups in grouped for section in groups]
+            if len(next_level) >= len(level):
+                break
+            level = next_level
+        return level
+
+    @staticmethod
+    def _to_operations(sections: List[MindMapSection], root_id: int) -> List[MindMapNodeOperation]:
+        """把主题层级转换为新增操作，要点作为主题的叶子节点"""
+        operations: List[MindMapNodeOperation] = []
+        stack = [(section, root_id) for section in reversed(sections)]
+        while stack:
+            section, parent = stack.pop()
+            ref = f"g{len(operations)}"
+            operations.append(MindMapNodeOperation(op="add", ref=ref, parent=parent, content=section.title))
+            for point in section.points:
+                operations.append(MindMapNodeOperation(
+                    op="add", ref=f"g{len(operations)}", parent=ref, content=point
+                ))
+            stack.extend((child, ref) for child in reversed(section.children))
+        return operations
+
+    async def generate(
+        self,
+        mind_map: MindMapDB,
+        file_id: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        从文件内容生成思维导图并写入根节点之下
+
+        Args:
+            mind_map: 思维导图
+            file_id: 文件ID，默认使用思维导图关联的文件
+            progress: 进度事件回调
+
+        Returns:
+            Dict[str, Any]: 生成结果统计
+
+        Raises:
+            ValueError: 文件没有内容或思维导图缺少根节点
+        """
+        file_id = file_id or mind_map.file_id
+        documents = await self.document_repository.get_by_file_id(file_id)
+        if not documents:
+            raise ValueError(f"文件{file_id}没有可用于生成思维导图的内容")
+
+        nodes = await self.mind_map_node_repository.get_nodes_by_mind_map_id(mind_map.id)
+        root = next((node for node in nodes if node.parent_id is None), None)
+        if root is None:
+            raise ValueError(f"思维导图{mind_map.id}缺少根节点")
+
+        batches = self._batch_documents(documents)
+        logger.info("生成思维导图 %s：文件 %s 共 %d 个文档块，分为 %d 批", mind_map.id, file_id, len(documents), len(batches))
+        sections = await self._run_parallel(
+            [lambda batch=batch: self._summarize_batch(batch) for batch in batches], "map", progress
+        )
+
+        top_sections = await self._reduce(sections, progress)
+
+        operations = self._to_operations(top_sections, root.id)
+        change_set = MindMapOpsPlanner(nodes).apply(operations)
+        await self._emit(progress, "write", 0, len(operations))
+        ref_ids = await self.mind_map_node_repository.apply_change_set(
+            mind_map_id=mind_map.id,
+            project_id=mind_map.project_id,
+            file_id=mind_map.file_id,
+            change_set=change_set,
+        )
+        await self._emit(progress, "write", len(ref_ids), len(operations))
+
+        return {
+            "mind_map_id": mind_map.id,
+            "root_node_id": root.id,
+            "document_count": len(documents),
+            "batch_count": len(batches),
+            "top_level_topics": [section.title for section in top_sections],
+            "created_count": len(ref_ids),
+        }
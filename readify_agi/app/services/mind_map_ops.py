@@ -0,0 +1,226 @@
+"""
+思维导图批量操作规划 — 在一次加载的节点快照上按顺序校验 add/update/delete/move 操作
+
+规划只在内存中进行，全部操作校验通过后才生成变更集，由仓储层在单个事务中执行；
+任一操作不合法时整体拒绝，不写入任何数据。
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+from app.models.mind_map_node import MindMapNodeDB, MindMapNodeOperation
+
+NodeKey = Union[int, str]
+
+
+@dataclass
+class _PlannedNode:
+    """规划中的节点状态，已有节点以数据库ID为键，新节点以临时ID为键"""
+    key: NodeKey
+    parent_key: Optional[NodeKey]
+    content: Optional[str]
+    sequence: int
+    level: int
+    is_new: bool = False
+    deleted: bool = False
+
+
+@dataclass
+class NewMindMapNode:
+    """待插入的新节点"""
+    ref: str
+    parent_key: NodeKey
+    content: Optional[str]
+    sequence: int
+    level: int
+
+
+@dataclass
+class MindMapChangeSet:
+    """校验通过的变更集"""
+    deleted_ids: List[int] = field(default_factory=list)
+    # 已有节点ID -> 需要更新的列
+    updates: Dict[int, Dict[str, object]] = field(default_factory=dict)
+    # 按层次分批：每一批节点的父节点都已存在或在之前的批次中插入
+    new_node_waves: List[List[NewMindMapNode]] = field(default_factory=list)
+    updated_ids: List[int] = field(default_factory=list)
+    moved_ids: List[int] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.deleted_ids or self.updates or self.new_node_waves)
+
+
+class MindMapOpsPlanner:
+    """
+    思维导图批量操作规划器
+    """
+
+    def __init__(self, nodes: List[MindMapNodeDB]):
+        self._nodes: Dict[NodeKey, _PlannedNode] = {}
+        self._children: Dict[NodeKey, List[NodeKey]] = {}
+        self._original: Dict[int, _PlannedNode] = {}
+        for node in nodes:
+            planned = _PlannedNode(
+                key=node.id,
+                parent_key=node.parent_id,
+                content=node.content,
+                sequence=node.sequence,
+                level=node.level,
+            )
+            self._nodes[node.id] = planned
+            self._original[node.id] = _PlannedNode(**vars(planned))
+            if node.parent_id is not None:
+                self._children.setdefault(node.parent_id, []).append(node.id)
+        self._new_order: List[str] = []
+
+    def _resolve(self, value: Optional[NodeKey], index: int, field_name: str) -> NodeKey:
+        """把操作中的节点引用解析为规划中的有效节点键"""
+        if value is None or value == "":
+            raise ValueError(f"第 {index} 个操作缺少 {field_name}")
+        key: NodeKey = value
+        if isinstance(value, str) and value not in self._nodes and value.isdigit():
+            key = int(value)
+        planned = self._nodes.get(key)
+        if planned is None or planned.deleted:
+            raise ValueError(f"第 {index} 个操作引用的节点不存在: {value}")
+        return key
+
+    def _next_sequence(self, parent_key: NodeKey) -> int:
+        siblings = [self._nodes[key] for key in self._children.get(parent_key, []) if not self._nodes[key].deleted]
+        return max((sibling.sequence for sibling in siblings), default=-1) + 1
+
+    def _subtree(self, key: NodeKey) -> List[NodeKey]:
+        result = []
+        stack = [key]
+        while stack:
+            current = stack.pop()
+            if self._nodes[current].deleted:
+                continue
+            result.append(current)
+            stack.extend(self._children.get(current, []))
+        return result
+
+    def _relevel(self, key: NodeKey, level: int) -> None:
+        """节点移动后更新整棵子树的层级"""
+        stack = [(key, level)]
+        while stack:
+            current, current_level = stack.pop()
+            self._nodes[current].level = current_level
+            for child in self._children.get(current, []):
+                if not self._nodes[child].deleted:
+                    stack.append((child, current_level + 1))
+
+    def apply(self, operations: List[MindMapNodeOperation]) -> MindMapChangeSet:
+        """
+        按顺序校验并在内存中应用全部操作
+
+        Args:
+            operations: 操作列表
+
+        Returns:
+            MindMapChangeSet: 变更集
+
+        Raises:
+            ValueError: 任一操作不合法
+        """
+        for index, operation in enumerate(operations, 1):
+            getattr(self, f"_apply_{operation.op}")(operation, index)
+        return self._build_change_set()
+
+    def _apply_add(self, operation: MindMapNodeOperation, index: int) -> None:
+        if not operation.ref:
+            raise ValueError(f"第 {index} 个操作 add 需要提供临时ID ref")
+        if operation.ref in self._nodes or operation.ref.isdigit():
+            raise ValueError(f"第 {index} 个操作的临时ID重复或为纯数字: {operation.ref}")
+        if operation.content is None or not operation.content.strip():
+            raise ValueError(f"第 {index} 个操作 add 缺少 content")
+        parent_key = self._resolve(operation.parent, index, "parent")
+        parent = self._nodes[parent_key]
+        self._nodes[operation.ref] = _PlannedNode(
+            key=operation.ref,
+            parent_key=parent_key,
+            content=operation.content,
+            sequence=operation.sequence if operation.sequence is not None else self._next_sequence(parent_key),
+            level=parent.level + 1,
+            is_new=True,
+        )
+        self._children.setdefault(parent_key, []).append(operation.ref)
+        self._new_order.append(operation.ref)
+
+    def _apply_update(self, operation: MindMapNodeOperation, index: int) -> None:
+        if operation.content is None or not operation.content.strip():
+            raise ValueError(f"第 {index} 个操作 update 缺少 content")
+        key = self._resolve(operation.node, index, "node")
+        self._nodes[key].content = operation.content
+
+    def _apply_delete(self, operation: MindMapNodeOperation, index: int) -> None:
+        key = self._resolve(operation.node, index, "node")
+        node = self._nodes[key]
+        if node.parent_key is None:
+            raise ValueError(f"第 {index} 个操作: 根节点不允许删除")
+        subtree = self._subtree(key)
+        if not operation.delete_descendants and len(subtree) > 1:
+            raise ValueError(f"第 {index} 个操作: 节点 {operation.node} 存在子节点，不删除子节点会产生孤立节点")
+        for member in subtree:
+            self._nodes[member].deleted = True
+
+    def _apply_move(self, operation: MindMapNodeOperation, index: int) -> None:
+        key = self._resolve(operation.node, index, "node")
+        node = self._nodes[key]
+        if node.parent_key is None:
+            raise ValueError(f"第 {index} 个操作: 根节点不允许移动")
+        parent_key = self._resolve(operation.parent, index, "parent")
+        if parent_key in self._subtree(key):
+            raise ValueError(f"第 {index} 个操作: 不能把节点移动到自身或其子节点下")
+
+        sequence = operation.sequence if operation.sequence is not None else self._next_sequence(parent_key)
+        self._children[node.parent_key].remove(key)
+        self._children.setdefault(parent_key, []).append(key)
+        node.parent_key = parent_key
+        node.sequence = sequence
+        self._relevel(key, self._nodes[parent_key].level + 1)
+
+    def _build_change_set(self) -> MindMapChangeSet:
+        change_set = MindMapChangeSet()
+
+        for node_id, original in self._original.items():
+            planned = self._nodes[node_id]
+            if planned.deleted:
+                change_set.deleted_ids.append(node_id)
+                continue
+            changes: Dict[str, object] = {}
+            for column, attribute in (("parent_id", "parent_key"), ("content", "content"),
+                                      ("sequence", "sequence"), ("level", "level")):
+                if getattr(planned, attribute) != getattr(original, attribute):
+                    changes[column] = getattr(planned, attribute)
+            if changes:
+                change_set.updates[node_id] = changes
+                if "content" in changes:
+                    change_set.updated_ids.append(node_id)
+                if "parent_id" in changes or "sequence" in changes:
+                    change_set.moved_ids.append(node_id)
+
+        # 父节点为新节点的，放到父节点所在批次之后
+        wave_of: Dict[str, int] = {}
+
+        def wave(ref: str) -> int:
+            if ref not in wave_of:
+                parent_key = self._nodes[ref].parent_key
+                wave_of[ref] = wave(parent_key) + 1 if isinstance(parent_key, str) else 0
+            return wave_of[ref]
+
+        for ref in self._new_order:
+            planned = self._nodes[ref]
+            if planned.deleted:
+                continue
+            index = wave(ref)
+            while len(change_set.new_node_waves) <= index:
+                change_set.new_node_waves.append([])
+            change_set.new_node_waves[index].append(NewMindMapNode(
+                ref=ref,
+                parent_key=planned.parent_key,
+                content=planned.content,
+                sequence=planned.sequence,
+                level=planned.level,
+            ))
+        return change_set
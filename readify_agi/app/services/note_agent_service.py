@@ -4,17 +4,40 @@ import logging
 from typing import Dict, Callable, List, Any, Optional
 
 from langchain_core.tools import BaseTool, tool
+from pydantic import ValidationError
 
 from app.config.agent_names import AgentNames
-from app.models.mind_map_node import MindMapNodeCreate
+from app.models.mind_map_node import MindMapNodeCreate, MindMapNodeOperation, MindMapNodeTreeResponse
 from app.repositories.document_repository import DocumentRepository
 from app.repositories.mind_map_node_repository import MindMapNodeRepository
 from app.repositories.mind_map_repository import MindMapRepository
 from app.services.agent_service import AgentService
+from app.services.mind_map_generation_service import MindMapGenerationService
+from app.services.mind_map_ops import MindMapOpsPlanner
+from app.utils.tool_output_encoder import (
+    dumps_compact,
+    get_tool_token_cap,
+    paginate_rows,
+    project,
+    render_outline_lines,
+    slice_text_by_tokens,
+    take_lines_by_tokens,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _find_tree_node(tree: MindMapNodeTreeResponse, node_id: int) -> Optional[MindMapNodeTreeResponse]:
+    """在思维导图树中查找节点"""
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.id == node_id:
+            return node
+        stack.extend(node.children)
+    return None
+
+
 class NoteAgentService(AgentService):
     """
     笔记智能体服务，用于处理用户笔记和文档摘要
@@ -67,25 +90,41 @@ class NoteAgentService(AgentService):
         @tool
         async def query_mind_map_tree(input_str: str) -> str:
             """
-            查询思维导图的完整树形结构，返回以JSON格式表示的思维导图树。
+            查询思维导图的树形结构，以缩进大纲返回，每行格式为 "- [节点ID] 内容"。
+            超过展开深度或子节点数的部分会折叠并显示数量，可通过 node_id 查询被折叠的子树。
 
             参数:
-                input_str: 输入参数JSON字符串，格式为 {"mind_map_id": 思维导图ID}
+                input_str: 输入参数JSON字符串，格式为 {"mind_map_id": 思维导图ID, "node_id": 子树根节点ID(可选), "max_depth": 展开深度(可选), "cursor": 续读行号(可选)}
 
             返回:
-                思维导图的JSON树形结构
+                思维导图大纲；输出被截断时末尾给出续读的 cursor
             """
+            agent = self._bound()
             params = json.loads(input_str) if isinstance(input_str, str) else input_str
-            mind_map_id = params.get("mind_map_id")
+            mind_map_id = params.get("mind_map_id") or agent.context.get("mind_map_id")
 
-            mind_map = await self.mind_map_repo.get_by_id(mind_map_id)
+            mind_map = await agent.mind_map_repo.get_by_id(mind_map_id)
             if not mind_map:
                 return f"找不到ID为{mind_map_id}的思维导图"
 
-            tree = await self.mind_map_node_repo.get_mind_map_tree(mind_map_id)
+            tree = await agent.mind_map_node_repo.get_mind_map_tree(mind_map_id)
+            if tree is None:
+                return f"思维导图{mind_map_id}还没有节点"
 
-            tree_dict = tree.model_dump()
-            return json.dumps(tree_dict, ensure_ascii=False, indent=2)
+            root = tree
+            node_id = params.get("node_id")
+            if node_id is not None:
+                root = _find_tree_node(tree, int(node_id))
+                if root is None:
+                    return f"思维导图{mind_map_id}中找不到ID为{node_id}的节点"
+
+            lines = render_outline_lines(root, max_depth=params.get("max_depth"))
+            outline, next_cursor = take_lines_by_tokens(
+                lines, get_tool_token_cap("query_mind_map_tree"), params.get("cursor") or 0
+            )
+            if next_cursor is not None:
+                outline += f"\n（已截断，共{len(lines)}行，使用 cursor={next_cursor} 续读）"
+            return outline
 
         @tool
         async def batch_add_child_nodes(input_str: str) -> str:
@@ -98,19 +137,20 @@ class NoteAgentService(AgentService):
             返回:
                 创建结果说明，包含成功创建的节点ID列表
             """
+            agent = self._bound()
             params = json.loads(input_str) if isinstance(input_str, str) else input_str
             parent_node_id = params.get("parent_node_id")
             contents = params.get("contents")
 
-            parent_node = await self.mind_map_node_repo.get_by_id(parent_node_id)
+            parent_node = await agent.mind_map_node_repo.get_by_id(parent_node_id)
             if not parent_node:
                 return f"找不到ID为{parent_node_id}的父节点"
 
-            mind_map = await self.mind_map_repo.get_by_id(parent_node.mind_map_id)
+            mind_map = await agent.mind_map_repo.get_by_id(parent_node.mind_map_id)
             if not mind_map:
                 return f"找不到ID为{parent_node.mind_map_id}的思维导图"
 
-            created_nodes = []
+            created_node_ids = []
             for content in contents:
                 node_create = MindMapNodeCreate(
                     project_id=parent_node.project_id,
@@ -121,11 +161,8 @@ class NoteAgentService(AgentService):
                 )
 
                 try:
-                    new_node = await self.mind_map_node_repo.create_node(node_create)
-                    created_nodes.append({
-                        "id": new_node.id,
-                        "content": new_node.content
-                    })
+                    new_node = await agent.mind_map_node_repo.create_node(node_create)
+                    created_node_ids.append(new_node.id)
                 except ValueError as e:
                     return f"创建子节点参数错误: {str(e)}"
                 except Exception as e:
@@ -135,11 +172,10 @@ class NoteAgentService(AgentService):
             result = {
                 "success": True,
                 "parent_node_id": parent_node_id,
-                "created_nodes": created_nodes,
-                "total_created": len(created_nodes)
+                "created_node_ids": created_node_ids
             }
 
-            return json.dumps(result, ensure_ascii=False, indent=2)
+            return dumps_compact(result)
 
         @tool
         async def update_mind_map_node(input_str: str) -> str:
@@ -152,6 +188,7 @@ class NoteAgentService(AgentService):
             返回:
                 更新结果，JSON格式
             """
+            agent = self._bound()
             params = json.loads(input_str) if isinstance(input_str, str) else input_str
             node_id = params.get("node_id")
             content = params.get("content")
@@ -161,12 +198,12 @@ class NoteAgentService(AgentService):
             if content is None or (isinstance(content, str) and not content.strip()):
                 return json.dumps({"error": "缺少必要参数: content"}, ensure_ascii=False)
 
-            node = await self.mind_map_node_repo.get_by_id(node_id)
+            node = await agent.mind_map_node_repo.get_by_id(node_id)
             if not node:
                 return json.dumps({"error": f"找不到ID为{node_id}的节点"}, ensure_ascii=False)
 
             old_content = node.content
-            updated_node = await self.mind_map_node_repo.update_node_content(node_id=node_id, content=content)
+            updated_node = await agent.mind_map_node_repo.update_node_content(node_id=node_id, content=content)
             if not updated_node:
                 return json.dumps({"error": f"更新节点失败: {node_id}"}, ensure_ascii=False)
 
@@ -176,7 +213,7 @@ class NoteAgentService(AgentService):
                 "old_content": old_content,
                 "new_content": updated_node.content,
             }
-            return json.dumps(result, ensure_ascii=False, indent=2)
+            return dumps_compact(result)
 
         @tool
         async def delete_mind_map_node(input_str: str) -> str:
@@ -189,6 +226,7 @@ class NoteAgentService(AgentService):
             返回:
                 删除结果，JSON格式
             """
+            agent = self._bound()
             params = json.loads(input_str) if isinstance(input_str, str) else input_str
             node_id = params.get("node_id")
             delete_descendants = params.get("delete_descendants", True)
@@ -196,12 +234,12 @@ class NoteAgentService(AgentService):
             if not node_id:
                 return json.dumps({"error": "缺少必要参数: node_id"}, ensure_ascii=False)
 
-            node = await self.mind_map_node_repo.get_by_id(node_id)
+            node = await agent.mind_map_node_repo.get_by_id(node_id)
             if not node:
                 return json.dumps({"error": f"找不到ID为{node_id}的节点"}, ensure_ascii=False)
 
             try:
-                delete_result = await self.mind_map_node_repo.delete_node(
+                delete_result = await agent.mind_map_node_repo.delete_node(
                     node_id=node_id,
                     delete_descendants=bool(delete_descendants),
                 )
@@ -214,7 +252,107 @@ class NoteAgentService(AgentService):
                 "deleted_count": delete_result["deleted_count"],
                 "deleted_node_ids": delete_result["deleted_node_ids"],
             }
-            return json.dumps(result, ensure_ascii=False, indent=2)
+            return dumps_compact(result)
+
+        @tool
+        async def apply_mind_map_ops(input_str: str) -> str:
+            """
+            在一个事务中按顺序批量执行思维导图节点操作，适合一次性构建或调整整份大纲。
+            全部操作先在同一份节点快照上校验，任一操作不合法则整体不执行。
+
+            参数:
+                input_str: 输入参数JSON字符串，格式为 {"mind_map_id": 思维导图ID(可选，默认当前导图), "operations": [操作列表]}
+                    操作格式：
+                    - 新增: {"op": "add", "ref": "临时ID", "parent": 父节点ID或临时ID, "content": "内容", "sequence": 排序(可选)}
+                    - 修改: {"op": "update", "node": 节点ID或临时ID, "content": "新内容"}
+                    - 删除: {"op": "delete", "node": 节点ID或临时ID, "delete_descendants": true}
+                    - 移动: {"op": "move", "node": 节点ID或临时ID, "parent": 新父节点ID或临时ID, "sequence": 排序(可选)}
+
+            返回:
+                JSON格式的变更摘要：added（临时ID到新节点ID的映射）、updated、moved、deleted
+            """
+            agent = self._bound()
+            try:
+                params = json.loads(input_str) if isinstance(input_str, str) else input_str
+                mind_map_id = params.get("mind_map_id") or agent.context.get("mind_map_id")
+                raw_operations = params.get("operations")
+                if not mind_map_id:
+                    return json.dumps({"error": "缺少必要参数: mind_map_id"}, ensure_ascii=False)
+                if not isinstance(raw_operations, list) or not raw_operations:
+                    return json.dumps({"error": "operations 必须为非空列表"}, ensure_ascii=False)
+                operations = [MindMapNodeOperation.model_validate(item) for item in raw_operations]
+            except json.JSONDecodeError:
+                return json.dumps({"error": "无效的JSON格式参数"}, ensure_ascii=False)
+            except ValidationError as e:
+                return json.dumps({"error": f"操作格式错误: {e.errors()[0].get('msg')}"}, ensure_ascii=False)
+
+            mind_map = await agent.mind_map_repo.get_by_id(mind_map_id)
+            if not mind_map:
+                return json.dumps({"error": f"找不到ID为{mind_map_id}的思维导图"}, ensure_ascii=False)
+
+            nodes = await agent.mind_map_node_repo.get_nodes_by_mind_map_id(mind_map.id)
+            try:
+                change_set = MindMapOpsPlanner(nodes).apply(operations)
+            except ValueError as e:
+                return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+            ref_ids: Dict[str, int] = {}
+            if not change_set.is_empty:
+                try:
+                    ref_ids = await agent.mind_map_node_repo.apply_change_set(
+                        mind_map_id=mind_map.id,
+                        project_id=mind_map.project_id,
+                        file_id=mind_map.file_id,
+                        change_set=change_set,
+                    )
+                except Exception as e:
+                    logger.exception("批量执行思维导图操作失败")
+                    return json.dumps({"error": f"批量执行思维导图操作失败: {str(e)}"}, ensure_ascii=False)
+
+            return dumps_compact({
+                "success": True,
+                "added": ref_ids,
+                "updated": change_set.updated_ids,
+                "moved": change_set.moved_ids,
+                "deleted": change_set.deleted_ids,
+            })
+
+        @tool
+        async def generate_mind_map(input_str: str) -> str:
+            """
+            根据整个文件的内容自动生成思维导图：并行提炼各部分要点，归并为主题层级后一次性写入根节点之下。
+            适合为整本书或长文档从零构建思维导图；对已有导图做局部调整请使用其他节点工具。
+
+            参数:
+                input_str: 输入参数JSON字符串，格式为 {"mind_map_id": 思维导图ID(可选，默认当前导图), "file_id": 文件ID(可选，默认导图关联的文件)}
+
+            返回:
+                生成结果摘要，包含顶层主题与新建节点数，JSON格式
+            """
+            agent = self._bound()
+            params = json.loads(input_str) if isinstance(input_str, str) and input_str.strip() else {}
+            mind_map_id = params.get("mind_map_id") or agent.context.get("mind_map_id")
+
+            mind_map = await agent.mind_map_repo.get_by_id(mind_map_id)
+            if not mind_map:
+                return dumps_compact({"error": f"找不到ID为{mind_map_id}的思维导图"})
+
+            callback = agent._current_callback
+
+            async def progress(event: Dict[str, Any]) -> None:
+                if callback:
+                    await callback({**event, "project_id": agent.project_id})
+
+            service = MindMapGenerationService(agent.document_repo, agent.mind_map_node_repo)
+            try:
+                result = await service.generate(mind_map, file_id=params.get("file_id"), progress=progress)
+            except ValueError as e:
+                return dumps_compact({"error": str(e)})
+            except Exception as e:
+                logger.exception("生成思维导图失败")
+                return dumps_compact({"error": f"生成思维导图失败: {str(e)}"})
+
+            return dumps_compact({"success": True, **result})
 
         @tool
         async def query_file_documents(input_str: str) -> str:
@@ -222,36 +360,38 @@ class NoteAgentService(AgentService):
             查询指定文件ID的所有文档概览信息，包含文档ID和标签信息。
 
             参数:
-                input_str: 输入参数JSON字符串，格式为 {"file_id": 文件ID}
+                input_str: 输入参数JSON字符串，格式为 {"file_id": 文件ID, "cursor": 续读游标(可选)}
 
             返回:
-                该文件的所有文档ID和标签列表，JSON格式
+                该文件的文档表格（columns 为 id、sequence、label），按序号排序；next_cursor 不为空时可续读
             """
+            agent = self._bound()
             params = json.loads(input_str) if isinstance(input_str, str) else input_str
             file_id = params.get("file_id")
 
-            documents = await self.document_repo.get_by_file_id(file_id)
+            documents = await agent.document_repo.get_by_file_id(file_id)
 
             if not documents:
                 return f"找不到文件ID为{file_id}的文档记录"
 
-            document_overviews = []
-            for doc in documents:
-                document_overviews.append({
-                    "id": doc.id,
-                    "label": doc.label if doc.label else "未标记",
-                    "sequence": doc.sequence
-                })
-
-            document_overviews.sort(key=lambda x: x["sequence"])
+            documents = sorted(documents, key=lambda doc: doc.sequence)
+            table, next_cursor = paginate_rows(
+                documents,
+                ("id", "sequence", "label"),
+                get_tool_token_cap("query_file_documents"),
+                params.get("cursor") or 0
+            )
+            for row in table["rows"]:
+                row[2] = row[2] or "未标记"
 
             result = {
                 "file_id": file_id,
-                "total_documents": len(document_overviews),
-                "documents": document_overviews
+                "total_documents": len(documents),
+                **table,
+                "next_cursor": next_cursor
             }
 
-            return json.dumps(result, ensure_ascii=False, indent=2)
+            return dumps_compact(result)
 
         @tool
         async def get_document_by_id(input_str: str) -> str:
@@ -259,34 +399,38 @@ class NoteAgentService(AgentService):
             根据文档ID查询完整的文档信息，包括内容、元数据等。
 
             参数:
-                input_str: 输入参数JSON字符串，格式为 {"document_id": 文档ID}
+                input_str: 输入参数JSON字符串，格式为 {"document_id": 文档ID, "offset": 内容续读偏移(可选)}
 
             返回:
-                完整的文档信息，JSON格式
+                文档信息，JSON格式；内容过长时截断，next_offset 不为空时可续读
             """
+            agent = self._bound()
             params = json.loads(input_str) if isinstance(input_str, str) else input_str
             document_id = params.get("document_id")
 
-            document = await self.document_repo.get_by_id(document_id)
+            document = await agent.document_repo.get_by_id(document_id)
             if not document:
                 return f"找不到ID为{document_id}的文档"
 
-            document_dict = {
-                "id": document.id,
-                "file_id": document.file_id,
-                "content": document.content,
-                "sequence": document.sequence,
-                "create_time": document.create_time,
-                "update_time": document.update_time,
-            }
+            document_dict = project(
+                document, ("id", "file_id", "sequence", "create_time", "update_time")
+            )
+            content, next_offset = slice_text_by_tokens(
+                document.content, get_tool_token_cap("get_document_by_id"), params.get("offset") or 0
+            )
+            document_dict["content"] = content
+            if next_offset is not None:
+                document_dict["next_offset"] = next_offset
 
-            return json.dumps(document_dict, ensure_ascii=False, indent=2)
+            return dumps_compact(document_dict)
 
         tools.extend([
             query_mind_map_tree,
             batch_add_child_nodes,
             update_mind_map_node,
             delete_mind_map_node,
+            apply_mind_map_ops,
+            generate_mind_map,
             query_file_documents,
             get_document_by_id
         ])
@@ -339,4 +483,4 @@ class NoteAgentService(AgentService):
             'project_id': project_id
         })
 
-        self.all_thoughts.append(f"工具[{tool_name}]输出: {tool_output}\n")
+        self.all_thoughts.add_tool_output(tool_name, tool_output)
@@ -2,18 +2,65 @@
 查询改写服务 — 利用LLM结合对话历史将后续问题改写为独立的搜索查询
 
 提示词模板从 readify_eval 数据库加载（template_code='query_rewrite'）。
+改写结果按 (对话历史哈希, 查询) 缓存；不含指代词且足够长的独立查询直接跳过改写。
 """
+import difflib
+import hashlib
 import logging
-from typing import Optional, Tuple
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain_core.language_models import BaseChatModel
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import HumanMessage, SystemMessage
 
 from app.core.config import settings
 from app.core.llm_factory import create_chat_model
 
 logger = logging.getLogger(__name__)
 
+# 出现这些指代/承接词时，查询通常依赖对话历史才能理解
+_REFERENCE_TERMS = (
+    "它", "他们", "她们", "它们", "这个", "那个", "这些", "那些", "这里", "那里", "这篇", "那篇",
+    "这本", "那本", "这段", "那段", "上述", "上面", "前面", "刚才", "之前", "上一", "其中", "该",
+    "继续", "还有", "呢",
+)
+_REFERENCE_WORDS_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|above|previous|former|latter|same|more)\b",
+    re.IGNORECASE,
+)
+_NORMALIZE_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def _normalize(text: str) -> str:
+    return _NORMALIZE_PATTERN.sub("", text).lower()
+
+
+def merge_search_results(
+    primary: List[Dict[str, Any]],
+    secondary: List[Dict[str, Any]],
+    top_k: int
+) -> List[Dict[str, Any]]:
+    """
+    合并两次向量检索的结果：按 (文件, 内容) 去重保留距离更小者，再按距离排序截取 top_k
+
+    Args:
+        primary: 原始查询的检索结果
+        secondary: 改写查询的检索结果
+        top_k: 返回结果数量
+
+    Returns:
+        List[Dict[str, Any]]: 合并后的检索结果
+    """
+    merged: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+    for result in list(primary or []) + list(secondary or []):
+        key = (result.get("file_id"), result.get("content", ""))
+        existing = merged.get(key)
+        if existing is None or result.get("distance", 1.0) < existing.get("distance", 1.0):
+            merged[key] = result
+    return sorted(merged.values(), key=lambda item: item.get("distance", 1.0))[:top_k]
+
 
 class QueryRewriteService:
     """
@@ -27,12 +74,14 @@ class QueryRewriteService:
         self._system_prompt: Optional[str] = None
         self._user_prompt_template: Optional[str] = None
         self._loaded = False
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
 
     def _get_llm(self) -> BaseChatModel:
         if self._llm is None:
             self._llm = create_chat_model(
                 temperature=self.temperature,
                 max_tokens=self.max_tokens,
+                profile="rewrite",
             )
         return self._llm
 
@@ -58,6 +107,77 @@ class QueryRewriteService:
                     "有" if self._system_prompt else "无")
         return self._system_prompt, self._user_prompt_template
 
+    @staticmethod
+    def needs_rewrite(query: str) -> bool:
+        """
+        本地启发式判断查询是否依赖对话历史：过短或包含指代/承接词时才需要改写
+
+        Args:
+            query: 原始搜索查询
+
+        Returns:
+            bool: 是否需要改写
+        """
+        stripped = (query or "").strip()
+        if len(_normalize(stripped)) < settings.QUERY_REWRITE_MIN_QUERY_CHARS:
+            return True
+        if any(term in stripped for term in _REFERENCE_TERMS):
+            return True
+        return bool(_REFERENCE_WORDS_PATTERN.search(stripped))
+
+    @staticmethod
+    def is_material_change(original: str, rewritten: str) -> bool:
+        """
+        判断改写结果与原查询是否有实质差异（忽略大小写、空白与标点后的相似度低于阈值）
+
+        Args:
+            original: 原始查询
+            rewritten: 改写后的查询
+
+        Returns:
+            bool: 是否有实质差异
+        """
+        left, right = _normalize(original), _normalize(rewritten)
+        if left == right:
+            return False
+        return difflib.SequenceMatcher(None, left, right).ratio() < settings.QUERY_REWRITE_SIMILARITY_THRESHOLD
+
+    @staticmethod
+    def _cache_key(query: str, conversation_history: str) -> Tuple[str, str]:
+        history_hash = hashlib.sha1(conversation_history.encode("utf-8")).hexdigest()
+        return history_hash, query.strip()
+
+    def get_cached(self, query: str, conversation_history: str) -> Optional[str]:
+        """
+        读取改写缓存
+
+        Args:
+            query: 原始搜索查询
+            conversation_history: 格式化的对话历史文本
+
+        Returns:
+            缓存的改写结果；未命中或已过期时返回 None
+        """
+        key = self._cache_key(query, conversation_history)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, rewritten = entry
+        if expires_at < time.monotonic():
+            self._cache.pop(key, None)
+            return None
+        self._cache.move_to_end(key)
+        return rewritten
+
+    def _put_cache(self, query: str, conversation_history: str, rewritten: str) -> None:
+        if settings.QUERY_REWRITE_CACHE_SIZE <= 0:
+            return
+        key = self._cache_key(query, conversation_history)
+        self._cache[key] = (time.monotonic() + settings.QUERY_REWRITE_CACHE_TTL, rewritten)
+        self._cache.move_to_end(key)
+        while len(self._cache) > settings.QUERY_REWRITE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
     async def rewrite(self, query: str, conversation_history: str) -> str:
         """
         根据对话历史将查询改写为独立的搜索查询。
@@ -73,6 +193,15 @@ class QueryRewriteService:
             logger.debug("[QueryRewrite] 无对话历史，跳过改写")
             return query
 
+        if not self.needs_rewrite(query):
+            logger.debug("[QueryRewrite] 查询可独立理解，跳过改写: '%s'", query)
+            return query
+
+        cached = self.get_cached(query, conversation_history)
+        if cached is not None:
+            logger.debug("[QueryRewrite] 命中改写缓存: '%s' -> '%s'", query, cached)
+            return cached
+
         try:
             system_prompt, user_template = await self._load_prompts()
             user_text = user_template.format(history=conversation_history, query=query)
@@ -93,7 +222,19 @@ class QueryRewriteService:
                 logger.warning("[QueryRewrite] LLM 返回空结果，使用原始查询")
                 return query
             logger.info("[QueryRewrite] 改写: '%s' -> '%s'", query, rewritten)
+            self._put_cache(query, conversation_history, rewritten)
             return rewritten
         except Exception as e:
             logger.error("[QueryRewrite] LLM 调用失败: %s，使用原始查询", str(e))
             return query
+
+
+_service_instance: Optional[QueryRewriteService] = None
+
+
+def get_query_rewrite_service() -> QueryRewriteService:
+    """获取全局单例 QueryRewriteService（改写缓存在请求间共享）"""
+    global _service_instance
+    if _service_instance is None:
+        _service_instance = QueryRewriteService()
+    return _service_instance
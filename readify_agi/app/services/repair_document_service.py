@@ -3,9 +3,9 @@ import json
 import logging
 import time
 import traceback
-from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+from app.core.config import settings
 from app.core.database import async_session_maker
 from app.models.repair_document import RepairDocumentCreate
 from app.repositories.document_repository import DocumentRepository
@@ -30,7 +30,6 @@ class RepairDocumentService:
         self.document_repository = document_repository
         self.file_repository = file_repository
         self.text_repair_service = text_repair_service
-        self.thread_pool = ThreadPoolExecutor(max_workers=3)
 
     async def _repair_and_save_task(self, file_id: int) -> None:
         """
@@ -64,42 +63,33 @@ class RepairDocumentService:
 
                 documents.sort(key=lambda x: x.sequence)
 
-                repair_creates = []
-                sequence = 0
                 total_docs = len(documents)
+                semaphore = asyncio.Semaphore(max(settings.REPAIR_CONCURRENCY, 1))
+
+                async def _repair(index: int, doc) -> List[str]:
+                    async with semaphore:
+                        logger.info("正在处理第 %d/%d 个文档块", index, total_docs)
+                        logger.debug("文档ID: %d, 序号: %d", doc.id, doc.sequence)
+                        paragraphs = await self._repair_document_content(doc)
+                        logger.info("文档块 %d/%d 处理完成，生成了 %d 个段落", index, total_docs, len(paragraphs))
+                        return paragraphs
+
+                # 文档块并发修复，结果按文档块顺序编号
+                results = await asyncio.gather(
+                    *(_repair(index, doc) for index, doc in enumerate(documents, 1))
+                )
 
-                for index, doc in enumerate(documents, 1):
-                    logger.info("正在处理第 %d/%d 个文档块", index, total_docs)
-                    logger.debug("文档ID: %d, 序号: %d", doc.id, doc.sequence)
-                    logger.debug("原始内容: %s...", doc.content[:100])
-
-                    logger.info("开始修复文本...")
-                    repair_result = await self.text_repair_service.repair_text(doc.content)
-
-                    if isinstance(repair_result, str):
-                        try:
-                            paragraphs = json.loads(repair_result)
-                            if not isinstance(paragraphs, list):
-                                paragraphs = [repair_result]
-                        except json.JSONDecodeError:
-                            paragraphs = [repair_result]
-                    else:
-                        paragraphs = repair_result if isinstance(repair_result, list) else [repair_result]
-
-                    logger.info("文本修复完成，生成了 %d 个段落", len(paragraphs))
-
-                    for p_index, paragraph in enumerate(paragraphs, 1):
-                        logger.debug("处理第 %d/%d 个段落", p_index, len(paragraphs))
-                        repair_create = RepairDocumentCreate(
+                repair_creates = []
+                sequence = 0
+                for paragraphs in results:
+                    for paragraph in paragraphs:
+                        repair_creates.append(RepairDocumentCreate(
                             file_id=file_id,
                             content=paragraph,
                             sequence=sequence
-                        )
-                        repair_creates.append(repair_create)
+                        ))
                         sequence += 1
 
-                    logger.info("文档块 %d/%d 处理完成", index, total_docs)
-
                 if repair_creates:
                     logger.info("开始保存 %d 个修复后的文档记录...", len(repair_creates))
                     await repair_doc_repo.create_many(repair_creates)
@@ -115,6 +105,33 @@ class RepairDocumentService:
             logger.error("错误详情: %s", str(e))
             logger.error("堆栈信息:\n%s", traceback.format_exc())
 
+    async def _repair_document_content(self, doc) -> List[str]:
+        """
+        修复单个文档块，修复失败时保留原文，避免一个文档块失败导致整个文件的修复结果丢失
+
+        Args:
+            doc: 文档块
+
+        Returns:
+            List[str]: 修复并分段后的段落
+        """
+        try:
+            repair_result = await self.text_repair_service.repair_text(doc.content)
+        except Exception as e:
+            logger.error("修复文档块 %d 失败，保留原文: %s", doc.id, str(e))
+            return [doc.content]
+
+        if isinstance(repair_result, str):
+            try:
+                paragraphs = json.loads(repair_result)
+                if not isinstance(paragraphs, list):
+                    paragraphs = [repair_result]
+            except json.JSONDecodeError:
+                paragraphs = [repair_result]
+        else:
+            paragraphs = repair_result if isinstance(repair_result, list) else [repair_result]
+        return paragraphs
+
     async def repair_and_save(self, file_id: int) -> None:
         """
         在后台启动文档修复任务
@@ -0,0 +1,171 @@
+"""
+文本缺陷预检 — 在调用 LLM 修复前用本地规则判断文档块是否需要修复
+
+检测修复工作流提示词中列出的几类问题：
+- 乱码：连续的无意义符号、替换字符（�）、私用区字符与控制字符；
+- 温度单位：°C 被识别为 oC；
+- 双栏结构：多行文本中间存在大段空白，左右两栏被拼在同一行；
+- 异常字符序列：被空格拆开的中文、同一字符异常重复、生僻的兼容/扩展区汉字、数字中混入 O/l 等形近字母。
+
+未发现问题的文档块直接在本地分段，只有可疑的文档块才交给 LLM 工作流。
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+# 连续 3 个及以上的无意义符号（数学符号、货币金额、百分比等不在其中）
+_SYMBOL_RUN = re.compile(r"[#￥$%&@^~|\\`¤§¶†‡※■□◆◇▲△▼▽●○]{3,}")
+_BROKEN_CHARS = re.compile(r"[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]")
+_TEMPERATURE_OC = re.compile(r"\d\s?[oO]C(?![A-Za-z])")
+_COLUMN_GAP = re.compile(r"\S(?: {4,}|\t+)\S")
+_SPACED_CJK = re.compile(r"(?:[\u4e00-\u9fff] ){3,}[\u4e00-\u9fff]")
+_REPEATED_CHAR = re.compile(r"([^\s\d.\-_=*·。，、…—])\1{3,}")
+_RARE_CJK = re.compile(r"[\u3400-\u4dbf\uf900-\ufaff]")
+_DIGIT_LOOKALIKE = re.compile(r"(?<![A-Za-z0-9])\d+(?:[OolI]\d+|\d[OolI])(?![A-Za-z0-9])")
+
+_SENTENCE_END = ("。", "！", "？", "；", "…", ".", "!", "?", ";", ":", "：", "”", "\"", "」", "』", "）", ")")
+
+
+@dataclass
+class TextDefect:
+    """检测到的单个问题，字段与修复工作流的问题格式一致"""
+    type: str
+    description: str
+
+    def model_dump(self) -> Dict[str, str]:
+        return {"type": self.type, "description": self.description}
+
+
+@dataclass
+class DefectReport:
+    """文档块预检结果"""
+    defects: List[TextDefect] = field(default_factory=list)
+
+    @property
+    def suspicious(self) -> bool:
+        return bool(self.defects)
+
+
+def _excerpt(text: str, start: int, end: int, padding: int = 10) -> str:
+    return text[max(start - padding, 0):end + padding].replace("\n", " ")
+
+
+def detect_text_defects(text: str) -> DefectReport:
+    """
+    检测文档块中需要 LLM 修复的问题
+
+    Args:
+        text: 文档块内容
+
+    Returns:
+        DefectReport: 预检结果
+    """
+    report = DefectReport()
+    if not text or not text.strip():
+        return report
+
+    match = _SYMBOL_RUN.search(text) or _BROKEN_CHARS.search(text)
+    if match:
+        report.defects.append(TextDefect("乱码", f"句子：{_excerpt(text, match.start(), match.end())}中出现乱码：{match.group(0)!r}"))
+
+    match = _TEMPERATURE_OC.search(text)
+    if match:
+        report.defects.append(TextDefect("特殊符号错误", f"温度单位被识别为'oC'：{_excerpt(text, match.start(), match.end())}"))
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    column_lines = [line for line in lines if _COLUMN_GAP.search(line.strip())]
+    if len(column_lines) >= settings.REPAIR_PRESCREEN_COLUMN_MIN_LINES and len(column_lines) * 3 >= len(lines):
+        report.defects.append(TextDefect("双栏结构", f"{len(column_lines)}/{len(lines)} 行中间存在大段空白，疑似左右两栏拼接：{column_lines[0].strip()[:60]}"))
+
+    for pattern, description in (
+        (_SPACED_CJK, "中文被空格拆开"),
+        (_REPEATED_CHAR, "同一字符异常重复"),
+        (_DIGIT_LOOKALIKE, "数字中混入形近字母"),
+    ):
+        match = pattern.search(text)
+        if match:
+            report.defects.append(TextDefect("异常字符", f"{description}：{_excerpt(text, match.start(), match.end())}"))
+
+    rare = _RARE_CJK.findall(text)
+    if len(rare) >= 2:
+        report.defects.append(TextDefect("异常字符", f"出现生僻字符：{''.join(rare[:10])}"))
+    return report
+
+
+def _join_lines(lines: List[str]) -> str:
+    """把被硬换行拆开的行拼回段落，英文单词间补空格、去掉行尾连字符"""
+    joined = ""
+    for line in lines:
+        if not joined:
+            joined = line
+        elif joined.endswith("-") and joined[-2:-1].isalpha() and line[:1].isalpha():
+            joined = joined[:-1] + line
+        elif joined[-1:].isascii() and line[:1].isascii() and line[:1].isalnum():
+            joined += " " + line
+        else:
+            joined += line
+    return joined
+
+
+def split_paragraphs_locally(text: str, min_chars: Optional[int] = None) -> List[str]:
+    """
+    在本地把干净的文本分段：空行处分段，未以句末标点结尾的行视为硬换行并拼接，过短的段落并入下一段
+
+    Args:
+        text: 文档块内容
+        min_chars: 段落最少字符数，默认 REPAIR_PARAGRAPH_MIN_CHARS
+
+    Returns:
+        List[str]: 段落列表
+    """
+    min_chars = settings.REPAIR_PARAGRAPH_MIN_CHARS if min_chars is None else min_chars
+    lines = [line.strip() for line in (text or "").splitlines()]
+    non_blank = [line for line in lines if line]
+    width = max((len(line) for line in non_blank), default=0)
+    # 大部分行接近最大行宽时视为按固定宽度硬换行的文本，此时只有明显变短的行才可能是段落末行
+    hard_wrapped = len(non_blank) >= 3 and sum(len(line) >= width * 0.8 for line in non_blank) >= len(non_blank) * 0.6
+
+    paragraphs: List[str] = []
+    current: List[str] = []
+    for line in lines:
+        if not line:
+            if current:
+                paragraphs.append(_join_lines(current))
+                current = []
+            continue
+        current.append(line)
+        if line.endswith(_SENTENCE_END) and (not hard_wrapped or len(line) < width * 0.8):
+            paragraphs.append(_join_lines(current))
+            current = []
+    if current:
+        paragraphs.append(_join_lines(current))
+
+    merged: List[str] = []
+    for paragraph in paragraphs:
+        if merged and len(merged[-1]) < min_chars:
+            merged[-1] = f"{merged[-1]}\n{paragraph}"
+        else:
+            merged.append(paragraph)
+    return merged
+
+
+def prescreen_result(text: str, report: DefectReport) -> Dict[str, Any]:
+    """
+    生成与修复工作流相同结构的结果，供预检无问题的文档块直接返回
+
+    Args:
+        text: 文档块内容
+        report: 预检结果
+
+    Returns:
+        Dict[str, Any]: 修复结果
+    """
+    return {
+        "source_text": text,
+        "format_issues": [defect.model_dump() for defect in report.defects],
+        "fixed_text": text,
+        "paragraphs": split_paragraphs_locally(text),
+        "prescreened": True,
+    }
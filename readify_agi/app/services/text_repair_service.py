@@ -1,11 +1,11 @@
 from typing import List
-from app.services.text_workflow_service import TextWorkflowService
+from app.services.text_workflow_service import get_text_workflow_service
 
 class TextRepairService:
     """文本修复服务"""
     
     def __init__(self):
-        self.workflow_service = TextWorkflowService()
+        self.workflow_service = get_text_workflow_service()
         
     async def repair_text(self, text: str) -> List[str]:
         """
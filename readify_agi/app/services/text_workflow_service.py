@@ -5,12 +5,13 @@ from typing import Dict, Any, List, Literal
 
 import Agently
 import dotenv
-import httpx
 from pydantic import BaseModel, Field
 
 from app.core.config import settings
 from app.core.llm_factory import get_default_headers
-from ..utils.OutputParser import parse_to_type
+from app.core.llm_http_pool import get_llm_http_pool
+from app.services.text_defect_detector import detect_text_defects, prescreen_result
+from ..utils.OutputParser import aparse_to_type
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,7 @@ def _patch_agently_claude_headers(custom_headers: Dict[str, str]):
     """
     Monkey-patch Agently Claude 插件的 request_model 方法以注入自定义 HTTP headers。
     Agently Claude 插件（Agently/plugins/request/Claude.py）硬编码了 headers，
-    不支持通过 settings 配置，因此需要 patch。
+    不支持通过 settings 配置，因此需要 patch。请求复用进程内共享的 LLM HTTP 连接池。
     """
     from Agently.plugins.request.Claude import Claude
 
@@ -56,22 +57,45 @@ def _patch_agently_claude_headers(custom_headers: Dict[str, str]):
             "data": json.dumps({"messages": request_messages, **options}),
             "timeout": None,
         }
-        client_params = {}
-        if proxy:
-            client_params["proxy"] = proxy
-        async with httpx.AsyncClient(**client_params) as client:
-            async with client.stream(
-                "POST",
-                f"{base_url}/messages",
-                **request_params
-            ) as response:
-                async for chunk in response.aiter_lines():
-                    yield chunk
+        client = get_llm_http_pool().get_async_client("anthropic", base_url, proxy=proxy)
+        async with client.stream(
+            "POST",
+            f"{base_url}/messages",
+            **request_params
+        ) as response:
+            async for chunk in response.aiter_lines():
+                yield chunk
 
     Claude.request_model = _patched_request_model
     logger.info("[TextWorkflow] 已 patch Agently Claude 插件以注入自定义 headers")
 
 
+def _patch_agently_openai_client(custom_headers: Dict[str, str]):
+    """
+    Monkey-patch Agently OpenAI 插件的 _create_client 方法，复用共享 LLM HTTP 连接池。
+    原实现每次请求都新建 httpx.AsyncClient 并强制 Connection: close，无法复用连接。
+    """
+    from openai import AsyncOpenAI
+    from Agently.plugins.request.OpenAI import OpenAI
+
+    def _patched_create_client(self):
+        api_key = self.model_settings.get_trace_back("auth.api_key")
+        if not api_key:
+            raise Exception("[Request] OpenAI require api_key. use .set_auth({ 'api_key': '<Your-API-Key>' }) to set it.")
+        base_url = self.model_settings.get_trace_back("url")
+        proxy = self.request.settings.get_trace_back("proxy")
+        http_client = get_llm_http_pool().get_async_client("openai", base_url or "", proxy=proxy)
+        client_params = {"api_key": api_key, "http_client": http_client}
+        if base_url:
+            client_params["base_url"] = base_url
+        if custom_headers:
+            client_params["default_headers"] = custom_headers
+        return AsyncOpenAI(**client_params)
+
+    OpenAI._create_client = _patched_create_client
+    logger.info("[TextWorkflow] 已 patch Agently OpenAI 插件以复用共享连接池")
+
+
 class CheckFormat(BaseModel):
     type: str = Field(..., description="问题类型")
     description: str = Field(description="问题描述，需包含具体上下文信息如：")
@@ -100,9 +124,8 @@ class TextWorkflowService:
         # 创建 agent 工厂并根据 provider 配置
         custom_headers = get_default_headers()
         if provider == "anthropic":
-            # Agently Claude 插件不支持自定义 headers，需要 monkey-patch
-            if custom_headers:
-                _patch_agently_claude_headers(custom_headers)
+            # Agently Claude 插件不支持自定义 headers 与连接复用，需要 monkey-patch
+            _patch_agently_claude_headers(custom_headers)
             self.agent_factory = (
                 Agently.AgentFactory()
                 .set_settings("current_model", "Claude")
@@ -123,21 +146,21 @@ class TextWorkflowService:
             # 如果配置了自定义 API 地址，则设置
             if settings.LLM_API_BASE and settings.LLM_API_BASE != "https://api.openai.com/v1":
                 self.agent_factory.set_settings("model.OpenAI.url", settings.LLM_API_BASE)
-            # 注入自定义 headers（通过自定义 httpx 客户端）
-            if custom_headers:
-                self.agent_factory.set_settings(
-                    "model.OpenAI.httpx_client",
-                    httpx.AsyncClient(headers=custom_headers),
-                )
+            # 复用共享连接池并注入自定义 headers
+            _patch_agently_openai_client(custom_headers)
         
-        # 创建工作流
-        self.workflow = Agently.Workflow()
-        self._setup_workflows()
+    def _create_workflow(self) -> Agently.Workflow:
+        """
+        创建一次修复使用的工作流
+
+        Agently 工作流的运行状态保存在工作流实例上，并发修复时每次使用独立的工作流，
+        模型配置（agent_factory）在服务内共享。工作块均为异步函数，模型调用不阻塞事件循环。
+        """
+        workflow = Agently.Workflow()
 
-    def _setup_workflows(self):
         # 检查工作块
-        @self.workflow.chunk()
-        def check_format(inputs, storage):
+        @workflow.chunk()
+        async def check_format(inputs, storage):
 
             check_format_agent = self.agent_factory.create_agent("check_format")
             check_format_agent.set_agent_prompt("role", "你是一个专业的文本格式检查员,专业核对被机器学习识别出的文本错误")
@@ -154,21 +177,25 @@ class TextWorkflowService:
 - 数学公式中的特殊符号
 - 合理的数字符号（如$20、5%）
                                                 """)
-            check_format_agent.set_agent_prompt("output", """以纯json数组文本格式输出检查出来的问题：\n[{\"type\":\"问题类型\",\"description\":\"问题描述\"}]""")
-            check_format_agent.set_agent_prompt("example", """示例输出：
-            [{
-              "type": "乱码",
-              "description": "句子：xxx中出现乱码：#￥%",
-            }]
-            请严格按此格式输出""")
-            check_result = check_format_agent.input(f"需要检查的文本如下：{storage.get('source_text')}").start()
-            issue = parse_to_type("提取以下内容中的描述的问题", check_result, ListCheckFormat)
-            print(f"check_format中的issues: {json.dumps([issue.model_dump() for issue in issue.issues], ensure_ascii=False)}")
+            # 按输出结构直接生成 JSON，Agently 负责解析，避免再调用一次 LLM 抽取
+            check_result = await (
+                check_format_agent
+                .input(f"需要检查的文本如下：{storage.get('source_text')}")
+                .output({
+                    "issues": [{
+                        "type": ("str", "问题类型，如：乱码、错别字、文字顺序错误、双栏结构、特殊符号错误"),
+                        "description": ("str", "问题描述，需包含具体上下文信息，如：句子：xxx中出现乱码：#￥%"),
+                    }],
+                })
+                .start_async()
+            )
+            issue = await aparse_to_type("提取以下内容中的描述的问题", check_result, ListCheckFormat)
+            logger.debug("check_format中的issues: %s", json.dumps([issue.model_dump() for issue in issue.issues], ensure_ascii=False))
             storage.set("format_issues", issue.issues)
 
         # 修复格式
-        @self.workflow.chunk()
-        def fix_format(inputs, storage):
+        @workflow.chunk()
+        async def fix_format(inputs, storage):
             fix_format_agent = self.agent_factory.create_agent("fix_format")
             fix_format_agent.set_agent_prompt("role", "你是一个专业的文本格式修复员,专业修复被机器学习识别出的文本问题")
             fix_format_agent.set_agent_prompt("rule", """
@@ -187,14 +214,21 @@ class TextWorkflowService:
                                                         2. 保持每个段落完整性，不合并跨栏内容
                                                     **不要丢弃任何正常文本**
                                                 """)
-            fix_format_agent.set_agent_prompt("output", """直接输出标准的JSON数组格式，不要包含任何Markdown语法或额外说明，fixed_text请直接输出修复后的文本：{"origin_text":"", "fixed_text":""}""")
-            fix_result = fix_format_agent.input(f"需要修复的原始文本：{storage.get('source_text')}\n 需要修复的格式问题：{storage.get('format_issues')} ").start()
-            fix_result = parse_to_type("提取文本中的source_text和fixed_text", fix_result, FixFormat)
+            fix_result = await (
+                fix_format_agent
+                .input(f"需要修复的原始文本：{storage.get('source_text')}\n 需要修复的格式问题：{storage.get('format_issues')} ")
+                .output({
+                    "origin_text": ("str", "原始文本"),
+                    "fixed_text": ("str", "修复后的完整文本"),
+                })
+                .start_async()
+            )
+            fix_result = await aparse_to_type("提取文本中的source_text和fixed_text", fix_result, FixFormat)
             storage.set("fixed_text", fix_result.fixed_text)
 
         # 语义分段工作块
-        @self.workflow.chunk()
-        def split_paragraphs(inputs, storage):
+        @workflow.chunk()
+        async def split_paragraphs(inputs, storage):
             split_paragraphs_agent = self.agent_factory.create_agent("split_paragraphs")
             split_paragraphs_agent.set_agent_prompt("role", "你是一个专业的文本语义分析员，擅长根据内容主题进行段落划分")
             split_paragraphs_agent.set_agent_prompt("rule", """
@@ -209,7 +243,7 @@ class TextWorkflowService:
                                                     6. **每个段落不要太小**
                                                 """)
             split_paragraphs_agent.set_agent_prompt("output", """请将内容分段处理，直接输出标准的JSON数组格式，不要包含任何Markdown语法或额外说明。示例格式：["段落1完整内容","段落2完整内容"]""")
-            paragraphs = split_paragraphs_agent.input(f"需要分段的文本：{storage.get('fixed_text')}").start()
+            paragraphs = await split_paragraphs_agent.input(f"需要分段的文本：{storage.get('fixed_text')}").start_async()
             storage.set("paragraphs", paragraphs)
             return {
                 "paragraphs": paragraphs,
@@ -221,24 +255,41 @@ class TextWorkflowService:
 
         # 连接工作流
         (
-            self.workflow
+            workflow
             .connect_to("check_format")
             .connect_to("fix_format")
             .connect_to("split_paragraphs")
             .connect_to("end")
         )
+        return workflow
 
     async def text_repair(self, text: str) -> Dict[str, Any]:
         """
-        修复文本的完整工作流
+        修复文本的完整工作流，本地预检未发现问题的文本直接在本地分段，不调用 LLM
         """
+        if settings.REPAIR_PRESCREEN_ENABLED:
+            report = detect_text_defects(text)
+            if not report.suspicious:
+                return prescreen_result(text, report)
+            logger.debug("预检发现问题，进入 LLM 修复: %s", [defect.model_dump() for defect in report.defects])
         storage={"source_text": text}
-        workflow_result = await self.workflow.start_async(storage=storage)
+        workflow_result = await self._create_workflow().start_async(storage=storage)
         result = workflow_result.get("default")
-        print(f"process_text中的format_issues: {result.get('format_issues')}")
+        logger.debug("process_text中的format_issues: %s", result.get('format_issues'))
         return {
             "source_text": text,
             "format_issues": [issue.model_dump() for issue in result.get("format_issues", [])] if result.get("format_issues") else [],
             "fixed_text": result.get("fixed_text"),
             "paragraphs": result.get("paragraphs")
-        }
\ No newline at end of file
+        }
+
+
+_service_instance = None
+
+
+def get_text_workflow_service() -> TextWorkflowService:
+    """获取全局单例 TextWorkflowService，Agently 模型配置与插件 patch 只初始化一次"""
+    global _service_instance
+    if _service_instance is None:
+        _service_instance = TextWorkflowService()
+    return _service_instance
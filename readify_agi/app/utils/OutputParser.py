@@ -1,11 +1,25 @@
+"""
+结构化输出解析 — 把 LLM 的回答解析为 Pydantic 模型
+
+按以下顺序尝试，成功即返回，并报告实际使用的路径：
+1. structured：上游已经通过 JSON 模式 / 输出结构约束拿到结构化数据（dict / list / 模型实例），直接校验；
+2. local_repair：本地容错解析文本中的 JSON（代码块、前后多余文字、尾逗号、被截断的括号、Python 字面量等）；
+3. llm_structured：调用模型的工具调用结构化输出重新抽取；
+4. llm_fixing：最后退回提示词 + 格式说明解析，失败时再用 OutputFixingParser 修复。
+
+大部分抽取在前两步完成，不再额外调用 LLM。
+"""
+import ast
 import json
 import logging
-from typing import Any, Type, TypeVar, Optional, Dict, Union, Callable, List
+import re
+from dataclasses import dataclass, field
+from typing import Any, Type, TypeVar, Optional, List
 
-from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser, BaseOutputParser
+from langchain_core.output_parsers import BaseOutputParser, PydanticOutputParser
 from langchain.output_parsers import OutputFixingParser
 from langchain_core.prompts import PromptTemplate
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ValidationError
 
 from app.core.llm_factory import create_chat_model
 
@@ -13,79 +27,234 @@ logger = logging.getLogger(__name__)
 
 T = TypeVar('T', bound=BaseModel)
 
-def _create_parser(parser_type: Type[BaseOutputParser], pydantic: Type[T]) -> BaseOutputParser:
+PATH_STRUCTURED = "structured"
+PATH_LOCAL_REPAIR = "local_repair"
+PATH_LLM_STRUCTURED = "llm_structured"
+PATH_LLM_FIXING = "llm_fixing"
+
+_THINK_BLOCK = re.compile(r"<think(?:ing)?>.*?</think(?:ing)?>", re.S)
+_CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.S)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSING = {"{": "}", "[": "]"}
+
+
+@dataclass
+class ParseReport:
+    """解析结果与实际使用的解析路径"""
+    value: Any
+    path: str
+    errors: List[str] = field(default_factory=list)
+
+
+def _extract_json_span(text: str) -> str:
     """
-    创建指定类型的解析器
-    
-    Args:
-        parser_type: 解析器类型(JsonOutputParser或PydanticOutputParser)
-        pydantic: Pydantic模型类
-        
-    Returns:
-        解析器实例
+    截取第一个 JSON 对象或数组；括号未闭合（输出被截断）时补齐未闭合的字符串与括号
     """
-    return parser_type(pydantic_object=pydantic)
-
-def _parse_with_llm(
-    instruction: str,
-    source_text: str,
-    parser: BaseOutputParser,
-    model: str = "gpt-4o-mini"
-) -> Any:
+    start = next((index for index, char in enumerate(text) if char in "{["), None)
+    if start is None:
+        raise ValueError("文本中没有 JSON 对象或数组")
+
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSING:
+            stack.append(_CLOSING[char])
+        elif char in "}]" and stack:
+            stack.pop()
+            if not stack:
+                return text[start:index + 1]
+
+    span = text[start:].rstrip().rstrip(",")
+    if in_string:
+        span += '"'
+    return span + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Any:
     """
-    使用LLM进行解析的核心逻辑
+    本地容错解析 LLM 输出中的 JSON
 
     Args:
-        instruction: 提取指令
-        source_text: 提取源文本
-        parser: 解析器实例
-        model: 模型名称（当 LLM_PROVIDER=openai 时生效，anthropic 时使用统一配置）
+        text: LLM 输出文本
 
     Returns:
-        解析结果
+        Any: 解析后的 JSON 数据
 
     Raises:
-        ValueError: 当解析失败且无法修复时抛出
+        ValueError: 无法解析时抛出
     """
-    # 创建LLM
-    llm = create_chat_model(temperature=0.7)
-    
-    # 创建提示模板
+    text = _THINK_BLOCK.sub("", text or "").strip()
+    fenced = _CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+
+    span = _extract_json_span(text)
+    candidates = [span, _TRAILING_COMMA.sub(r"\1", span)]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate, strict=False)
+        except json.JSONDecodeError:
+            continue
+    try:
+        # 单引号、True / None 等 Python 字面量
+        return ast.literal_eval(candidates[-1])
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(f"无法解析 JSON: {e}") from e
+
+
+def _validate(pydantic: Type[T], data: Any) -> T:
+    """校验为模型实例；模型只有一个字段而数据是数组时，把数组作为该字段的值"""
+    if isinstance(data, pydantic):
+        return data
+    if isinstance(data, BaseModel):
+        data = data.model_dump()
+    if isinstance(data, list) and len(pydantic.model_fields) == 1:
+        data = {next(iter(pydantic.model_fields)): data}
+    return pydantic.model_validate(data)
+
+
+def _source_text(source: Any) -> str:
+    return source if isinstance(source, str) else json.dumps(source, ensure_ascii=False, default=str)
+
+
+def _build_prompt(instruction: str, source_text: str, parser: Optional[BaseOutputParser] = None) -> Any:
+    """构造 LLM 解析提示词，同步与异步路径共用；传入 parser 时附带格式说明"""
+    if parser is None:
+        return f"{instruction}\n提取文本：{source_text}"
     prompt = PromptTemplate(
         template="{instruction}\n提取文本：{source_text}\n{format_instructions}",
         input_variables=["instruction", "source_text"],
         partial_variables={"format_instructions": parser.get_format_instructions()}
     )
-    
-    # 调用LLM
-    input_prompt = prompt.format_prompt(instruction=instruction, source_text=source_text)
-    output = llm.invoke(input_prompt)
-    
+    return prompt.format_prompt(instruction=instruction, source_text=source_text)
+
+
+def _parse_locally(source: Any, pydantic: Type[T], report_errors: List[str]) -> Optional[ParseReport]:
+    """前两步：直接校验结构化数据或本地容错解析，失败时返回 None"""
+    if not isinstance(source, str):
+        try:
+            return ParseReport(_validate(pydantic, source), PATH_STRUCTURED, report_errors)
+        except ValidationError as e:
+            report_errors.append(f"{PATH_STRUCTURED}: {e}")
+            source = _source_text(source)
+    try:
+        return ParseReport(_validate(pydantic, repair_json(source)), PATH_LOCAL_REPAIR, report_errors)
+    except (ValueError, ValidationError) as e:
+        report_errors.append(f"{PATH_LOCAL_REPAIR}: {e}")
+    return None
+
+
+def _log_report(report: ParseReport, pydantic: Type[BaseModel]) -> ParseReport:
+    if report.errors:
+        logger.info("解析 %s 使用 %s，此前失败: %s", pydantic.__name__, report.path, report.errors)
+    else:
+        logger.debug("解析 %s 使用 %s", pydantic.__name__, report.path)
+    return report
+
+
+def parse_with_report(instruction: str, source: Any, pydantic: Type[T]) -> ParseReport:
+    """
+    把 LLM 的回答解析为 Pydantic 模型实例，并报告使用的解析路径
+
+    Args:
+        instruction: 提取指令,本地解析失败需要调用 LLM 时使用
+        source: LLM 的回答，可以是文本或已结构化的数据
+        pydantic: 定义输出类型的Pydantic模型类
+
+    Returns:
+        ParseReport: 解析结果（value 为模型实例）与解析路径
+
+    Raises:
+        ValueError: 所有路径都无法解析时抛出
+    """
+    errors: List[str] = []
+    report = _parse_locally(source, pydantic, errors)
+    if report is not None:
+        return _log_report(report, pydantic)
+
+    source_text = _source_text(source)
+    llm = create_chat_model(temperature=0, profile="parse")
+    try:
+        value = llm.with_structured_output(pydantic).invoke(_build_prompt(instruction, source_text))
+        return _log_report(ParseReport(_validate(pydantic, value), PATH_LLM_STRUCTURED, errors), pydantic)
+    except Exception as e:
+        errors.append(f"{PATH_LLM_STRUCTURED}: {e}")
+
+    parser = PydanticOutputParser(pydantic_object=pydantic)
+    output = llm.invoke(_build_prompt(instruction, source_text, parser))
     try:
-        # 尝试解析
-        return parser.invoke(output.content)
+        value = parser.invoke(output.content)
     except (json.JSONDecodeError, ValueError) as e:
-        # 解析失败，尝试使用修复解析器
         logger.warning("初次解析失败，尝试修复: %s", str(e))
-        fixing_parser = OutputFixingParser.from_llm(parser=parser, llm=llm)
-        return fixing_parser.invoke(output.content)
+        value = OutputFixingParser.from_llm(parser=parser, llm=llm).invoke(output.content)
+    return _log_report(ParseReport(value, PATH_LLM_FIXING, errors), pydantic)
+
+
+async def aparse_with_report(instruction: str, source: Any, pydantic: Type[T]) -> ParseReport:
+    """
+    parse_with_report 的异步版本，模型调用不阻塞事件循环
+
+    Args:
+        instruction: 提取指令,本地解析失败需要调用 LLM 时使用
+        source: LLM 的回答，可以是文本或已结构化的数据
+        pydantic: 定义输出类型的Pydantic模型类
+
+    Returns:
+        ParseReport: 解析结果（value 为模型实例）与解析路径
+
+    Raises:
+        ValueError: 所有路径都无法解析时抛出
+    """
+    errors: List[str] = []
+    report = _parse_locally(source, pydantic, errors)
+    if report is not None:
+        return _log_report(report, pydantic)
+
+    source_text = _source_text(source)
+    llm = create_chat_model(temperature=0, profile="parse")
+    try:
+        value = await llm.with_structured_output(pydantic).ainvoke(_build_prompt(instruction, source_text))
+        return _log_report(ParseReport(_validate(pydantic, value), PATH_LLM_STRUCTURED, errors), pydantic)
+    except Exception as e:
+        errors.append(f"{PATH_LLM_STRUCTURED}: {e}")
+
+    parser = PydanticOutputParser(pydantic_object=pydantic)
+    output = await llm.ainvoke(_build_prompt(instruction, source_text, parser))
+    try:
+        value = await parser.ainvoke(output.content)
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning("初次解析失败，尝试修复: %s", str(e))
+        value = await OutputFixingParser.from_llm(parser=parser, llm=llm).ainvoke(output.content)
+    return _log_report(ParseReport(value, PATH_LLM_FIXING, errors), pydantic)
+
 
 def parse_to_json(instruction: str, source_text: str, pydantic: Type[T], model: str = "gpt-4o-mini") -> str:
     """
     将文本解析为JSON字符串
-    
-    本函数使用LLM从源文本中提取信息,并按照指定的Pydantic模型格式输出JSON字符串。
-    如果解析失败，会自动尝试修复。
-    
+
+    按 parse_with_report 的顺序解析，只有本地解析失败时才调用LLM。
+
     Args:
         instruction: 提取指令,告诉LLM如何解析文本
         source_text: 需要提取信息的源文本
         pydantic: 定义输出格式的Pydantic模型类
-        model: 使用的LLM模型名称,默认为"gpt-4o-mini"
-        
+        model: 未使用，保留兼容，模型由 parse 模型配置决定
+
     Returns:
         符合Pydantic模型格式的JSON字符串
-        
+
     Examples:
         >>> class DateTime(BaseModel):
         ...     year: int
@@ -93,31 +262,30 @@ def parse_to_json(instruction: str, source_text: str, pydantic: Type[T], model:
         ...     day: int
         >>> result = parse_to_json(
         ...     "提取日期",
-        ...     "2024年2月24日",
+        ...     '{"year": 2024, "month": 2, "day": 24}',
         ...     DateTime
         ... )
         >>> print(result)
         {"year": 2024, "month": 2, "day": 24}
     """
-    parser = _create_parser(JsonOutputParser, pydantic)
-    result = _parse_with_llm(instruction, source_text, parser, model)
-    return json.dumps(result, ensure_ascii=False)
-def parse_to_type(instruction: str, source_text: str, pydantic: Type[T], model: str = "gpt-4o-mini") -> T:
+    return json.dumps(parse_with_report(instruction, source_text, pydantic).value.model_dump(), ensure_ascii=False)
+
+
+def parse_to_type(instruction: str, source_text: Any, pydantic: Type[T], model: str = "gpt-4o-mini") -> T:
     """
     将文本解析为指定的Pydantic模型实例
-    
-    本函数使用LLM从源文本中提取信息,并实例化为指定的Pydantic模型。
-    如果解析失败，会自动尝试修复。
-    
+
+    按 parse_with_report 的顺序解析，只有本地解析失败时才调用LLM。
+
     Args:
         instruction: 提取指令,告诉LLM如何解析文本
-        source_text: 需要提取信息的源文本
+        source_text: 需要提取信息的源文本或已结构化的数据
         pydantic: 定义输出类型的Pydantic模型类
-        model: 使用的LLM模型名称,默认为"gpt-4o-mini"
-        
+        model: 未使用，保留兼容，模型由 parse 模型配置决定
+
     Returns:
         Pydantic模型实例
-        
+
     Examples:
         >>> class DateTime(BaseModel):
         ...     year: int
@@ -125,11 +293,26 @@ def parse_to_type(instruction: str, source_text: str, pydantic: Type[T], model:
         ...     day: int
         >>> result = parse_to_type(
         ...     "提取日期",
-        ...     "2024年2月24日",
+        ...     "```json\\n{'year': 2024, 'month': 2, 'day': 24,}\\n```",
         ...     DateTime
         ... )
         >>> print(f"{result.year}年{result.month}月{result.day}日")
         2024年2月24日
     """
-    parser = _create_parser(PydanticOutputParser, pydantic)
-    return _parse_with_llm(instruction, source_text, parser, model)
\ No newline at end of file
+    return parse_with_report(instruction, source_text, pydantic).value
+
+
+async def aparse_to_type(instruction: str, source_text: Any, pydantic: Type[T], model: str = "gpt-4o-mini") -> T:
+    """
+    parse_to_type 的异步版本，供运行在事件循环中的调用方使用
+
+    Args:
+        instruction: 提取指令,告诉LLM如何解析文本
+        source_text: 需要提取信息的源文本或已结构化的数据
+        pydantic: 定义输出类型的Pydantic模型类
+        model: 未使用，保留兼容，模型由 parse 模型配置决定
+
+    Returns:
+        Pydantic模型实例
+    """
+    return (await aparse_with_report(instruction, source_text, pydantic)).value
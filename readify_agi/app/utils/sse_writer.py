@@ -0,0 +1,135 @@
+"""
+SSE 写出器 — 基于推送的事件流输出
+
+智能体回调把事件推入队列，写出端直接 await 队列，由完成哨兵结束，不再定时轮询。
+连续的 thought token 在短暂的刷新间隔内或达到长度阈值前合并为一帧；
+事件以紧凑的 UTF-8 JSON 序列化（安装 orjson 时优先使用），可选 gzip 压缩。
+"""
+import asyncio
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 未安装时回退到标准库
+    orjson = None
+
+# 可合并的事件类型
+_COALESCE_TYPES = {"thought"}
+
+# 队列结束哨兵
+_CLOSE = object()
+
+
+def encode_event(data: Dict[str, Any]) -> bytes:
+    """将事件序列化为紧凑的 UTF-8 JSON，中文不做 \\u 转义"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class SSEWriter:
+    """
+    合并 thought token 并输出 SSE 帧的写出器
+
+    send 作为智能体回调使用；frames 迭代输出编码后的 SSE 帧直到 close 被调用。
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 0.05,
+        max_coalesce_chars: int = 512,
+        compress: bool = False,
+    ):
+        """
+        初始化写出器
+
+        Args:
+            flush_interval: thought 合并缓冲的最长停留时间（秒）
+            max_coalesce_chars: 合并缓冲达到该字符数时立即刷新
+            compress: 是否以 gzip 流压缩输出（调用方需设置 Content-Encoding: gzip）
+        """
+        self.flush_interval = flush_interval
+        self.max_coalesce_chars = max_coalesce_chars
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: Optional[Dict[str, Any]] = None
+        self._pending_parts: List[str] = []
+        self._pending_chars = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+        self._compressor = zlib.compressobj(wbits=31) if compress else None
+
+    @staticmethod
+    def _same_stream(pending: Dict[str, Any], data: Dict[str, Any]) -> bool:
+        """除 content 外字段完全一致的 thought 事件才可合并"""
+        if len(pending) != len(data):
+            return False
+        return all(key == "content" or data.get(key) == value for key, value in pending.items())
+
+    async def send(self, data: Dict[str, Any]) -> None:
+        """推送一个事件（智能体回调）"""
+        if self._closed:
+            return
+        content = data.get("content")
+        if data.get("type") in _COALESCE_TYPES and isinstance(content, str):
+            if self._pending is not None and not self._same_stream(self._pending, data):
+                self._flush_pending()
+            if self._pending is None:
+                self._pending = data
+            self._pending_parts.append(content)
+            self._pending_chars += len(content)
+            if self._pending_chars >= self.max_coalesce_chars:
+                self._flush_pending()
+            elif self._flush_handle is None:
+                loop = asyncio.get_running_loop()
+                self._flush_handle = loop.call_later(self.flush_interval, self._flush_pending)
+            return
+
+        self._flush_pending()
+        self._queue.put_nowait(data)
+
+    def _flush_pending(self) -> None:
+        """将合并缓冲中的 thought 作为一帧放入队列"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending is None:
+            return
+        merged = dict(self._pending)
+        merged["content"] = "".join(self._pending_parts)
+        self._pending = None
+        self._pending_parts = []
+        self._pending_chars = 0
+        self._queue.put_nowait(merged)
+
+    def close(self) -> None:
+        """刷新剩余缓冲并放入结束哨兵，可重复调用"""
+        if self._closed:
+            return
+        self._flush_pending()
+        self._closed = True
+        self._queue.put_nowait(_CLOSE)
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        """将单个事件编码为 SSE 帧（启用压缩时返回同步刷新后的压缩块）"""
+        frame = b"data: " + encode_event(data) + b"\n\n"
+        if self._compressor is None:
+            return frame
+        return self._compressor.compress(frame) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """结束输出，启用压缩时返回 gzip 尾部"""
+        if self._compressor is None:
+            return b""
+        tail = self._compressor.flush()
+        self._compressor = None
+        return tail
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """按推送顺序输出已编码的 SSE 帧，直到 close 被调用"""
+        while True:
+            data = await self._queue.get()
+            if data is _CLOSE:
+                break
+            yield self.encode(data)
@@ -0,0 +1,215 @@
+"""
+工具输出编码 — 智能体工具返回内容的紧凑、按 token 限额的序列化
+
+工具结果会进入 agent_scratchpad 并在后续每一轮迭代中重复发送，因此：
+- 统一使用无缩进、无多余空白的 JSON，中文不做 \\u 转义；
+- 只投影模型需要的字段，列表以 columns + rows 表格形式输出，避免重复键名；
+- 树结构渲染为缩进大纲，并限制深度与每层子节点数；
+- 每个工具的输出受 token 上限约束，超出时截断并返回续读游标。
+"""
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def dumps_compact(payload: Any) -> str:
+    """紧凑 JSON 序列化"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+@lru_cache(maxsize=4)
+def _parse_token_caps(raw: str) -> Dict[str, int]:
+    """解析 TOOL_OUTPUT_TOKEN_CAPS 配置（JSON 对象：工具名 -> token 上限）"""
+    raw = raw.strip()
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+        if isinstance(parsed, dict):
+            return {str(name): int(cap) for name, cap in parsed.items()}
+        logger.warning("TOOL_OUTPUT_TOKEN_CAPS 必须是 JSON 对象，已忽略")
+    except (json.JSONDecodeError, TypeError, ValueError) as exc:
+        logger.warning("解析 TOOL_OUTPUT_TOKEN_CAPS 失败，已忽略: %s", exc)
+    return {}
+
+
+def get_tool_token_cap(tool_name: str) -> int:
+    """
+    获取工具单次输出的 token 上限
+
+    Args:
+        tool_name: 工具名称
+
+    Returns:
+        int: token 上限，未单独配置时使用 TOOL_OUTPUT_MAX_TOKENS
+    """
+    caps = _parse_token_caps(settings.TOOL_OUTPUT_TOKEN_CAPS)
+    return max(caps.get(tool_name, settings.TOOL_OUTPUT_MAX_TOKENS), 1)
+
+
+def project(item: Any, fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    按字段列表投影对象或字典，只保留需要的字段
+
+    Args:
+        item: ORM 对象、Pydantic 模型或字典
+        fields: 需要保留的字段
+
+    Returns:
+        Dict[str, Any]: 投影后的字典
+    """
+    if isinstance(item, Mapping):
+        return {name: item.get(name) for name in fields}
+    return {name: getattr(item, name, None) for name in fields}
+
+
+def paginate_rows(
+    items: Sequence[Any],
+    fields: Sequence[str],
+    max_tokens: int,
+    cursor: int = 0
+) -> Tuple[Dict[str, Any], Optional[int]]:
+    """
+    把对象列表编码为 columns + rows 表格，从 cursor 开始直到用完 token 预算
+
+    Args:
+        items: 对象列表
+        fields: 输出的列
+        max_tokens: token 预算
+        cursor: 起始下标
+
+    Returns:
+        Tuple[Dict[str, Any], Optional[int]]: 表格与下一页游标（已输出完时为 None）
+    """
+    rows: List[List[Any]] = []
+    used_tokens = count_tokens(dumps_compact(list(fields)))
+    next_cursor: Optional[int] = None
+    start = max(int(cursor or 0), 0)
+    for index in range(start, len(items)):
+        row = [value for value in project(items[index], fields).values()]
+        tokens = count_tokens(dumps_compact(row))
+        # 至少输出一行，避免单行超出预算时游标无法前进
+        if rows and used_tokens + tokens > max_tokens:
+            next_cursor = index
+            break
+        rows.append(row)
+        used_tokens += tokens
+    return {"columns": list(fields), "rows": rows}, next_cursor
+
+
+def slice_text_by_tokens(text: str, max_tokens: int, offset: int = 0) -> Tuple[str, Optional[int]]:
+    """
+    从字符偏移 offset 处截取不超过 max_tokens 的文本
+
+    Args:
+        text: 原文本
+        max_tokens: token 预算
+        offset: 起始字符偏移
+
+    Returns:
+        Tuple[str, Optional[int]]: 截取的文本与下一段的字符偏移（已到末尾时为 None）
+    """
+    text = text or ""
+    offset = min(max(int(offset or 0), 0), len(text))
+    remaining = text[offset:]
+    if count_tokens(remaining) <= max_tokens:
+        return remaining, None
+
+    # 二分查找不超过预算的最长前缀
+    low, high = 1, len(remaining)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(remaining[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return remaining[:low], offset + low
+
+
+def _subtree_size(node: Any) -> int:
+    size = 0
+    stack = list(node.children or [])
+    while stack:
+        current = stack.pop()
+        size += 1
+        stack.extend(current.children or [])
+    return size
+
+
+def render_outline_lines(
+    root: Any,
+    max_depth: Optional[int] = None,
+    max_children: Optional[int] = None
+) -> List[str]:
+    """
+    把树渲染为缩进大纲，每行格式为 "- [节点ID] 内容"
+
+    超过 max_depth 的子树折叠为子孙节点数提示，每层超过 max_children 的子节点折叠为剩余数量提示，
+    模型可按节点ID再查询被折叠的子树。
+
+    Args:
+        root: 具有 id、content、children 属性的树节点
+        max_depth: 相对根节点的最大展开深度
+        max_children: 每个节点最多展开的子节点数
+
+    Returns:
+        List[str]: 大纲行
+    """
+    max_depth = settings.MIND_MAP_OUTLINE_MAX_DEPTH if max_depth is None else max_depth
+    max_children = settings.MIND_MAP_OUTLINE_MAX_CHILDREN if max_children is None else max_children
+
+    lines: List[str] = []
+    stack: List[Tuple[Any, int]] = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        indent = "  " * depth
+        if node is None:
+            continue
+        if isinstance(node, str):
+            lines.append(f"{indent}{node}")
+            continue
+
+        children = list(node.children or [])
+        line = f"{indent}- [{node.id}] {node.content or ''}"
+        if children and depth >= max_depth:
+            line += f" (+{_subtree_size(node)}个子孙节点)"
+            children = []
+        lines.append(line)
+
+        hidden = len(children) - max_children
+        pending: List[Tuple[Any, int]] = [(child, depth + 1) for child in children[:max_children]]
+        if hidden > 0:
+            pending.append((f"- …另有{hidden}个子节点", depth + 1))
+        stack.extend(reversed(pending))
+    return lines
+
+
+def take_lines_by_tokens(lines: Iterable[str], max_tokens: int, cursor: int = 0) -> Tuple[str, Optional[int]]:
+    """
+    从第 cursor 行开始拼接文本行，直到用完 token 预算
+
+    Args:
+        lines: 文本行
+        max_tokens: token 预算
+        cursor: 起始行号
+
+    Returns:
+        Tuple[str, Optional[int]]: 拼接的文本与下一页起始行号（已输出完时为 None）
+    """
+    lines = list(lines)
+    taken: List[str] = []
+    used_tokens = 0
+    start = max(int(cursor or 0), 0)
+    for index in range(start, len(lines)):
+        tokens = count_tokens(lines[index]) + 1
+        if taken and used_tokens + tokens > max_tokens:
+            return "\n".join(taken), index
+        taken.append(lines[index])
+        used_tokens += tokens
+    return "\n".join(taken), None
@@ -3,9 +3,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.api.v1 import file_router
 from app.api.v1 import api_router
+from app.core.admission import get_admission_controller
 from app.core.config import settings
 from app.core.database import close_db_connection
+from app.core.llm_http_pool import get_llm_http_pool
+from app.core.llm_router import get_llm_routing_stats
+from app.core.llm_usage import get_llm_usage_stats
 from app.core.nacos_client import start_nacos, stop_nacos
+from app.core import token_counter
+from app.services.conversation_persistence_service import get_conversation_persistence_service
+from app.services.conversation_summary_service import get_conversation_summary_service
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -21,11 +29,19 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     logger.info("Starting app, initializing resources...")
     await start_nacos()
+    # 分词器首次加载可能下载编码文件，放到线程中预热
+    if not await asyncio.to_thread(token_counter.warm_up):
+        logger.warning("Tokenizer unavailable, token counts will be estimated")
     yield
     logger.info("Shutting down app, releasing resources...")
     await stop_nacos()
+    await get_conversation_persistence_service().aclose()
+    logger.info("Pending conversation writes flushed")
+    await get_conversation_summary_service().aclose()
     await close_db_connection()
     logger.info("Database connection pool closed")
+    await get_llm_http_pool().aclose()
+    logger.info("LLM HTTP connection pool closed")
 
 app = FastAPI(
     title="Readify AGI",
@@ -62,6 +78,26 @@ async def root():
 def health():
     return {"status": "healthy"}
 
+@app.get("/metrics/llm-http")
+def llm_http_metrics():
+    """LLM HTTP 连接池复用统计"""
+    return get_llm_http_pool().stats()
+
+@app.get("/metrics/llm-routing")
+def llm_routing_metrics():
+    """LLM 主备端点熔断器状态"""
+    return get_llm_routing_stats()
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    """/agent/stream 准入控制与排队统计"""
+    return get_admission_controller().stats()
+
+@app.get("/metrics/llm-usage")
+def llm_usage_metrics():
+    """LLM token 用量与提示词缓存命中统计"""
+    return get_llm_usage_stats().snapshot()
+
 # API路由
 app.include_router(file_router.router, prefix="/api/v1", tags=["files"])
 app.include_router(api_router, prefix="/api/v1")
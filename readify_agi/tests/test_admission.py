@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.core import admission as admission_module
+from app.core.admission import AdmissionController, AdmissionRejected
+
+
+@pytest.fixture(autouse=True)
+def _queue_timeout(monkeypatch):
+    monkeypatch.setattr(admission_module.settings, "ADMISSION_QUEUE_TIMEOUT", 60)
+
+
+@pytest.mark.asyncio
+async def test_queue_rotates_between_users_and_respects_per_user_cap():
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_per_project=10, max_queue=10, max_queue_per_user=5)
+
+    running = controller.enqueue("a", "p1")
+    a2 = controller.enqueue("a", "p1")
+    a3 = controller.enqueue("a", "p1")
+    b1 = controller.enqueue("b", "p2")
+
+    assert running.admitted
+    assert [controller.position(ticket) for ticket in (a2, b1, a3)] == [1, 2, 3]
+
+    running.release()
+    assert a2.admitted and not b1.admitted
+    a2.release()
+    # 用户 a 刚出队，轮到用户 b
+    assert b1.admitted and not a3.admitted
+    b1.release()
+    assert a3.admitted
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full_and_reports_positions_while_waiting():
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_per_project=1, max_queue=1, max_queue_per_user=1)
+    running = controller.enqueue("a", "p1")
+    waiting = controller.enqueue("b", "p2")
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.enqueue("c", "p3")
+    assert excinfo.value.retry_after >= 1
+
+    positions = []
+
+    async def consume():
+        async for position in controller.wait(waiting):
+            positions.append(position)
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0)
+    running.release()
+    await asyncio.wait_for(task, timeout=1)
+
+    assert positions == [1]
+    assert waiting.admitted
+    assert controller.stats()["running"] == 1
+
+
+@pytest.mark.asyncio
+async def test_waiting_past_deadline_leaves_queue(monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_per_project=1, max_queue=5, max_queue_per_user=5)
+    controller.enqueue("a", "p1")
+    waiting = controller.enqueue("b", "p2")
+    waiting.deadline = 0
+
+    with pytest.raises(AdmissionRejected):
+        async for _position in controller.wait(waiting):
+            pass
+
+    assert controller.stats()["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_long_average_streams_do_not_reject_requests_that_would_queue():
+    controller = AdmissionController(max_concurrent=8, max_per_user=1, max_per_project=10, max_queue=10, max_queue_per_user=5)
+    controller._service_seconds = 300
+
+    running = controller.enqueue("a", "p1")
+    # 全局名额空闲，只是用户 a 的并发上限阻塞了该请求，应当排队而不是立即拒绝
+    waiting = controller.enqueue("a", "p1")
+
+    assert not waiting.admitted
+    assert controller.position(waiting) == 1
+    running.release()
+    assert waiting.admitted
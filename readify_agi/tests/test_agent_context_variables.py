@@ -37,11 +37,12 @@ async def test_run_builds_full_prompt_context_before_ainvoke():
 
     assert result["output"] == "ok"
     assert captured["input"] == "hello"
-    assert "available_tools" in captured
+    # 工具列表由缓存的 prompt.partial 提供，逐请求传入会覆盖它
+    assert "available_tools" not in captured
 
 
 @pytest.mark.asyncio
-async def test_coordinator_before_generation_includes_available_tools_and_agents():
+async def test_coordinator_before_generation_includes_available_agents():
     agent = CoordinatorAgentService(project_id=1)
     agent.tools = []
     agent.specialized_agents = {"QUESTIONER": object(), "NOTE_AGENT": object()}
@@ -62,5 +63,50 @@ async def test_coordinator_before_generation_includes_available_tools_and_agents
     context = await agent._before_generation("hello", fake_callback)
 
     assert context["input"] == "hello"
-    assert "available_tools" in context
+    assert "available_tools" not in context
     assert context["available_agents"] == "QUESTIONER, NOTE_AGENT"
+
+
+@pytest.mark.asyncio
+async def test_conversation_context_uses_summary_and_token_budget():
+    agent = AgentService(project_id=1)
+
+    class Row:
+        def __init__(self, sequence, message_type, content, token_count):
+            self.sequence = sequence
+            self.message_type = message_type
+            self.content = content
+            self.token_count = token_count
+
+    class Summary:
+        content = "早期对话摘要"
+        covered_sequence = 10
+        token_count = 30
+
+    captured = {}
+
+    class DummySummaryRepo:
+        async def get_by_project(self, project_id):
+            return Summary()
+
+    class DummyConversationRepo:
+        async def get_context_window(self, project_id, after_sequence, limit):
+            captured["after_sequence"] = after_sequence
+            return [
+                Row(14, "assistant", "最新回答", 40),
+                Row(13, "user", "最新问题", 20),
+                Row(12, "assistant", "较早回答", 50),
+                Row(11, "user", "较早问题", 5),
+            ]
+
+    agent.summary_repo = DummySummaryRepo()
+    agent.conversation_repo = DummyConversationRepo()
+
+    context = await agent._get_conversation_context(1, max_tokens=100, max_messages=20)
+
+    assert captured["after_sequence"] == 10
+    assert context == [
+        {"role": "system", "content": "此前对话摘要：\n早期对话摘要"},
+        {"role": "user", "content": "最新问题"},
+        {"role": "assistant", "content": "最新回答"},
+    ]
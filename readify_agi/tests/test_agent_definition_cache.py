@@ -0,0 +1,109 @@
+import pytest
+
+from app.services import agent_definition_cache
+from app.services.agent_service import AgentService, _active_agent
+
+
+class DummyLLM:
+    pass
+
+
+class CountingAgentService(AgentService):
+    build_count = 0
+
+    async def _load_system_prompt_async(self):
+        return "system {available_tools}"
+
+    def _create_llm(self):
+        return DummyLLM()
+
+    async def _build_definition(self):
+        CountingAgentService.build_count += 1
+        return await super()._build_definition()
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(agent_definition_cache, "_cache_instance", agent_definition_cache.AgentDefinitionCache())
+    monkeypatch.setattr(AgentService, "_create_agent_executor", lambda self: object())
+    CountingAgentService.build_count = 0
+
+
+@pytest.mark.asyncio
+async def test_initialize_reuses_cached_definition_across_instances():
+    first = CountingAgentService(project_id=1)
+    second = CountingAgentService(project_id=2)
+
+    await first.initialize()
+    await second.initialize()
+
+    assert CountingAgentService.build_count == 1
+    assert second.agent_executor is first.agent_executor
+    assert second.tools is first.tools
+
+    agent_definition_cache.get_agent_definition_cache().invalidate()
+    await second.initialize()
+    assert CountingAgentService.build_count == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_tools_read_state_from_bound_agent():
+    first = CountingAgentService(project_id=1)
+    second = CountingAgentService(project_id=2)
+    await first.initialize()
+    await second.initialize()
+
+    class DummyProjectRepo:
+        async def get_project_info(self, project_id):
+            return {"name": "Demo", "description": "Desc"}
+
+    async def fake_context(*args, **kwargs):
+        return []
+
+    seen = []
+
+    class DummyExecutor:
+        async def astream_events(self, payload, version):
+            # 工具闭包属于首次构建定义的 first，但应读取到当前请求绑定的 second
+            seen.append(first._bound().project_id)
+            yield {"event": "on_chain_start", "name": "noop", "data": {}}
+
+    async def fake_callback(_data):
+        return None
+
+    second.project_repo = DummyProjectRepo()
+    second._get_conversation_context = fake_context
+    second.agent_executor = DummyExecutor()
+
+    await second.generate_stream_response("hello", fake_callback)
+
+    assert seen == [2]
+    assert _active_agent.get() is None
+    # 未绑定时不回退到闭包中的实例，避免读到其他请求的状态
+    with pytest.raises(RuntimeError):
+        first._bound()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_during_build_does_not_build_twice():
+    import asyncio
+
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    class SlowAgentService(CountingAgentService):
+        async def _build_definition(self):
+            started.set()
+            await release.wait()
+            return await super()._build_definition()
+
+    first = asyncio.create_task(SlowAgentService(project_id=1).initialize())
+    await started.wait()
+    # 构建进行中刷新模板，之后到达的同键请求仍要等待同一把构建锁
+    agent_definition_cache.get_agent_definition_cache().invalidate()
+    second = asyncio.create_task(SlowAgentService(project_id=2).initialize())
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, second)
+
+    assert CountingAgentService.build_count == 1
@@ -0,0 +1,113 @@
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+pytest.importorskip("pymilvus")
+
+from app.api.v1 import agent_router
+from app.core import admission as admission_module
+from app.core.admission import AdmissionController
+
+
+class DummyAskAgent:
+    agent_name = "ASK_AGENT"
+
+    def __init__(self, project_id, context):
+        pass
+
+
+class DummyCoordinator:
+    built = 0
+
+    def __init__(self, project_id, task_type, context):
+        DummyCoordinator.built += 1
+        self.project_id = project_id
+        self.request_trace = None
+        self.closed = False
+
+    def register_agent(self, name, agent):
+        pass
+
+    async def initialize(self):
+        pass
+
+    async def generate_stream_response(self, query, callback):
+        await callback({"type": "final_answer", "project_id": self.project_id, "content": query})
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_per_project=1, max_queue=5, max_queue_per_user=5)
+    monkeypatch.setattr(admission_module, "_controller", controller)
+    monkeypatch.setattr(agent_router.settings, "SSE_GZIP_ENABLED", False)
+    monkeypatch.setattr(agent_router, "CoordinatorAgentService", DummyCoordinator)
+    monkeypatch.setattr(agent_router, "AskAgentService", DummyAskAgent)
+    DummyCoordinator.built = 0
+    return controller
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(agent_router.router, prefix="/agent")
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _events(body: str):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+@pytest.mark.asyncio
+async def test_stream_releases_admission_slot_after_success_and_validation_error(controller):
+    async with _client() as client:
+        response = await client.get("/agent/stream", params={"project_id": 1, "task_type": "ask", "query": "你好"},
+                                    headers={"X-User-Id": "7"})
+        assert response.status_code == 200
+        assert [event["type"] for event in _events(response.text)][-1] == "[DONE]"
+        assert controller.stats()["running"] == 0
+
+        # 缺少 query 时准入依赖已经执行，422 之后名额也要释放
+        response = await client.get("/agent/stream", params={"project_id": 1, "task_type": "ask"},
+                                    headers={"X-User-Id": "7"})
+        assert response.status_code == 422
+        assert controller.stats()["running"] == 0
+        assert controller.stats()["admitted_total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_returns_429_when_queue_is_full(controller):
+    controller.max_queue = 0
+    held = controller.enqueue("other", "2")
+
+    async with _client() as client:
+        response = await client.get("/agent/stream", params={"project_id": 1, "task_type": "ask", "query": "你好"},
+                                    headers={"X-User-Id": "7"})
+
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert DummyCoordinator.built == 0
+    held.release()
+
+
+@pytest.mark.asyncio
+async def test_coordinator_is_built_only_after_admission(controller, monkeypatch):
+    monkeypatch.setattr(admission_module.settings, "ADMISSION_QUEUE_TIMEOUT", 0.05)
+    held = controller.enqueue("other", "2")
+
+    async with _client() as client:
+        # 排队超时被拒绝的请求不构建智能体
+        response = await client.get("/agent/stream", params={"project_id": 1, "task_type": "ask", "query": "你好"},
+                                    headers={"X-User-Id": "7"})
+        events = _events(response.text)
+        assert [event["type"] for event in events] == ["queue", "system", "[DONE]"]
+        assert DummyCoordinator.built == 0
+
+        held.release()
+        response = await client.get("/agent/stream", params={"project_id": 1, "task_type": "ask", "query": "你好"},
+                                    headers={"X-User-Id": "7"})
+        assert DummyCoordinator.built == 1
+        assert controller.stats()["running"] == 0
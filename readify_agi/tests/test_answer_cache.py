@@ -0,0 +1,114 @@
+import pytest
+
+from app.services import answer_cache_service as answer_cache_module
+from app.services import coordinator_agent_service as coordinator_module
+from app.services.answer_cache_service import AnswerCacheService
+from app.services.coordinator_agent_service import CoordinatorAgentService
+
+
+def _make_cache(version_holder):
+    cache = AnswerCacheService()
+    vectors = {
+        "第三章讲了什么内容": [1.0, 0.0],
+        "第三章主要讲什么内容": [0.99, 0.05],
+        "作者的生平经历如何": [0.0, 1.0],
+    }
+
+    async def fake_embed(query):
+        return answer_cache_module._normalize_vector(vectors[query])
+
+    async def fake_version(project_id):
+        return version_holder["version"]
+
+    cache._embed = fake_embed
+    cache._get_version = fake_version
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_matches_similar_query_within_scope_and_version():
+    version = {"version": "v1"}
+    cache = _make_cache(version)
+
+    first = await cache.lookup(1, 7, "user", "第三章讲了什么内容")
+    assert not first.hit
+    cache.store(first, "第三章讲了什么内容", "第三章讲述了主角的成长")
+
+    similar = await cache.lookup(1, 7, "user", "第三章主要讲什么内容")
+    assert similar.hit and similar.entry.answer == "第三章讲述了主角的成长"
+
+    assert not (await cache.lookup(1, 7, "user", "作者的生平经历如何")).hit
+    assert not (await cache.lookup(1, 8, "user", "第三章主要讲什么内容")).hit
+
+    version["version"] = "v2"
+    assert not (await cache.lookup(1, 7, "user", "第三章主要讲什么内容")).hit
+
+
+@pytest.mark.asyncio
+async def test_coordinator_streams_cached_answer_without_running_agent(monkeypatch):
+    monkeypatch.setattr(coordinator_module.settings, "ANSWER_CACHE_ENABLED", True)
+
+    cache = _make_cache({"version": "v1"})
+    lookup = await cache.lookup(1, 7, "user", "第三章讲了什么内容")
+    cache.store(lookup, "第三章讲了什么内容", "第三章讲述了主角的成长")
+    monkeypatch.setattr(answer_cache_module, "get_answer_cache_service", lambda: cache)
+
+    submitted = []
+
+    class DummyPersistence:
+        def submit(self, turn):
+            submitted.append(turn)
+
+    monkeypatch.setattr(coordinator_module, "get_conversation_persistence_service", lambda: DummyPersistence())
+
+    class FailingExecutor:
+        def astream_events(self, *args, **kwargs):
+            raise AssertionError("cache hit should not run the agent")
+
+    agent = CoordinatorAgentService(project_id=1, context={"user_id": 7, "user_role": "user"})
+    agent.agent_executor = FailingExecutor()
+
+    events = []
+
+    async def callback(data):
+        events.append(data)
+
+    await agent.generate_stream_response("第三章主要讲什么内容", callback)
+
+    assert events == [{
+        "type": "final_answer",
+        "content": "第三章讲述了主角的成长",
+        "project_id": 1,
+        "cached": True,
+    }]
+    assert [message.content for message in submitted[0].messages] == ["第三章主要讲什么内容", "第三章讲述了主角的成长"]
+
+
+@pytest.mark.asyncio
+async def test_content_version_sums_vectorized_flags_as_integer(monkeypatch):
+    from sqlalchemy import Integer
+
+    import app.repositories.base_repository as base_repository_module
+    from app.repositories.project_file_repository import ProjectFileRepository
+
+    statements = []
+
+    class DummyResult:
+        def one(self):
+            return 2, 10, 20, 1
+
+    class DummySession:
+        async def execute(self, statement):
+            statements.append(statement)
+            return DummyResult()
+
+        async def close(self):
+            return None
+
+    monkeypatch.setattr(base_repository_module, "async_session_maker", DummySession)
+
+    version = await ProjectFileRepository().get_content_version(1)
+
+    assert version == "2:10:20:1"
+    # vectorized 是布尔列，SUM 必须按整数取值，否则多个已向量化文件的计数会被还原为 True
+    assert isinstance(statements[0].selected_columns[3].type, Integer)
@@ -0,0 +1,267 @@
+import pytest
+
+from app.models.conversation import ConversationMessageCreate, ConversationTurnCreate
+from app.services import agent_service as agent_service_module
+from app.services import conversation_persistence_service as persistence_module
+from app.services.agent_service import AgentService
+
+
+@pytest.mark.asyncio
+async def test_chain_end_submits_turn_without_writing_to_db(monkeypatch):
+    submitted = []
+
+    class DummyPersistence:
+        def submit(self, turn):
+            submitted.append(turn)
+
+    monkeypatch.setattr(agent_service_module, "get_conversation_persistence_service", lambda: DummyPersistence())
+
+    agent = AgentService(project_id=1, agent_name="Agent")
+    agent.all_thoughts.extend(["思考", "过程"])
+    agent.conversation_repo = None
+    agent.thinking_repo = None
+
+    events = []
+
+    async def callback(data):
+        events.append(data)
+
+    event = {"event": "on_chain_end", "name": "Agent", "data": {"output": {"output": "答案"}}}
+    completed = await agent._handle_chain_end(event, callback, 1, "问题")
+
+    assert completed is True
+    assert events[0]["type"] == "final_answer"
+    assert len(submitted) == 1
+    turn = submitted[0]
+    assert [message.message_type for message in turn.messages] == ["user", "assistant"]
+    assert turn.thinking == "思考过程"
+    assert turn.thinking_message_index == 1
+
+
+@pytest.mark.asyncio
+async def test_persistence_service_writes_each_turn_in_project_order(monkeypatch):
+    written = []
+
+    class DummyRepo:
+        async def create_turn(self, turn):
+            written.append((turn.project_id, turn.messages[0].content))
+
+        async def close(self):
+            return None
+
+    monkeypatch.setattr(persistence_module, "ConversationRepository", DummyRepo)
+    monkeypatch.setattr(persistence_module.ConversationPersistenceService, "_after_write", staticmethod(lambda batch: None))
+
+    service = persistence_module.ConversationPersistenceService()
+    for project_id, content in ((3, "a"), (1, "b"), (3, "c"), (2, "d")):
+        service.submit(ConversationTurnCreate(
+            project_id=project_id,
+            messages=[ConversationMessageCreate(message_type="user", content=content)],
+        ))
+
+    await service.aclose()
+
+    assert written == [(1, "b"), (2, "d"), (3, "a"), (3, "c")]
+
+
+@pytest.mark.asyncio
+async def test_failing_turn_is_dead_lettered_without_dropping_the_batch(monkeypatch, caplog):
+    attempts = []
+    after_write = []
+
+    class DummyRepo:
+        async def create_turn(self, turn):
+            attempts.append(turn.project_id)
+            if turn.project_id == 2:
+                raise RuntimeError("packet too large")
+
+        async def close(self):
+            return None
+
+    async def no_sleep(seconds):
+        return None
+
+    monkeypatch.setattr(persistence_module, "ConversationRepository", DummyRepo)
+    monkeypatch.setattr(persistence_module.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(persistence_module.settings, "CONVERSATION_PERSIST_MAX_RETRIES", 1)
+    monkeypatch.setattr(
+        persistence_module.ConversationPersistenceService,
+        "_after_write",
+        staticmethod(lambda batch: after_write.extend(turn.project_id for turn in batch)),
+    )
+
+    service = persistence_module.ConversationPersistenceService()
+    await service._write_batch([
+        ConversationTurnCreate(project_id=project_id, messages=[ConversationMessageCreate(message_type="user", content="hi")])
+        for project_id in (1, 2, 3)
+    ])
+
+    # 只有失败的一轮被重试
+    assert attempts == [1, 2, 2, 3]
+    assert after_write == [1, 3]
+    dead_letters = [record for record in caplog.records if record.name.endswith(".dead_letter")]
+    assert len(dead_letters) == 1 and '"project_id":2' in dead_letters[0].getMessage()
+
+
+@pytest.mark.asyncio
+async def test_trace_is_written_separately_and_its_failure_keeps_the_turn(monkeypatch):
+    traces = []
+
+    class DummyRepo:
+        async def create_turn(self, turn):
+            return 7
+
+        async def close(self):
+            return None
+
+    class DummyThinkingRepo:
+        async def save_trace(self, **kwargs):
+            traces.append(kwargs["thinking_id"])
+            raise RuntimeError("max_allowed_packet exceeded")
+
+        async def close(self):
+            return None
+
+    monkeypatch.setattr(persistence_module, "ConversationRepository", DummyRepo)
+    monkeypatch.setattr(persistence_module, "AssistantThinkingRepository", DummyThinkingRepo)
+
+    service = persistence_module.ConversationPersistenceService()
+    written = await service._write_turn(ConversationTurnCreate(
+        project_id=1,
+        messages=[ConversationMessageCreate(message_type="user", content="hi")],
+        thinking="思考",
+        thinking_trace=b"x" * 10,
+        thinking_trace_codec="zlib",
+        thinking_trace_size=100,
+    ))
+
+    assert written is True
+    assert traces == [7]
+
+
+@pytest.mark.asyncio
+async def test_context_read_waits_for_pending_turns_of_the_project(monkeypatch):
+    import asyncio
+
+    release = asyncio.Event()
+    written = []
+
+    class DummyRepo:
+        async def create_turn(self, turn):
+            await release.wait()
+            written.append(turn.project_id)
+
+        async def close(self):
+            return None
+
+    monkeypatch.setattr(persistence_module, "ConversationRepository", DummyRepo)
+    monkeypatch.setattr(persistence_module.ConversationPersistenceService, "_after_write", staticmethod(lambda batch: None))
+
+    service = persistence_module.ConversationPersistenceService()
+    service.submit(ConversationTurnCreate(project_id=1, messages=[ConversationMessageCreate(message_type="user", content="hi")]))
+
+    # 其他工程不需要等待
+    assert await service.wait_for_project(2, timeout=0) is True
+    assert await service.wait_for_project(1, timeout=0.01) is False
+
+    waiter = asyncio.create_task(service.wait_for_project(1, timeout=1))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    release.set()
+    assert await waiter is True
+    assert written == [1]
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_trim_runs_only_when_counter_exceeds_limit_plus_slack(monkeypatch):
+    from app.repositories import conversation_repository as repository_module
+    from app.repositories.conversation_repository import ConversationRepository
+
+    monkeypatch.setattr(repository_module.settings, "CONTEXT_TRIM_MAX_MESSAGES", 50)
+    monkeypatch.setattr(repository_module.settings, "CONTEXT_TRIM_SLACK", 10)
+
+    class DummyResult:
+        rowcount = 12
+
+        def scalar(self):
+            return 100
+
+    class DummySession:
+        def __init__(self):
+            self.statements = []
+            self.flushed = False
+
+        async def flush(self):
+            self.flushed = True
+
+        async def execute(self, statement, params=None):
+            self.statements.append(statement)
+            return DummyResult()
+
+    repo = ConversationRepository()
+
+    db = DummySession()
+    assert await repo._maybe_trim(db, 1, 60) == 0
+    assert db.statements == [] and not db.flushed
+
+    db = DummySession()
+    assert await repo._maybe_trim(db, 1, 61) == 12
+    assert db.flushed
+    # 截断点查询 + 一条批量 UPDATE + 计数校准
+    assert len(db.statements) == 3
+
+
+@pytest.mark.asyncio
+async def test_toggling_context_adjusts_the_counter_only_when_state_changes():
+    from app.models.conversation import ConversationSequenceDB
+    from app.repositories.conversation_repository import ConversationRepository
+
+    class DummyResult:
+        def __init__(self, rowcount):
+            self.rowcount = rowcount
+
+        def scalar(self):
+            return 1
+
+    class DummySession:
+        def __init__(self, changed):
+            self.changed = changed
+            self.statements = []
+            self.committed = False
+
+        async def execute(self, statement, params=None):
+            self.statements.append(statement)
+            return DummyResult(self.changed)
+
+        async def commit(self):
+            self.committed = True
+
+    async def run(method, changed):
+        db = DummySession(changed)
+        repo = ConversationRepository()
+
+        async def ensure_session():
+            return db
+
+        async def cleanup_session():
+            return None
+
+        repo._ensure_session = ensure_session
+        repo._cleanup_session = cleanup_session
+        assert await method(repo, 5) is True
+        return db
+
+    db = await run(ConversationRepository.exclude_from_context, changed=1)
+    # 查询工程 + 更新消息 + 同一事务中减少计数
+    assert len(db.statements) == 3 and db.committed
+    counter_update = db.statements[-1]
+    assert counter_update.table.name == ConversationSequenceDB.__tablename__
+    assert counter_update.compile().params["context_count_1"] == -1
+
+    db = await run(ConversationRepository.include_in_context, changed=1)
+    assert db.statements[-1].compile().params["context_count_1"] == 1
+
+    # 状态未变化（已在上下文中）时不调整计数
+    db = await run(ConversationRepository.include_in_context, changed=0)
+    assert len(db.statements) == 2
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import conversation_summary_service as summary_module
+from app.services.conversation_summary_service import ConversationSummaryService
+
+
+def _row(sequence, content, token_count=100):
+    return SimpleNamespace(message_type="user", content=content, token_count=token_count, sequence=sequence)
+
+
+@pytest.mark.asyncio
+async def test_summary_covers_messages_already_trimmed_from_context(monkeypatch):
+    monkeypatch.setattr(summary_module.settings, "CONVERSATION_SUMMARY_TRIGGER_TOKENS", 100)
+    monkeypatch.setattr(summary_module.settings, "CONVERSATION_SUMMARY_KEEP_RECENT", 1)
+    # 序号 1、2 已被写入时的增量修剪移出上下文，但尚未进入摘要；序号 1 是升级前写入的消息，token_count 为 0
+    rows = [_row(1, "消息1", token_count=0)] + [_row(sequence, f"消息{sequence}") for sequence in (2, 3, 4)]
+    calls = {}
+    upserts = []
+
+    class DummyConversationRepo:
+        async def fill_missing_token_counts(self, project_id, after_sequence):
+            missing = [row for row in rows if row.token_count == 0]
+            for row in missing:
+                row.token_count = 100
+            calls["filled"] = len(missing)
+            return len(missing)
+
+        async def get_unsummarized_stats(self, project_id, after_sequence, only_context=True):
+            calls["stats_only_context"] = only_context
+            return len(rows), sum(row.token_count for row in rows)
+
+        async def get_context_window(self, project_id, after_sequence, limit, only_context=True):
+            calls["window_only_context"] = only_context
+            return list(reversed(rows))
+
+        async def close(self):
+            return None
+
+    class DummySummaryRepo:
+        async def get_by_project(self, project_id):
+            return None
+
+        async def upsert(self, project_id, content, covered_sequence):
+            upserts.append(covered_sequence)
+
+        async def close(self):
+            return None
+
+    class DummyLLM:
+        async def ainvoke(self, messages):
+            calls["prompt"] = messages[-1].content
+            return SimpleNamespace(content="摘要")
+
+    monkeypatch.setattr(summary_module, "ConversationRepository", DummyConversationRepo)
+    monkeypatch.setattr(summary_module, "ConversationSummaryRepository", DummySummaryRepo)
+
+    service = ConversationSummaryService()
+    service._llm = DummyLLM()
+    service._prompts = (None, "{summary}\n{history}")
+    await service._summarize_if_needed(1)
+
+    assert calls["filled"] == 1
+    assert calls["stats_only_context"] is False and calls["window_only_context"] is False
+    assert "消息1" in calls["prompt"] and "消息2" in calls["prompt"]
+    # 每次最多合并约 2 倍触发阈值的 token，剩余的随后续写入继续合并
+    assert "消息3" not in calls["prompt"]
+    assert upserts == [2]
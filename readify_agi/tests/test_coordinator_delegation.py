@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.coordinator_agent_service import CoordinatorAgentService
+
+
+class DummySpecialist:
+    description = "dummy"
+
+    def __init__(self, name, delays):
+        self.name = name
+        self.delays = delays
+        self.closed = 0
+
+    def spawn(self):
+        return self
+
+    async def aclose(self):
+        self.closed += 1
+
+    async def generate_stream_response(self, query, callback, should_save_thinking=None):
+        await asyncio.sleep(self.delays[query])
+        await callback({"type": "tool_result", "content": query, "project_id": 1})
+        await callback({"type": "final_answer", "content": f"{self.name}:{query}", "project_id": 1})
+
+
+@pytest.mark.asyncio
+async def test_delegate_tasks_runs_subtasks_concurrently_and_keeps_order():
+    coordinator = CoordinatorAgentService(project_id=1)
+    ask = DummySpecialist("ask", {"slow": 0.2, "fast": 0.01})
+    coordinator.specialized_agents = {"QUESTIONER": ask}
+
+    events = []
+
+    async def callback(data):
+        events.append(data)
+
+    coordinator._current_callback = callback
+    tools = await coordinator._load_tools()
+    delegate_tasks = next(item for item in tools if item.name == "delegate_tasks")
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with coordinator.bind():
+        output = await delegate_tasks.ainvoke({
+            "subtasks": [
+                {"agent_name": "QUESTIONER", "task": "slow"},
+                {"task_type": "ask", "task": "fast"},
+            ]
+        })
+    elapsed = loop.time() - started
+
+    results = json.loads(output)["results"]
+    assert [item["result"] for item in results] == ["ask:slow", "ask:fast"]
+    assert [item["subtask_id"] for item in results] == [0, 1]
+    assert elapsed < 0.2 + 0.15
+    assert ask.closed == 0  # spawn 返回同一实例时不会被关闭
+
+    forwarded = [event for event in events if event["type"] == "tool_result"]
+    assert [event["subtask_id"] for event in forwarded] == [1, 0]
+    assert all(event["type"] != "final_answer" for event in events)
+    assert all(entry["completed"] for entry in coordinator.last_task_status["task_history"])
@@ -0,0 +1,76 @@
+import pytest
+
+from app.services import document_reader_service as reader_module
+from app.services.document_reader_service import DocumentReaderService
+
+
+class Row:
+    def __init__(self, sequence, content):
+        self.id = sequence + 100
+        self.sequence = sequence
+        self.content = content
+
+
+class DummyDocumentRepo:
+    def __init__(self, count):
+        self.rows = [Row(sequence, f"第{sequence}块" + "字" * 8) for sequence in range(count)]
+        self.window_calls = []
+
+    async def get_window(self, file_id, start_sequence, end_sequence=None, limit=20):
+        self.window_calls.append((start_sequence, end_sequence, limit))
+        rows = [
+            row for row in self.rows
+            if row.sequence >= start_sequence and (end_sequence is None or row.sequence <= end_sequence)
+        ]
+        return rows[:limit]
+
+    async def get_sequence_bounds(self, file_id):
+        return 0, len(self.rows) - 1, len(self.rows)
+
+    async def find_sequence_containing(self, file_id, text):
+        for row in self.rows:
+            if text in row.content:
+                return row.sequence
+        return None
+
+
+@pytest.fixture(autouse=True)
+def _small_pages(monkeypatch):
+    monkeypatch.setattr(reader_module.settings, "DOCUMENT_READ_PAGE_SIZE", 3)
+    monkeypatch.setattr(reader_module.settings, "DOCUMENT_READ_MAX_TOKENS", 1000)
+    monkeypatch.setattr(reader_module, "count_tokens", lambda text: 10)
+
+
+@pytest.mark.asyncio
+async def test_read_by_budget_pages_until_budget_and_returns_cursor():
+    repo = DummyDocumentRepo(count=10)
+    service = DocumentReaderService(repo)
+
+    first = await service.read_by_budget(file_id=1, max_tokens=45)
+    assert [chunk["sequence"] for chunk in first["chunks"]] == [0, 1, 2, 3]
+    assert first["next_cursor"] == 4
+    assert first["total_chunks"] == 10
+    # 只读取到预算耗尽所在的那一页
+    assert len(repo.window_calls) == 2
+
+    rest = await service.read_by_budget(file_id=1, cursor=first["next_cursor"], max_tokens=1000)
+    assert [chunk["sequence"] for chunk in rest["chunks"]] == [4, 5, 6, 7, 8, 9]
+    assert rest["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_read_neighbors_locates_hit_by_text():
+    service = DocumentReaderService(DummyDocumentRepo(count=10))
+
+    result = await service.read_neighbors(file_id=1, text="第5块", window=2)
+
+    assert result["hit_sequence"] == 5
+    assert [chunk["sequence"] for chunk in result["chunks"]] == [3, 4, 5, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_read_range_rejects_inverted_range():
+    service = DocumentReaderService(DummyDocumentRepo(count=3))
+
+    with pytest.raises(ValueError):
+        await service.read_range(file_id=1, start_sequence=2, end_sequence=1)
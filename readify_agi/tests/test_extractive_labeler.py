@@ -0,0 +1,44 @@
+from app.services import extractive_labeler as extractive_labeler_module
+from app.services.extractive_labeler import ExtractiveLabeler, extract_terms
+
+CORPUS = [
+    "神经网络通过反向传播算法训练，神经网络的层数越多，神经网络的表达能力越强。",
+    "数据库索引可以加快查询速度，索引需要额外的存储空间，索引结构通常是B+树。",
+    "Attention lets each token attend to every other token; attention weights are learned.",
+]
+
+
+def test_labels_use_distinctive_repeated_keywords():
+    labeler = ExtractiveLabeler(CORPUS, max_keywords=2)
+
+    chinese = labeler.label(CORPUS[0])
+    english = labeler.label(CORPUS[2])
+
+    assert chinese.keywords[0] == "神经网络"
+    assert chinese.label.startswith("神经网络、")
+    assert english.keywords[:2] == ["attention", "token"]
+    assert english.label == "attention, token"
+
+
+def test_overlapping_fragments_are_not_repeated():
+    labeler = ExtractiveLabeler(CORPUS, max_keywords=3)
+
+    keywords = labeler.label(CORPUS[0]).keywords
+
+    assert not any(a != b and a in b for a in keywords for b in keywords)
+
+
+def test_confidence_is_low_for_chunks_without_repeated_keywords():
+    labeler = ExtractiveLabeler(CORPUS + ["今天天气晴朗。"])
+
+    assert labeler.label(CORPUS[0]).confidence > labeler.label("今天天气晴朗。").confidence
+    assert labeler.label("……").confidence == 0.0
+
+
+def test_ngram_fallback_skips_function_words(monkeypatch):
+    monkeypatch.setattr(extractive_labeler_module, "jieba", None)
+
+    terms = extract_terms("学习的方法")
+
+    assert "学习" in terms and "方法" in terms
+    assert not any("的" in term for term in terms)
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Any, List
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.core import llm_router as llm_router_module
+from app.core.llm_router import CircuitBreaker, HedgedChatModel
+
+
+class DummyStreamingModel(BaseChatModel):
+    reply: str
+    delay: float = 0.0
+    fail: bool = False
+    calls: Any = None
+    bound_tools: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "dummy"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"bound_tools": tools})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.calls is not None:
+            self.calls.append(self.reply)
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.reply} unavailable")
+        for token in (self.reply, "!"):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+@pytest.fixture(autouse=True)
+def _breakers(monkeypatch):
+    monkeypatch.setattr(llm_router_module, "_breakers", {})
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_MIN_REQUESTS", 2)
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_FAILURE_RATIO", 0.5)
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_OPEN_SECONDS", 30)
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_SLOW_TTFT_MS", 10000)
+
+
+def _hedged(primary: DummyStreamingModel, secondary: DummyStreamingModel, hedge_delay: float = 0.05) -> HedgedChatModel:
+    return HedgedChatModel(
+        primary=primary, secondary=secondary, primary_name="primary", secondary_name="secondary", hedge_delay=hedge_delay
+    )
+
+
+async def _collect(model: HedgedChatModel) -> str:
+    return "".join([chunk.content async for chunk in model.astream([HumanMessage(content="hi")])])
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    calls: List[str] = []
+    model = _hedged(DummyStreamingModel(reply="a", calls=calls), DummyStreamingModel(reply="b", calls=calls))
+
+    assert await _collect(model) == "a!"
+    assert calls == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_faster_secondary_wins():
+    calls: List[str] = []
+    model = _hedged(DummyStreamingModel(reply="a", delay=1, calls=calls), DummyStreamingModel(reply="b", calls=calls))
+
+    assert await _collect(model) == "b!"
+    assert calls == ["a", "b"]
+    # 主端点首 token 慢于对冲请求，计为一次失败
+    assert llm_router_module.get_circuit_breaker("primary").snapshot()["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_primary_error_fails_over_and_opens_breaker():
+    calls: List[str] = []
+    model = _hedged(
+        DummyStreamingModel(reply="a", fail=True, calls=calls), DummyStreamingModel(reply="b", calls=calls), hedge_delay=0
+    )
+
+    assert await _collect(model) == "b!"
+    assert await _collect(model) == "b!"
+    assert llm_router_module.get_circuit_breaker("primary").state == "open"
+
+    calls.clear()
+    assert await _collect(model) == "b!"
+    # 熔断期间备用端点优先，不再先请求主端点
+    assert calls == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_ainvoke_and_bind_tools_keep_hedging():
+    model = _hedged(DummyStreamingModel(reply="a"), DummyStreamingModel(reply="b"))
+
+    bound = model.bind_tools(["tool"])
+
+    assert isinstance(bound, HedgedChatModel)
+    assert bound.primary.bound_tools == ["tool"] and bound.secondary.bound_tools == ["tool"]
+    assert (await bound.ainvoke([HumanMessage(content="hi")])).content == "a!"
+
+
+def test_half_open_breaker_allows_single_trial(monkeypatch):
+    breaker = CircuitBreaker("x")
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_OPEN_SECONDS", 0)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_sync_invoke_and_stream_fail_over(monkeypatch):
+    class SyncModel(DummyStreamingModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            if self.fail:
+                raise RuntimeError(f"{self.reply} unavailable")
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    model = _hedged(SyncModel(reply="a", fail=True), SyncModel(reply="b"))
+
+    assert model.invoke([HumanMessage(content="hi")]).content == "b"
+    assert "".join(chunk.content for chunk in model.stream([HumanMessage(content="hi")])) == "b"
+
+
+@pytest.mark.asyncio
+async def test_half_open_trial_is_taken_only_when_the_endpoint_is_launched(monkeypatch):
+    secondary = llm_router_module.get_circuit_breaker("secondary")
+    secondary.record(False)
+    secondary.record(False)
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_OPEN_SECONDS", 0)
+
+    calls: List[str] = []
+    model = _hedged(DummyStreamingModel(reply="a", calls=calls), DummyStreamingModel(reply="b", calls=calls))
+
+    assert await _collect(model) == "a!"
+    assert calls == ["a"]
+    # 备用端点没有被请求，半开试探名额仍然可用
+    assert secondary.allow()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_hedge_gives_back_half_open_trial(monkeypatch):
+    secondary = llm_router_module.get_circuit_breaker("secondary")
+    secondary.record(False)
+    secondary.record(False)
+    monkeypatch.setattr(llm_router_module.settings, "LLM_BREAKER_OPEN_SECONDS", 0)
+
+    calls: List[str] = []
+    model = _hedged(
+        DummyStreamingModel(reply="a", delay=0.1, calls=calls),
+        DummyStreamingModel(reply="b", delay=1, calls=calls),
+        hedge_delay=0.01,
+    )
+
+    assert await _collect(model) == "a!"
+    assert calls == ["a", "b"]
+    assert secondary.state == "half_open"
+    assert secondary.allow()
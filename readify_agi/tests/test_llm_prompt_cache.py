@@ -0,0 +1,157 @@
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+
+from app.core import llm_factory
+from app.core.llm_factory import apply_anthropic_cache_breakpoints
+from app.core.llm_usage import LLMUsageCallbackHandler, LLMUsageStats
+from app.services import agent_service as agent_service_module
+from app.services.agent_service import AgentService
+
+
+def test_cache_breakpoints_mark_last_tool_system_and_last_message():
+    payload = {
+        "system": "系统提示词",
+        "tools": [{"name": "a"}, {"name": "b"}],
+        "messages": [
+            {"role": "user", "content": "问题"},
+            {"role": "assistant", "content": [{"type": "text", "text": "思考"}, {"type": "tool_use", "id": "1"}]},
+        ],
+    }
+
+    result = apply_anthropic_cache_breakpoints(payload)
+
+    assert "cache_control" not in result["tools"][0]
+    assert result["tools"][1]["cache_control"] == {"type": "ephemeral"}
+    assert result["system"] == [{"type": "text", "text": "系统提示词", "cache_control": {"type": "ephemeral"}}]
+    assert result["messages"][0]["content"] == "问题"
+    assert result["messages"][1]["content"][-1] == {"type": "tool_use", "id": "1", "cache_control": {"type": "ephemeral"}}
+
+
+def test_usage_handler_splits_cached_and_uncached_input_tokens():
+    stats = LLMUsageStats()
+    handler = LLMUsageCallbackHandler("claude", stats)
+    message = AIMessage(content="ok", usage_metadata={
+        "input_tokens": 1000,
+        "output_tokens": 20,
+        "total_tokens": 1020,
+        "input_token_details": {"cache_read": 800, "cache_creation": 150},
+    })
+
+    handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+
+    snapshot = stats.snapshot()["claude"]
+    assert snapshot["cache_read_tokens"] == 800
+    assert snapshot["cache_creation_tokens"] == 150
+    assert snapshot["uncached_input_tokens"] == 50
+    assert snapshot["cache_hit_ratio"] == 0.8
+
+
+class DummyToolModel:
+    def __init__(self):
+        self.bind_kwargs = None
+
+    def bind_tools(self, tools, **kwargs):
+        self.bind_kwargs = kwargs
+        return RunnableLambda(lambda messages: AIMessage(content=""))
+
+
+def test_tools_are_rendered_into_static_system_prompt(monkeypatch):
+    agent = AgentService(project_id=1)
+    agent.llm = DummyToolModel()
+    agent.tools = []
+    agent.system_prompt = "你是项目助手。\n{available_tools}"
+    agent.prompt_template = "{history}\n{input}"
+    runnable = agent._create_tool_calling_agent_inner()
+
+    prompt = runnable.steps[1]
+    assert prompt.partial_variables["available_tools"] == "当前没有可用工具。"
+    assert "available_tools" not in prompt.input_variables
+    # 没有工具时不发送 parallel_tool_calls
+    assert agent.llm.bind_kwargs == {}
+
+
+def test_parallel_tool_calls_is_bound_only_with_tools(monkeypatch):
+    monkeypatch.setattr(agent_service_module.settings, "LLM_PARALLEL_TOOL_CALLS", False)
+
+    @tool
+    def lookup(query: str) -> str:
+        """查询"""
+        return query
+
+    agent = AgentService(project_id=1)
+    agent.llm = DummyToolModel()
+    agent.tools = [lookup]
+    agent.system_prompt = "你是项目助手。\n{available_tools}"
+    agent.prompt_template = "{input}"
+    agent._create_tool_calling_agent_inner()
+
+    assert agent.llm.bind_kwargs == {"parallel_tool_calls": False}
+    model = llm_factory._build_provider_model("openai", "gpt-4o", "key", "https://api.openai.com/v1", 0, None, {})
+    assert "parallel_tool_calls" not in model.model_kwargs
+
+
+def test_openai_models_request_usage_on_streamed_responses():
+    model = llm_factory._build_provider_model("openai", "gpt-4o", "key", "https://api.openai.com/v1", 0, None, {})
+
+    assert model.stream_usage is True
+
+
+def test_model_profile_overrides_primary_endpoint(monkeypatch):
+    built = []
+    monkeypatch.setattr(llm_factory.settings, "LLM_PROFILES", '{"label": {"model": "small", "timeout": 20, "max_tokens": 64}}')
+    monkeypatch.setattr(llm_factory.settings, "LLM_MODEL_NAME", "large")
+    monkeypatch.setattr(llm_factory.settings, "LLM_FALLBACK_MODEL_NAME", "")
+    monkeypatch.setattr(
+        llm_factory, "_build_provider_model",
+        lambda provider, model, api_key, api_base, temperature, max_tokens, kwargs: built.append((model, max_tokens, kwargs)),
+    )
+
+    llm_factory.create_chat_model(temperature=0.5, profile="label")
+    llm_factory.create_chat_model(temperature=0.5, max_tokens=10, profile="label")
+    llm_factory.create_chat_model(temperature=0.5, profile="unknown")
+
+    assert built == [("small", 64, {"timeout": 20}), ("small", 10, {"timeout": 20}), ("large", None, {})]
+
+
+def test_fallback_model_keeps_profile_limits(monkeypatch):
+    built = []
+    monkeypatch.setattr(llm_factory.settings, "LLM_PROFILES", '{"label": {"timeout": 20, "max_tokens": 64, "max_retries": 1}}')
+    monkeypatch.setattr(llm_factory.settings, "LLM_MODEL_NAME", "large")
+    monkeypatch.setattr(llm_factory.settings, "LLM_FALLBACK_MODEL_NAME", "backup")
+    monkeypatch.setattr(
+        llm_factory, "_build_provider_model",
+        lambda provider, model, api_key, api_base, temperature, max_tokens, kwargs: built.append((model, max_tokens, kwargs)),
+    )
+    monkeypatch.setattr("app.core.llm_router.HedgedChatModel", lambda **kwargs: kwargs)
+
+    llm_factory.create_chat_model(temperature=0, profile="label")
+
+    limits = {"timeout": 20, "max_retries": 1}
+    assert built == [("large", 64, limits), ("backup", 64, limits)]
+
+
+def test_profile_overrides_fallback_endpoint_when_hedging(monkeypatch):
+    built = []
+    hedged = []
+    monkeypatch.setattr(
+        llm_factory.settings, "LLM_PROFILES",
+        '{"label": {"model": "small", "max_tokens": 64, "fallback_model": "small-backup"}, "agent": {"model": "large"}}',
+    )
+    monkeypatch.setattr(llm_factory.settings, "LLM_MODEL_NAME", "default")
+    monkeypatch.setattr(llm_factory.settings, "LLM_FALLBACK_MODEL_NAME", "backup")
+    monkeypatch.setattr(llm_factory.settings, "LLM_FALLBACK_API_BASE", "https://backup.example.com/v1")
+    monkeypatch.setattr(
+        llm_factory, "_build_provider_model",
+        lambda provider, model, api_key, api_base, temperature, max_tokens, kwargs: built.append((model, api_base, max_tokens)),
+    )
+    monkeypatch.setattr("app.core.llm_router.HedgedChatModel", lambda **kwargs: hedged.append(kwargs["secondary_name"]))
+
+    llm_factory.create_chat_model(temperature=0, profile="label")
+    llm_factory.create_chat_model(temperature=0, profile="agent")
+
+    assert built[1] == ("small-backup", "https://backup.example.com/v1", 64)
+    # 未覆盖备用端点的配置沿用 LLM_FALLBACK_*
+    assert built[3] == ("backup", "https://backup.example.com/v1", None)
+    assert hedged[0].endswith(":small-backup") and hedged[1].endswith(":backup")
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.services import mind_map_generation_service as generation_module
+from app.services.mind_map_generation_service import MindMapGenerationService
+
+
+class Document:
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.content = f"第{sequence}段"
+
+
+class Node:
+    def __init__(self, node_id, parent_id, sequence=0, level=0):
+        self.id = node_id
+        self.parent_id = parent_id
+        self.content = "书名"
+        self.sequence = sequence
+        self.level = level
+
+
+class MindMap:
+    id = 9
+    project_id = 1
+    file_id = 3
+
+
+class DummyDocumentRepo:
+    async def get_by_file_id(self, file_id):
+        return [Document(sequence) for sequence in range(4)]
+
+
+class DummyNodeRepo:
+    def __init__(self):
+        self.change_set = None
+
+    async def get_nodes_by_mind_map_id(self, mind_map_id):
+        return [Node(1, None)]
+
+    async def apply_change_set(self, mind_map_id, project_id, file_id, change_set):
+        self.change_set = change_set
+        return {node.ref: index for index, node in enumerate(
+            [node for wave in change_set.new_node_waves for node in wave], 100
+        )}
+
+
+class DummyLLM:
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def ainvoke(self, messages):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        prompt = messages[-1].content
+        if "groups" in prompt:
+            return AIMessage(content='```json\n{"groups": [{"title": "上篇", "items": [0, 1]}, {"title": "下篇", "items": [2, 3]}]}\n```')
+        sequence = prompt.rsplit("第", 1)[1].split("段")[0]
+        return AIMessage(content=json.dumps({"title": f"小节{sequence}", "points": [f"要点{sequence}"]}, ensure_ascii=False))
+
+
+@pytest.mark.asyncio
+async def test_generate_runs_map_in_parallel_then_reduces_and_writes_once(monkeypatch):
+    monkeypatch.setattr(generation_module.settings, "MIND_MAP_GEN_MAP_BATCH_TOKENS", 1)
+    monkeypatch.setattr(generation_module.settings, "MIND_MAP_GEN_CONCURRENCY", 2)
+    monkeypatch.setattr(generation_module.settings, "MIND_MAP_GEN_TOP_FANOUT", 2)
+    llm = DummyLLM()
+    node_repo = DummyNodeRepo()
+    events = []
+
+    async def progress(event):
+        events.append((event["phase"], event["completed"], event["total"]))
+
+    service = MindMapGenerationService(DummyDocumentRepo(), node_repo, llm=llm)
+    result = await service.generate(MindMap(), progress=progress)
+
+    assert llm.peak == 2
+    assert result["batch_count"] == 4
+    assert result["top_level_topics"] == ["上篇", "下篇"]
+    assert result["created_count"] == 10
+    waves = [[node.content for node in wave] for wave in node_repo.change_set.new_node_waves]
+    assert waves[0] == ["上篇", "下篇"]
+    assert waves[1] == ["小节0", "小节1", "小节2", "小节3"]
+    assert [event for event in events if event[0] == "map"][-1] == ("map", 4, 4)
+    assert events[-1] == ("write", 10, 10)
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app.models.mind_map_node import MindMapNodeOperation
+from app.services.mind_map_ops import MindMapOpsPlanner
+from app.services.note_agent_service import NoteAgentService
+
+
+class Node:
+    def __init__(self, node_id, parent_id, sequence, level):
+        self.id = node_id
+        self.parent_id = parent_id
+        self.content = f"节点{node_id}"
+        self.sequence = sequence
+        self.level = level
+
+
+class MindMap:
+    id = 9
+    project_id = 1
+    file_id = 3
+
+
+def _nodes():
+    return [Node(1, None, 0, 0), Node(2, 1, 0, 1), Node(3, 2, 0, 2)]
+
+
+def _ops(*items):
+    return [MindMapNodeOperation.model_validate(item) for item in items]
+
+
+def test_planner_batches_new_nodes_by_depth_and_tracks_changes():
+    change_set = MindMapOpsPlanner(_nodes()).apply(_ops(
+        {"op": "add", "ref": "a", "parent": 1, "content": "第一章"},
+        {"op": "add", "ref": "b", "parent": "a", "content": "第一节"},
+        {"op": "move", "node": 3, "parent": "a"},
+        {"op": "update", "node": 2, "content": "新标题"},
+    ))
+
+    assert [[node.ref for node in wave] for wave in change_set.new_node_waves] == [["a"], ["b"]]
+    assert change_set.new_node_waves[0][0].sequence == 1
+    assert change_set.updates[3] == {"parent_id": "a", "sequence": 1}
+    assert change_set.updates[2] == {"content": "新标题"}
+    assert change_set.moved_ids == [3]
+    assert change_set.updated_ids == [2]
+
+
+def test_planner_rejects_invalid_batch():
+    with pytest.raises(ValueError, match="第 2 个操作"):
+        MindMapOpsPlanner(_nodes()).apply(_ops(
+            {"op": "delete", "node": 2},
+            {"op": "update", "node": 3, "content": "已被删除"},
+        ))
+
+    with pytest.raises(ValueError):
+        MindMapOpsPlanner(_nodes()).apply(_ops({"op": "move", "node": 2, "parent": 3}))
+
+
+class DummyMindMapRepo:
+    async def get_by_id(self, mind_map_id):
+        return MindMap() if mind_map_id == 9 else None
+
+
+class DummyMindMapNodeRepo:
+    def __init__(self):
+        self.change_set = None
+
+    async def get_nodes_by_mind_map_id(self, mind_map_id):
+        return _nodes()
+
+    async def apply_change_set(self, mind_map_id, project_id, file_id, change_set):
+        self.change_set = change_set
+        return {"a": 100}
+
+
+@pytest.mark.asyncio
+async def test_apply_mind_map_ops_tool_applies_batch_once():
+    agent = NoteAgentService(project_id=1, context={"mind_map_id": 9})
+    agent.mind_map_repo = DummyMindMapRepo()
+    agent.mind_map_node_repo = DummyMindMapNodeRepo()
+
+    tools = await agent._load_tools()
+    tool = next(item for item in tools if item.name == "apply_mind_map_ops")
+
+    with agent.bind():
+        result = await tool.ainvoke(json.dumps({"operations": [
+            {"op": "add", "ref": "a", "parent": 1, "content": "第一章"},
+            {"op": "delete", "node": 3},
+        ]}))
+        invalid = json.loads(await tool.ainvoke(json.dumps({"operations": [{"op": "delete", "node": 1}]})))
+    payload = json.loads(result)
+
+    assert payload == {"success": True, "added": {"a": 100}, "updated": [], "moved": [], "deleted": [3]}
+    assert "根节点" in invalid["error"]
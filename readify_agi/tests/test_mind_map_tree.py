@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from app.repositories import mind_map_node_repository as node_repo_module
+from app.repositories.mind_map_node_repository import MindMapNodeRepository, MindMapTreeSnapshotCache
+
+
+class Node:
+    def __init__(self, node_id, parent_id, sequence, level):
+        self.id = node_id
+        self.project_id = 1
+        self.mind_map_id = 9
+        self.file_id = 3
+        self.parent_id = parent_id
+        self.content = f"节点{node_id}"
+        self.sequence = sequence
+        self.level = level
+        self.created_time = 0
+        self.updated_time = 0
+
+
+def _nodes():
+    return [
+        Node(1, None, 0, 0),
+        Node(3, 1, 1, 1),
+        Node(2, 1, 0, 1),
+        Node(4, 2, 0, 2),
+    ]
+
+
+def test_build_tree_links_children_in_sequence_order():
+    tree = MindMapNodeRepository._build_tree(_nodes())
+
+    assert tree.id == 1
+    assert [child.id for child in tree.children] == [2, 3]
+    assert [child.id for child in tree.children[0].children] == [4]
+    assert tree.model_dump()["children"][0]["children"][0]["content"] == "节点4"
+
+
+@pytest.mark.asyncio
+async def test_tree_snapshot_reused_until_version_or_fingerprint_changes(monkeypatch):
+    cache = MindMapTreeSnapshotCache(max_size=8)
+    monkeypatch.setattr(node_repo_module, "_tree_snapshot_cache", cache)
+
+    loads = []
+    fingerprint = {"value": (4, 0, 100)}
+    repo = MindMapNodeRepository()
+
+    async def fake_fingerprint(mind_map_id):
+        return fingerprint["value"]
+
+    async def fake_nodes(mind_map_id):
+        loads.append(mind_map_id)
+        return _nodes()
+
+    repo._get_tree_fingerprint = fake_fingerprint
+    repo.get_nodes_by_mind_map_id = fake_nodes
+
+    first = await repo.get_mind_map_tree(9)
+    second = await repo.get_mind_map_tree(9)
+    assert first is second
+    assert loads == [9]
+
+    cache.bump(9)
+    await repo.get_mind_map_tree(9)
+    assert loads == [9, 9]
+
+    fingerprint["value"] = (5, 0, 101)
+    await repo.get_mind_map_tree(9)
+    assert loads == [9, 9, 9]
+
+
+@pytest.mark.asyncio
+async def test_tree_snapshot_cached_when_updated_time_is_in_milliseconds(monkeypatch):
+    cache = MindMapTreeSnapshotCache(max_size=8)
+    monkeypatch.setattr(node_repo_module, "_tree_snapshot_cache", cache)
+
+    now = int(time.time())
+    loads = []
+    fingerprint = {"value": (4, 0, (now - 5) * 1000)}
+    repo = MindMapNodeRepository()
+
+    async def fake_fingerprint(mind_map_id):
+        return fingerprint["value"]
+
+    async def fake_nodes(mind_map_id):
+        loads.append(mind_map_id)
+        return _nodes()
+
+    repo._get_tree_fingerprint = fake_fingerprint
+    repo.get_nodes_by_mind_map_id = fake_nodes
+
+    await repo.get_mind_map_tree(9)
+    await repo.get_mind_map_tree(9)
+    assert loads == [9]
+
+    # Java 服务刚刚写入（毫秒时间戳落在当前秒内）时不缓存
+    fingerprint["value"] = (5, 0, int(time.time() * 1000) + 500)
+    await repo.get_mind_map_tree(9)
+    await repo.get_mind_map_tree(9)
+    assert loads == [9, 9, 9]
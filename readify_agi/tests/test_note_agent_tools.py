@@ -59,7 +59,8 @@ async def test_get_document_by_id_returns_document_times():
     tools = await agent._load_tools()
     tool = next(item for item in tools if item.name == "get_document_by_id")
 
-    result = await tool.ainvoke('{"document_id": 1}')
+    with agent.bind():
+        result = await tool.ainvoke('{"document_id": 1}')
     payload = json.loads(result)
 
     assert payload["id"] == 1
@@ -77,7 +78,8 @@ async def test_update_mind_map_node_updates_content():
     tools = await agent._load_tools()
     tool = next(item for item in tools if item.name == "update_mind_map_node")
 
-    result = await tool.ainvoke('{"node_id": 1, "content": "RNN（循环神经网络）"}')
+    with agent.bind():
+        result = await tool.ainvoke('{"node_id": 1, "content": "RNN（循环神经网络）"}')
     payload = json.loads(result)
 
     assert payload["success"] is True
@@ -94,7 +96,8 @@ async def test_delete_mind_map_node_returns_deleted_nodes():
     tools = await agent._load_tools()
     tool = next(item for item in tools if item.name == "delete_mind_map_node")
 
-    result = await tool.ainvoke('{"node_id": 1, "delete_descendants": true}')
+    with agent.bind():
+        result = await tool.ainvoke('{"node_id": 1, "delete_descendants": true}')
     payload = json.loads(result)
 
     assert payload["success"] is True
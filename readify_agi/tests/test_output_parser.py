@@ -0,0 +1,81 @@
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from app.utils import OutputParser as output_parser_module
+from app.utils.OutputParser import aparse_with_report, parse_with_report, repair_json
+
+
+class Issue(BaseModel):
+    type: str
+    description: str
+
+
+class IssueList(BaseModel):
+    issues: List[Issue]
+
+
+class DummyStructuredLLM:
+    def __init__(self):
+        self.calls = 0
+        self.prompts = []
+
+    def with_structured_output(self, schema):
+        llm = self
+
+        class _Bound:
+            def invoke(self, prompt):
+                llm.calls += 1
+                llm.prompts.append(prompt)
+                return schema(issues=[Issue(type="乱码", description="来自模型")])
+
+            async def ainvoke(self, prompt):
+                return self.invoke(prompt)
+
+        return _Bound()
+
+
+def test_repair_json_tolerates_common_llm_output_defects():
+    assert repair_json('说明文字\n```json\n{"a": [1, 2,],}\n```') == {"a": [1, 2]}
+    assert repair_json("<think>先想想</think>结果：{'a': True, 'b': None}") == {"a": True, "b": None}
+    assert repair_json('{"issues": [{"type": "乱码", "description": "被截') == {"issues": [{"type": "乱码", "description": "被截"}]}
+
+
+def test_structured_and_local_paths_skip_the_llm(monkeypatch):
+    monkeypatch.setattr(output_parser_module, "create_chat_model", lambda **kwargs: pytest.fail("不应调用 LLM"))
+
+    structured = parse_with_report("提取问题", {"issues": [{"type": "乱码", "description": "x"}]}, IssueList)
+    array = parse_with_report("提取问题", '[{"type": "错别字", "description": "y"}]', IssueList)
+
+    assert structured.path == "structured"
+    assert structured.value.issues[0].type == "乱码"
+    # 只有一个字段的模型可以直接接收数组
+    assert array.path == "local_repair"
+    assert array.value.issues[0].type == "错别字"
+
+
+@pytest.mark.asyncio
+async def test_llm_structured_output_is_the_fallback(monkeypatch):
+    llm = DummyStructuredLLM()
+    monkeypatch.setattr(output_parser_module, "create_chat_model", lambda **kwargs: llm)
+
+    report = await aparse_with_report("提取问题", "没有发现 JSON", IssueList)
+
+    assert report.path == "llm_structured"
+    assert report.value.issues[0].description == "来自模型"
+    assert llm.calls == 1
+    assert report.errors and report.errors[0].startswith("local_repair")
+
+
+@pytest.mark.asyncio
+async def test_sync_and_async_llm_paths_build_the_same_prompt(monkeypatch):
+    llm = DummyStructuredLLM()
+    monkeypatch.setattr(output_parser_module, "create_chat_model", lambda **kwargs: llm)
+
+    sync_report = parse_with_report("提取问题", {"issues": "不是列表"}, IssueList)
+    async_report = await aparse_with_report("提取问题", {"issues": "不是列表"}, IssueList)
+
+    assert sync_report.path == async_report.path == "llm_structured"
+    assert llm.prompts[0] == llm.prompts[1]
+    assert llm.prompts[0] == '提取问题\n提取文本：{"issues": "不是列表"}'
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.services import query_rewrite_service as rewrite_module
+from app.services.agent_service import AgentService
+from app.services.query_rewrite_service import QueryRewriteService, merge_search_results
+
+
+def test_needs_rewrite_skips_self_contained_queries():
+    assert QueryRewriteService.needs_rewrite("它的作者是谁") is True
+    assert QueryRewriteService.needs_rewrite("继续") is True
+    assert QueryRewriteService.needs_rewrite("what does it mean") is True
+    assert QueryRewriteService.needs_rewrite("红楼梦中贾宝玉的性格特点") is False
+
+
+@pytest.mark.asyncio
+async def test_rewrite_is_cached_by_history_and_query():
+    calls = []
+
+    class DummyResponse:
+        content = "红楼梦作者曹雪芹的生平"
+
+    class DummyLLM:
+        async def ainvoke(self, messages):
+            calls.append(messages)
+            return DummyResponse()
+
+    service = QueryRewriteService()
+    service._llm = DummyLLM()
+    service._loaded = True
+    service._user_prompt_template = "{history}\n{query}"
+
+    first = await service.rewrite("他的生平", "用户: 红楼梦的作者是谁")
+    second = await service.rewrite("他的生平", "用户: 红楼梦的作者是谁")
+    await service.rewrite("他的生平", "用户: 三国演义的作者是谁")
+
+    assert first == second == "红楼梦作者曹雪芹的生平"
+    assert len(calls) == 2
+
+
+def test_merge_search_results_dedupes_and_keeps_best_distance():
+    primary = [{"file_id": 1, "content": "a", "distance": 0.4}, {"file_id": 2, "content": "b", "distance": 0.3}]
+    secondary = [{"file_id": 1, "content": "a", "distance": 0.1}, {"file_id": 3, "content": "c", "distance": 0.5}]
+
+    merged = merge_search_results(primary, secondary, top_k=2)
+
+    assert [(item["file_id"], item["distance"]) for item in merged] == [(1, 0.1), (2, 0.3)]
+
+
+@pytest.mark.asyncio
+async def test_speculative_search_overlaps_original_search_with_rewrite(monkeypatch):
+    monkeypatch.setattr(rewrite_module.settings, "QUERY_REWRITE_ENABLED", True)
+    monkeypatch.setattr(rewrite_module.settings, "QUERY_REWRITE_SPECULATIVE", True)
+
+    order = []
+    rewrite_started = asyncio.Event()
+    search_started = asyncio.Event()
+
+    class DummyRewriteService(QueryRewriteService):
+        async def rewrite(self, query, conversation_history):
+            order.append("rewrite:start")
+            rewrite_started.set()
+            # 改写要等原始查询的检索开始后才返回，串行执行会超时
+            await search_started.wait()
+            order.append("rewrite:end")
+            return "红楼梦作者曹雪芹的生平"
+
+    agent = AgentService(project_id=1)
+    agent._current_history_text = "用户: 红楼梦的作者是谁"
+    agent._query_rewrite_service = DummyRewriteService()
+
+    async def fake_search(query, top_k):
+        order.append(f"search:{query}")
+        if query == "他的生平":
+            search_started.set()
+            await rewrite_started.wait()
+            order.append("search_end:他的生平")
+            return [{"file_id": 1, "content": "原始", "distance": 0.4}]
+        return [{"file_id": 2, "content": "改写", "distance": 0.2}]
+
+    agent._vector_search = fake_search
+
+    results = await asyncio.wait_for(agent._search_with_rewrite("他的生平", top_k=5), timeout=1)
+
+    # 原始查询的检索在改写进行中开始并完成，改写完成后才检索改写查询
+    assert order == [
+        "rewrite:start",
+        "search:他的生平",
+        "search_end:他的生平",
+        "rewrite:end",
+        "search:红楼梦作者曹雪芹的生平",
+    ]
+    assert [item["content"] for item in results] == ["改写", "原始"]
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import zlib
+
+import pytest
+
+from app.utils.sse_writer import SSEWriter
+
+
+def _decode_frames(payload: bytes):
+    return [
+        json.loads(line[len("data: "):])
+        for line in payload.decode("utf-8").split("\n\n")
+        if line
+    ]
+
+
+async def _collect(writer: SSEWriter) -> bytes:
+    chunks = []
+    async for frame in writer.frames():
+        chunks.append(frame)
+    return b"".join(chunks)
+
+
+@pytest.mark.asyncio
+async def test_consecutive_thoughts_are_coalesced_and_flushed_before_other_events():
+    writer = SSEWriter(flush_interval=10, max_coalesce_chars=1000)
+
+    for token in ["你", "好", "！"]:
+        await writer.send({"type": "thought", "content": token, "agent_name": "A", "project_id": 1})
+    await writer.send({"type": "tool_result", "content": "ok", "project_id": 1})
+    await writer.send({"type": "thought", "content": "再见", "agent_name": "A", "project_id": 1})
+    writer.close()
+
+    payload = await _collect(writer)
+
+    assert "你好！".encode("utf-8") in payload
+    frames = _decode_frames(payload)
+    assert [frame["type"] for frame in frames] == ["thought", "tool_result", "thought"]
+    assert frames[0]["content"] == "你好！"
+    assert frames[2]["content"] == "再见"
+
+
+@pytest.mark.asyncio
+async def test_pending_thought_is_flushed_after_interval():
+    writer = SSEWriter(flush_interval=0.01)
+    await writer.send({"type": "thought", "content": "a", "project_id": 1})
+
+    frames = writer.frames()
+    frame = await asyncio.wait_for(frames.__anext__(), timeout=1)
+
+    assert _decode_frames(frame) == [{"type": "thought", "content": "a", "project_id": 1}]
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_gzip_output_decodes_to_plain_frames():
+    writer = SSEWriter(compress=True)
+    await writer.send({"type": "system", "content": "压缩", "project_id": 1})
+    writer.close()
+
+    payload = await _collect(writer) + writer.finish()
+
+    assert _decode_frames(zlib.decompress(payload, wbits=31)) == [
+        {"type": "system", "content": "压缩", "project_id": 1}
+    ]
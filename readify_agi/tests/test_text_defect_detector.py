@@ -0,0 +1,48 @@
+from app.services.text_defect_detector import detect_text_defects, split_paragraphs_locally
+
+
+def _types(text):
+    return [defect.type for defect in detect_text_defects(text).defects]
+
+
+def test_clean_text_is_not_suspicious():
+    text = "深度学习是机器学习的一个分支，价格为$20，增长了5%。\nTransformer 使用自注意力机制（self-attention）。"
+
+    assert _types(text) == []
+
+
+def test_detects_defect_classes_from_repair_prompt():
+    assert _types("这一段出现了#￥%&无意义的符号。") == ["乱码"]
+    assert _types("水在100oC时沸腾。") == ["特殊符号错误"]
+    assert _types("中 文 被 拆 开了") == ["异常字符"]
+    assert _types("共有1O0名学生") == ["异常字符"]
+
+    two_columns = "\n".join(
+        f"左栏第{index}行内容          右栏第{index}行内容" for index in range(4)
+    )
+    assert _types(two_columns) == ["双栏结构"]
+
+
+def test_split_paragraphs_joins_hard_wrapped_lines():
+    text = (
+        "这是第一段的第一行内容，这一行被排版\n"
+        "硬换行拆开了，这是第二行。\n"
+        "第二段开头。\n"
+        "\n"
+        "The third para-\n"
+        "graph continues here."
+    )
+
+    paragraphs = split_paragraphs_locally(text, min_chars=0)
+
+    assert paragraphs == [
+        "这是第一段的第一行内容，这一行被排版硬换行拆开了，这是第二行。",
+        "第二段开头。",
+        "The third paragraph continues here.",
+    ]
+
+
+def test_short_paragraphs_are_merged():
+    paragraphs = split_paragraphs_locally("短段一。\n\n短段二。\n\n" + "长" * 30 + "。", min_chars=8)
+
+    assert paragraphs == ["短段一。\n短段二。", "长" * 30 + "。"]
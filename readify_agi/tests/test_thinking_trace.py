@@ -0,0 +1,31 @@
+from app.core import thinking_trace as trace_module
+from app.core.thinking_trace import ThinkingTrace, decompress_trace
+
+
+def test_short_trace_stays_inline_without_full_copy():
+    trace = ThinkingTrace(max_chars=100)
+    trace.extend(["思考", "过程"])
+    trace.add_tool_output("search", "结果")
+
+    assert trace.render() == "思考过程工具[search]输出: 结果\n"
+    assert trace.export_full() is None
+
+
+def test_long_tool_output_is_digested_and_full_trace_compressed(monkeypatch):
+    monkeypatch.setattr(trace_module.settings, "THINKING_TRACE_TOOL_DIGEST_CHARS", 10)
+    trace = ThinkingTrace(max_chars=80)
+    output = "文档内容" * 100
+
+    trace.append("开始")
+    trace.add_tool_output("read_file_content", output)
+    trace.append("结论" * 50)
+
+    inline = trace.render()
+    assert output not in inline
+    assert "sha1:" in inline
+    assert "已省略" in inline
+
+    full = trace.export_full()
+    assert full is trace.export_full()
+    assert len(full.data) < full.raw_size
+    assert decompress_trace(full.codec, full.data) == "开始工具[read_file_content]输出: " + output + "\n" + "结论" * 50
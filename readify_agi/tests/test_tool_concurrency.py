@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from langchain_core.tools import tool
+
+from app.core import tool_concurrency
+
+
+@pytest.mark.asyncio
+async def test_limited_tool_caps_concurrent_calls(monkeypatch):
+    monkeypatch.setattr(tool_concurrency, "_semaphores", {})
+    monkeypatch.setattr(tool_concurrency, "_limits", {"slow_lookup": 2})
+
+    running = 0
+    peak = 0
+
+    @tool
+    async def slow_lookup(input_str: str) -> str:
+        """测试工具"""
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return input_str
+
+    tools = tool_concurrency.limit_tool_concurrency([slow_lookup])
+    tool_concurrency.limit_tool_concurrency(tools)
+
+    results = await asyncio.gather(*(tools[0].ainvoke(str(index)) for index in range(5)))
+
+    assert results == ["0", "1", "2", "3", "4"]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_mind_map_write_tools_share_one_serial_lock(monkeypatch):
+    monkeypatch.setattr(tool_concurrency, "_semaphores", {})
+    monkeypatch.setattr(tool_concurrency, "_limits", {"update_mind_map_node": 8})
+
+    running = 0
+    peak = 0
+
+    async def _write(input_str: str) -> str:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return input_str
+
+    @tool
+    async def update_mind_map_node(input_str: str) -> str:
+        """测试工具"""
+        return await _write(input_str)
+
+    @tool
+    async def delete_mind_map_node(input_str: str) -> str:
+        """测试工具"""
+        return await _write(input_str)
+
+    tools = tool_concurrency.limit_tool_concurrency([update_mind_map_node, delete_mind_map_node])
+
+    await asyncio.gather(*(tools[index % 2].ainvoke(str(index)) for index in range(4)))
+
+    assert peak == 1
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import tool_output_encoder as encoder_module
+from app.utils.tool_output_encoder import (
+    dumps_compact,
+    paginate_rows,
+    render_outline_lines,
+    slice_text_by_tokens,
+    take_lines_by_tokens,
+)
+
+
+@pytest.fixture(autouse=True)
+def _char_tokens(monkeypatch):
+    monkeypatch.setattr(encoder_module, "count_tokens", lambda text: len(text or ""))
+
+
+def _node(node_id, content, children=()):
+    return SimpleNamespace(id=node_id, content=content, children=list(children))
+
+
+def test_outline_collapses_deep_and_wide_subtrees():
+    tree = _node(1, "根", [
+        _node(2, "第一章", [_node(4, "1.1", [_node(6, "1.1.1")]), _node(5, "1.2")]),
+        _node(3, "第二章"),
+    ])
+
+    lines = render_outline_lines(tree, max_depth=2, max_children=1)
+
+    assert lines == [
+        "- [1] 根",
+        "  - [2] 第一章",
+        "    - [4] 1.1 (+1个子孙节点)",
+        "    - …另有1个子节点",
+        "  - …另有1个子节点",
+    ]
+
+
+def test_outline_and_rows_continue_from_cursor():
+    text, cursor = take_lines_by_tokens(["aaaa", "bbbb", "cccc"], max_tokens=10)
+    assert text == "aaaa\nbbbb"
+    assert cursor == 2
+    assert take_lines_by_tokens(["aaaa", "bbbb", "cccc"], max_tokens=10, cursor=cursor) == ("cccc", None)
+
+    items = [{"id": index, "label": "x" * 5, "content": "ignored"} for index in range(4)]
+    table, next_cursor = paginate_rows(items, ("id", "label"), max_tokens=len(dumps_compact(["id", "label"])) + 22)
+    assert table == {"columns": ["id", "label"], "rows": [[0, "xxxxx"], [1, "xxxxx"]]}
+    assert next_cursor == 2
+
+
+def test_slice_text_by_tokens_returns_next_offset():
+    assert slice_text_by_tokens("abcdefgh", max_tokens=3) == ("abc", 3)
+    assert slice_text_by_tokens("abcdefgh", max_tokens=3, offset=6) == ("gh", None)
@@ -0,0 +1,61 @@
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from app.core.tracing import RequestTrace, get_current_trace, trace_span, use_trace
+from app.services.agent_service import AgentService
+
+
+class FakeExecutor:
+    async def astream_events(self, context, version):
+        yield {"event": "on_chat_model_start", "run_id": "llm-1", "name": "ChatOpenAI", "data": {}}
+        yield {"event": "on_chat_model_stream", "run_id": "llm-1", "data": {"chunk": AIMessageChunk(content="")}}
+        yield {"event": "on_chat_model_end", "run_id": "llm-1", "data": {"output": AIMessageChunk(
+            content="", usage_metadata={"input_tokens": 100, "output_tokens": 20, "total_tokens": 120}
+        )}}
+        yield {"event": "on_tool_start", "run_id": "tool-1", "name": "search_files_tool", "data": {}}
+        yield {"event": "on_tool_end", "run_id": "tool-1", "name": "search_files_tool", "data": {"output": "ok"}}
+
+
+@pytest.mark.asyncio
+async def test_stream_response_emits_debug_timing_with_llm_and_tool_spans():
+    agent = AgentService(project_id=1, agent_name="Agent", context={"debug_timing": True})
+    agent.agent_executor = FakeExecutor()
+    agent.request_trace = RequestTrace(request_id="req-1")
+
+    async def before_generation(query, callback):
+        return {"input": query}
+
+    agent._before_generation = before_generation
+    events = []
+
+    async def callback(data):
+        events.append(data)
+
+    await agent.generate_stream_response("问题", callback)
+
+    timing = events[-1]
+    assert timing["type"] == "debug_timing"
+    assert timing["request_id"] == "req-1"
+    spans = {span["name"]: span for span in timing["spans"]}
+    assert spans["before_generation"]["kind"] == "db"
+    assert spans["ChatOpenAI"]["kind"] == "llm"
+    assert spans["ChatOpenAI"]["input_tokens"] == 100
+    assert spans["ChatOpenAI"]["output_tokens"] == 20
+    assert "ttft_ms" in spans["ChatOpenAI"]
+    assert spans["search_files_tool"]["kind"] == "tool"
+    assert get_current_trace() is None
+
+
+def test_nested_spans_share_request_trace_and_record_errors():
+    trace = RequestTrace()
+    with use_trace(trace):
+        with trace_span("initialize", "prompt"):
+            pass
+        with pytest.raises(ValueError):
+            with trace_span("QUESTIONER", "delegation"):
+                raise ValueError("boom")
+    trace.finish()
+
+    assert [span.name for span in trace.spans] == ["initialize", "QUESTIONER"]
+    assert trace.spans[1].attributes["error"] == "ValueError"
+    assert set(trace.summary()["by_kind_ms"]) == {"prompt", "delegation"}
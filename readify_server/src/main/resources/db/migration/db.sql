@@ -44,6 +44,24 @@ create index idx_project_id
 create index idx_user_message_id
     on assistant_thinking (user_message_id);
 
+create table assistant_thinking_trace
+(
+    id          bigint auto_increment comment '主键ID'
+        primary key,
+    thinking_id bigint                             not null comment '对应的思考过程ID',
+    project_id  bigint                             not null comment '工程ID',
+    codec       varchar(16)                        not null comment '压缩编码：zstd/zlib',
+    raw_size    bigint                             not null comment '压缩前字节数',
+    content     longblob                           not null comment '压缩后的完整思考轨迹',
+    created_at  datetime default CURRENT_TIMESTAMP not null comment '创建时间',
+    constraint uk_thinking_id
+        unique (thinking_id)
+)
+    comment 'AI助手完整思考轨迹表（仅思考过程被截断时写入）';
+
+create index idx_project_id
+    on assistant_thinking_trace (project_id);
+
 create table conversation_history
 (
     id                     bigint unsigned auto_increment comment '主键ID'
@@ -54,6 +72,7 @@ create table conversation_history
     priority               tinyint unsigned default '1'               not null comment '优先级：数值越大优先级越高，裁剪时优先保留',
     is_included_in_context tinyint(1)       default 1                 not null comment '是否包含在上下文中：0-不包含，1-包含',
     sequence               int unsigned     default '0'               not null comment '对话序号，同一会话中的排序',
+    token_count            int unsigned     default '0'               not null comment '消息内容的token数，写入时计算',
     created_at             timestamp        default CURRENT_TIMESTAMP not null comment '创建时间',
     updated_at             timestamp        default CURRENT_TIMESTAMP not null on update CURRENT_TIMESTAMP comment '更新时间'
 )
@@ -71,6 +90,30 @@ create index idx_project_session
 create index idx_session_sequence
     on conversation_history (sequence);
 
+create table conversation_sequence
+(
+    project_id    bigint                 not null comment '工程ID'
+        primary key,
+    last_sequence int unsigned default '0' not null comment '已分配的最大对话序号',
+    context_count int unsigned default '0' not null comment '包含在上下文中的消息数（近似值，修剪时校准）'
+)
+    comment '对话序号计数表';
+
+create table conversation_summary
+(
+    id                bigint auto_increment comment '主键ID'
+        primary key,
+    project_id        bigint                             not null comment '工程ID',
+    content           longtext                           not null comment '滚动摘要内容',
+    covered_sequence  int unsigned default '0'           not null comment '摘要已覆盖到的对话序号（含）',
+    token_count       int unsigned default '0'           not null comment '摘要内容的token数',
+    created_at        datetime default CURRENT_TIMESTAMP not null comment '创建时间',
+    updated_at        datetime default CURRENT_TIMESTAMP not null on update CURRENT_TIMESTAMP comment '更新时间',
+    constraint uk_conversation_summary_project
+        unique (project_id)
+)
+    comment '对话滚动摘要表';
+
 create table document
 (
     id          bigint auto_increment comment '主键ID'
@@ -148,6 +191,9 @@ create table mind_map_node
 create index idx_file_id
     on mind_map_node (file_id);
 
+create index idx_mind_map_id
+    on mind_map_node (mind_map_id);
+
 create index idx_parent_id
     on mind_map_node (parent_id);
 
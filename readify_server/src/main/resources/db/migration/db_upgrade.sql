@@ -0,0 +1,57 @@
+-- 已有数据库的增量升级脚本
+-- db.sql 用于初始化新库，已包含下列全部变更；在 db.sql 新增表、列或索引之前创建的数据库按顺序执行本脚本。
+-- MySQL 不支持 ADD COLUMN / CREATE INDEX IF NOT EXISTS，每一段只需执行一次，重复执行会报列或索引已存在。
+
+-- 对话上下文按 token 预算裁剪，并维护滚动摘要
+-- 已有消息的 token_count 为 0：构建上下文时按内容实时计算，滚动摘要检查前由应用分批补算写回
+alter table conversation_history
+    add column token_count int unsigned default '0' not null comment '消息内容的token数，写入时计算' after sequence;
+
+create table if not exists conversation_summary
+(
+    id                bigint auto_increment comment '主键ID'
+        primary key,
+    project_id        bigint                             not null comment '工程ID',
+    content           longtext                           not null comment '滚动摘要内容',
+    covered_sequence  int unsigned default '0'           not null comment '摘要已覆盖到的对话序号（含）',
+    token_count       int unsigned default '0'           not null comment '摘要内容的token数',
+    created_at        datetime default CURRENT_TIMESTAMP not null comment '创建时间',
+    updated_at        datetime default CURRENT_TIMESTAMP not null on update CURRENT_TIMESTAMP comment '更新时间',
+    constraint uk_conversation_summary_project
+        unique (project_id)
+)
+    comment '对话滚动摘要表';
+
+-- 对话序号由计数表原子分配；计数行在工程首次写入时按 conversation_history 中的最大序号创建
+create table if not exists conversation_sequence
+(
+    project_id    bigint                 not null comment '工程ID'
+        primary key,
+    last_sequence int unsigned default '0' not null comment '已分配的最大对话序号'
+)
+    comment '对话序号计数表';
+
+-- 写入时按计数增量裁剪上下文；已有工程的计数行在首次写入时按现有数据创建
+alter table conversation_sequence
+    add column context_count int unsigned default '0' not null comment '包含在上下文中的消息数（近似值，修剪时校准）';
+
+-- 按导图读取节点；子树删除使用递归 CTE（WITH RECURSIVE），需要 MySQL 8.0 及以上版本
+create index idx_mind_map_id
+    on mind_map_node (mind_map_id);
+
+-- 思考过程被截断时单独保存压缩的完整轨迹
+create table if not exists assistant_thinking_trace
+(
+    id          bigint auto_increment comment '主键ID'
+        primary key,
+    thinking_id bigint                             not null comment '对应的思考过程ID',
+    project_id  bigint                             not null comment '工程ID',
+    codec       varchar(16)                        not null comment '压缩编码：zstd/zlib',
+    raw_size    bigint                             not null comment '压缩前字节数',
+    content     longblob                           not null comment '压缩后的完整思考轨迹',
+    created_at  datetime default CURRENT_TIMESTAMP not null comment '创建时间',
+    constraint uk_thinking_id
+        unique (thinking_id),
+    index idx_project_id (project_id)
+)
+    comment 'AI助手完整思考轨迹表（仅思考过程被截断时写入）';